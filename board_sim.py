@@ -0,0 +1,73 @@
+"""Championship board simulator.
+
+Runs a whole bracket through the darts_party scheduler with random match
+lengths and reports how long the event takes on one board vs. several.
+
+    python board_sim.py [players] [boards] [match_minutes] [single|double|round_robin|swiss]
+"""
+import heapq, random, sys
+
+import darts_party as party
+
+def depth(t):
+    # longest chain of matches that have to be played one after another
+    d = [1] * len(t.matches)
+    for i, m in enumerate(t.matches):
+        for nxt in (m.next, m.loser_next):
+            if nxt is not None:
+                d[nxt] = max(d[nxt], d[i] + 1)
+    return max(d)
+
+def run(players, boards, match_minutes, bracket="single", seed=0):
+    rng = random.Random(seed)
+    party.RNG.seed(seed)  # same shuffled bracket for every board count
+    party.reset_state()
+    party.STATE.mode = "championship"
+    party.STATE.settings.boards = boards
+    party.STATE.settings.bracket = bracket
+    party.STATE.tournament = party.Tournament(party.STATE.names.intern_all([f"P{i+1}" for i in range(players)]))
+    party.init_game("match")
+    t = party.STATE.tournament
+
+    # per-match length and result, identical across runs with the same seed
+    length = []
+    p1_wins = []
+
+    clock = 0.0
+    busy = 0.0
+    events = []     # (finish time, board, match)
+    playing = set()
+    while t.champion is None:
+        for b, board in enumerate(t.boards):
+            if board is not None and board.match not in playing:
+                while board.match >= len(length):  # swiss rounds and final resets appear as we go
+                    length.append(max(match_minutes * 0.4, rng.gauss(match_minutes, match_minutes * 0.25)))
+                    p1_wins.append(rng.random() < 0.5)
+                playing.add(board.match)
+                heapq.heappush(events, (clock + length[board.match], b, board.match))
+        if not events:
+            break
+        clock, b, i = heapq.heappop(events)
+        busy += length[i]
+        m = t.matches[i]
+        party.finish_match(i, m.p1 if p1_wins[i] else m.p2)
+        party.release_board(b)
+    chain = len(t.stages) if t.format in party.LEAGUES else depth(t)
+    return clock, busy, chain
+
+def main(argv):
+    players = int(argv[1]) if len(argv) > 1 else 8
+    boards = int(argv[2]) if len(argv) > 2 else 4
+    match_minutes = float(argv[3]) if len(argv) > 3 else 15.0
+    bracket = argv[4] if len(argv) > 4 else "single"
+
+    serial, _, chain = run(players, 1, match_minutes, bracket)
+    print(f"{players} players, {bracket}, ~{match_minutes:g} min per match")
+    print(f"{'boards':>6} {'minutes':>9} {'speedup':>8} {'board use':>10}")
+    for n in sorted({1, boards}):
+        total, busy, _ = run(players, n, match_minutes, bracket)
+        print(f"{n:>6} {total:>9.1f} {serial / total:>7.2f}x {busy / (total * n):>9.0%}")
+    print(f"bracket depth x match length: {chain} x {match_minutes:g} = {chain * match_minutes:.1f} min")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,216 @@
+"""Electronic board simulator for the darts_party /darts feed.
+
+Every board keeps a chunked NDJSON stream open for each game and throws
+random darts into it, as fast as the server takes them or at a fixed rate.
+In "match" mode the boards share one round-robin championship; in "501" or
+"cricket" mode each board is its own room running a two-player game. Boards
+keep their own score, so they stop throwing once their game is won (the
+server would drop those darts) and a referee thread presses "Next Match"
+(or restarts the game) as soon as they report it. Reports the sustained
+dart events per second the server applied to live games.
+
+    python dart_feed.py [boards] [seconds] [match|501|cricket] [darts_per_chunk] [rate_per_board]
+
+rate_per_board 0 (the default) throws flat out. Set PORT to feed a server
+that is already running (e.g. a PARTY_WORKERS router) instead of starting
+one in-process.
+"""
+import http.client, json, logging, os, queue, random, sys, threading, time
+
+from werkzeug.serving import make_server
+
+import darts_party as party
+
+SEGMENTS = [20] * 10 + [1, 5] * 3 + list(range(2, 20)) + [25]
+
+def call(port, method, path, body=None):
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    c.request(method, path, body=json.dumps(body) if body is not None else None,
+              headers={"Content-Type": "application/json"} if body is not None else {})
+    r = c.getresponse()
+    out = json.loads(r.read() or b"null")
+    c.close()
+    return out
+
+def throw(rng):
+    # someone aiming at treble 20 with a pub player's accuracy
+    if rng.random() < 0.05:
+        return 0, 0
+    seg = rng.choice(SEGMENTS)
+    r = rng.random()
+    mult = 1 if r < 0.7 else 3 if r < 0.9 else 2
+    return seg, min(mult, 2) if seg == 25 else mult
+
+class Scoreboard:
+    # the board's own count of its two-player game, kept the way darts_party
+    # scores darts (straight-out x01 or cricket), so the board knows when its
+    # game is over and stops throwing until the referee has started the next
+    def __init__(self, mode, start):
+        self.mode = mode
+        self.start = start
+        self.reset()
+
+    def reset(self):
+        self.turn = 0
+        self.darts = []
+        self.scores = [self.start, self.start]
+        self.marks = [[0] * len(party.CRICKET_NUMS) for _ in range(2)]
+        self.points = [0, 0]
+
+    def throw(self, dart):
+        # True once this dart has won the game
+        entry = party.DART_TABLE[dart]
+        self.darts.append(entry)
+        if self.mode == "cricket":
+            won = self.cricket(entry)
+            over = won or len(self.darts) == 3
+        else:
+            remaining = self.scores[self.turn]
+            over = len(self.darts) == 3 or remaining - sum(d[0] for d in self.darts) <= 1
+            won = False
+            if over:
+                left = remaining - party.x01_turn(self.darts, remaining)[0]
+                if left == 0:
+                    won = True
+                elif left > 1:
+                    self.scores[self.turn] = left
+        if over and not won:
+            self.turn ^= 1
+            self.darts = []
+        return won
+
+    def cricket(self, entry):
+        _, _, idx, hits = entry
+        if idx is None:
+            return False
+        mine, other = self.marks[self.turn], self.marks[self.turn ^ 1]
+        for _ in range(hits):
+            if mine[idx] < 3:
+                mine[idx] += 1
+            elif other[idx] < 3:
+                self.points[self.turn] += party.CRICKET_VALUES[idx]
+        return min(mine) >= 3 and self.points[self.turn] >= self.points[self.turn ^ 1]
+
+def board_stream(port, path, board, per_chunk, rate, deadline, seed, score, over, live, results):
+    # one stream per game: the board ends it after the winning turn, so by the
+    # time the reply is back the server has applied the whole game and the
+    # referee can start the next one straight away
+    rng = random.Random(seed)
+    pace = {"t0": time.perf_counter(), "sent": 0}
+
+    def chunks():
+        while time.perf_counter() < deadline:
+            lines = []
+            won = False
+            while len(lines) < per_chunk and not won:
+                seg, mult = throw(rng)
+                lines.append('{"board":%d,"segment":%d,"multiplier":%d}\n' % (board, seg, mult))
+                won = score.throw((seg, mult))
+            pace["sent"] += len(lines)
+            if won and len(score.darts) < 3:
+                lines.append('{"board":%d,"end":true}\n' % board)     # the winning turn is complete
+            yield "".join(lines).encode()
+            if won:
+                return
+            if rate:
+                wait = pace["t0"] + pace["sent"] / rate - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+
+    while time.perf_counter() < deadline:
+        c = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        c.request("POST", path, body=chunks(), headers={"Content-Type": "application/x-ndjson"},
+                  encode_chunked=True)
+        results.append(json.loads(c.getresponse().read()))
+        c.close()
+        if time.perf_counter() >= deadline:
+            break
+        # game over: the time waiting for the next one doesn't count against the rate
+        paused = time.perf_counter()
+        live.clear()
+        over.put(board)
+        live.wait(max(0.0, deadline - paused))
+        score.reset()
+        pace["t0"] += time.perf_counter() - paused
+    results.append({"sent": pace["sent"]})
+
+def referee(port, mode, paths, over, lives, stop, finished):
+    # starts the next game on a board as soon as its stream reports the last one won
+    while not stop.is_set():
+        try:
+            i = over.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if mode == "match":
+            call(port, "POST", "/action", {"type": "next_match", "board": i})
+        else:
+            call(port, "POST", paths[i][:-len("/darts")] + "/action", {"type": "start_game", "game": mode})
+        finished[0] += 1
+        lives[i].set()
+
+def setup(port, mode, boards):
+    if mode == "match":
+        call(port, "POST", "/action", {"type": "reset"})
+        call(port, "POST", "/action", {"type": "set_mode", "mode": "championship"})
+        call(port, "POST", "/action", {"type": "set_tournament_players",
+                                       "players": [f"P{i + 1}" for i in range(max(4, boards * 16))]})
+        call(port, "POST", "/action", {"type": "set_bracket", "bracket": "round_robin"})
+        call(port, "POST", "/action", {"type": "set_boards", "boards": boards})
+        call(port, "POST", "/action", {"type": "set_match_start", "start": 101})
+        call(port, "POST", "/action", {"type": "start_game", "game": "match"})
+        return ["/darts"] * boards, list(range(boards))
+    for i in range(boards):
+        call(port, "POST", f"/r/board{i}/action", {"type": "set_players", "players": ["Home", "Away"]})
+        call(port, "POST", f"/r/board{i}/action", {"type": "set_501_settings", "start": 301})
+        call(port, "POST", f"/r/board{i}/action", {"type": "start_game", "game": mode})
+    return [f"/r/board{i}/darts" for i in range(boards)], [0] * boards
+
+def main(argv):
+    boards = int(argv[1]) if len(argv) > 1 else 4
+    seconds = float(argv[2]) if len(argv) > 2 else 5.0
+    mode = argv[3] if len(argv) > 3 else "match"
+    per_chunk = int(argv[4]) if len(argv) > 4 else 1
+    rate = float(argv[5]) if len(argv) > 5 else 0.0
+
+    server = None
+    port = int(os.environ.get("PORT", "0"))
+    if not port:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, party.app, threaded=True)
+        port = server.server_port
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    paths, board_ids = setup(port, mode, boards)
+    start = 101 if mode == "match" else 301
+    stop = threading.Event()
+    over = queue.Queue()
+    lives = [threading.Event() for _ in range(boards)]
+    finished = [0]
+    ref = threading.Thread(target=referee, args=(port, mode, paths, over, lives, stop, finished), daemon=True)
+    ref.start()
+    results = []
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=board_stream,
+                                args=(port, paths[i], board_ids[i], per_chunk, rate, t0 + seconds, i,
+                                      Scoreboard(mode, start), over, lives[i], results))
+               for i in range(boards)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    ref.join()
+    if server is not None:
+        server.shutdown()
+
+    total = lambda k: sum(r.get(k, 0) for r in results)
+    print(f"{mode}, {boards} boards x {seconds:g}s, {per_chunk} dart(s) per chunk"
+          + (f", {rate:g} darts/s per board" if rate else ""))
+    print(f"  sent {total('sent')}  accepted {total('darts')}  rejected {total('rejected')}  "
+          f"turns {total('turns')}  dropped {total('dropped')}  games finished {finished[0]}")
+    print(f"  {(total('darts') - total('dropped')) / elapsed:,.0f} dart events/s applied, "
+          f"{total('darts') / elapsed:,.0f} received")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,8 +1,11 @@
 import os
 APP_DB = os.environ.get("DB_PATH", "darts.db")
 
-from flask import Flask, request, redirect, url_for, render_template_string, jsonify
-import sqlite3, os, time, datetime
+from flask import Flask, request, redirect, url_for, render_template_string, jsonify, send_from_directory, g
+from contextlib import contextmanager
+from collections import OrderedDict, Counter
+import sqlite3, os, sys, time, datetime, calendar, csv, json, threading, functools, hashlib, hmac
+import cProfile, pstats, marshal, random, urllib.request
 
 app = Flask(__name__)
 
@@ -66,8 +69,86 @@ def init_db():
         FOREIGN KEY (game_id) REFERENCES games(id),
         FOREIGN KEY (player_id) REFERENCES players(id)
     )""")
+    # player pages and /history (hub_plans.py checks every query has an index to use)
+    cur.execute("CREATE INDEX IF NOT EXISTS game_players_player ON game_players(player_id, game_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS games_started ON games(started_at)")
+
+    # the active game, shared by every worker process (see ensure_active)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS active_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        state TEXT NOT NULL,          -- JSON of STATE
+        updated_at TEXT NOT NULL
+    )""")
+    cur.execute("INSERT OR IGNORE INTO active_state(id, version, state, updated_at) VALUES(1, 0, ?, ?)",
+                (json.dumps(blank_state()), now_iso()))
+
+    # counters shared by all workers; data_version moves whenever saved data changes (see cached_page)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS hub_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""")
+    cur.execute("INSERT OR IGNORE INTO hub_meta(key, value) VALUES('data_version', 0)")
+    # first season still in games/game_players; the ones before it are in archive files (see archive_seasons)
+    cur.execute("INSERT OR IGNORE INTO hub_meta(key, value) VALUES('archived_before', 0)")
+
+    # per-day and per-month totals of finished games, kept up to date by save_results (see rollup_games)
+    for kind in ("player", "team"):
+        for table, col, width in ROLLUP_LEVELS:
+            cur.execute(ROLLUP_TABLE.format(temp="", name=f"{kind}_{table}", col=col, kind=kind))
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {kind}_daily_{kind} ON {kind}_daily({kind}_id, day)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,      -- higher runs first
+        status TEXT NOT NULL,                     -- queued | running | done | failed | cancelled
+        params TEXT NOT NULL,                     -- JSON
+        progress REAL NOT NULL DEFAULT 0,         -- 0..1
+        message TEXT,
+        result TEXT,                              -- JSON
+        error TEXT,
+        cancel INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        heartbeat REAL,                           -- unix time of the last progress report
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, priority, id)")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archives (
+        season INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,                       -- in ARCHIVE_DIR
+        games INTEGER NOT NULL,
+        game_players INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    # each archived season's lifetime-stats share, so player pages never open an archive to count
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archive_players (
+        player_id INTEGER NOT NULL,
+        season INTEGER NOT NULL,
+        games INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        last_played TEXT,
+        PRIMARY KEY (player_id, season)
+    ) WITHOUT ROWID""")
+
+    # databases from before the rollups: build them from the games already saved, off the request path
+    if (cur.execute("INSERT OR IGNORE INTO hub_meta(key, value) VALUES('rollups', 1)").rowcount
+            and cur.execute("SELECT 1 FROM games LIMIT 1").fetchone()):
+        cur.execute("INSERT INTO jobs(kind, priority, status, params, created_at) VALUES('rebuild_rollups', 10, 'queued', '{}', ?)",
+                    (now_iso(),))
 
     conn.commit()
+    # readers never wait for the writer (or each other)
+    conn.execute("PRAGMA journal_mode=WAL").fetchone()
     conn.close()
 
 def now_iso():
@@ -87,156 +168,976 @@ def q_one(sql, args=()):
 
 def exec_sql(sql, args=()):
     conn = db()
-    cur = conn.cursor()
-    cur.execute(sql, args)
-    conn.commit()
-    last = cur.lastrowid
-    conn.close()
-    return last
-
-# -------------------------
-# In-memory "current game" state
-# (Persisted when you hit Finish)
-# -------------------------
-STATE = {
-    "active_game_id": None,     # games.id
-    "game_type": None,          # "501"
-    "mode": None,               # "ffa" | "teams"
-    "players": [],              # list of player dicts {id,name}
-    "teamA": None,              # {id,name,members:[{id,name}]}
-    "teamB": None,
-    "current_turn_idx": 0,      # for ffa: index into players
-    "team_turn": "A",           # for teams: A/B
-    "team_member_idx": 0,       # rotates within roster
-    "scores": {},               # key: player_id or team side
-    "start_points": 501,
-    "winner": None              # player_id or "A"/"B"
-}
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, args)
+        conn.commit()
+        return cur.lastrowid
+    finally:
+        # a failed write would otherwise keep its transaction, and the write lock, open
+        conn.close()
 
-def reset_active():
-    STATE.update({
-        "active_game_id": None,
-        "game_type": None,
-        "mode": None,
-        "players": [],
-        "teamA": None,
+# -------------------------
+# Request profiling
+# HUB_PROFILE=0.05 (or POST /admin/profile {"rate": 0.05}) profiles one
+# request in twenty, aggregated per endpoint. "sample" mode (the default)
+# has a background thread look at the sampled requests' stacks every
+# PROFILE_INTERVAL seconds, for flamegraph text; "cprofile" mode runs
+# cProfile on one request at a time, for pstats files. With the rate at 0
+# the cost per request is one dict lookup. These hooks are registered
+# first so the profile covers the other before_request work too.
+# -------------------------
+PROFILE = {"rate": float(os.environ.get("HUB_PROFILE", "0")),
+           "mode": os.environ.get("HUB_PROFILE_MODE", "sample"),     # "sample" | "cprofile"
+           "interval": float(os.environ.get("PROFILE_INTERVAL", "0.005"))}
+PROFILE_MAX_STACKS = 5000       # distinct stacks kept per endpoint
+PROFILES = {}                   # endpoint -> {"requests", "seconds", "samples", "stacks", "stats"}
+PROFILES_LOCK = threading.Lock()
+CPROFILE_LOCK = threading.Lock()        # one cProfile at a time (3.12+ profilers are process-wide)
+SAMPLING = {}                   # thread id -> endpoint, for requests the sampler should watch
+SAMPLER_WAKE = threading.Event()
+SAMPLER = {"thread": None}
+
+def route_profile(endpoint):
+    prof = PROFILES.get(endpoint)
+    if prof is None:
+        prof = PROFILES[endpoint] = {"requests": 0, "seconds": 0.0, "samples": 0, "stacks": Counter(), "stats": None}
+    return prof
+
+def collapse(frame, root_code):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        if code is root_code:
+            break
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def sampler():
+    root = Flask.wsgi_app.__code__
+    while True:
+        SAMPLER_WAKE.wait()
+        SAMPLER_WAKE.clear()
+        # a request holds the GIL for up to the switch interval before the
+        # sampler gets a look, which would pile samples onto wherever it
+        # next blocks (usually SQLite); shorten it while sampling, and only then
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch, PROFILE["interval"] / 5))
+        try:
+            while SAMPLING:
+                # jittered, so samples don't line up with the start of each request
+                time.sleep(PROFILE["interval"] * random.uniform(0.5, 1.5))
+                frames = sys._current_frames()
+                with PROFILES_LOCK:
+                    for tid, endpoint in list(SAMPLING.items()):
+                        frame = frames.get(tid)
+                        if frame is None:
+                            continue
+                        prof = route_profile(endpoint)
+                        stack = collapse(frame, root)
+                        if stack in prof["stacks"] or len(prof["stacks"]) < PROFILE_MAX_STACKS:
+                            prof["stacks"][stack] += 1
+                        else:
+                            prof["stacks"]["[other stacks]"] += 1
+                        prof["samples"] += 1
+                del frames
+        finally:
+            sys.setswitchinterval(switch)
+
+@app.before_request
+def profile_start():
+    rate = PROFILE["rate"]
+    if not rate or random.random() >= rate or request.endpoint is None or request.endpoint.startswith("profile_"):
+        return
+    if PROFILE["mode"] == "cprofile":
+        if not CPROFILE_LOCK.acquire(blocking=False):
+            return
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        if SAMPLER["thread"] is None:
+            with PROFILES_LOCK:
+                if SAMPLER["thread"] is None:
+                    SAMPLER["thread"] = threading.Thread(target=sampler, name="profile-sampler", daemon=True)
+                    SAMPLER["thread"].start()
+        SAMPLING[threading.get_ident()] = request.endpoint
+        SAMPLER_WAKE.set()
+    g.profile_started = time.perf_counter()
+
+@app.teardown_request
+def profile_stop(exc):
+    started = g.pop("profile_started", None)
+    if started is None:
+        return
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        CPROFILE_LOCK.release()
+    else:
+        SAMPLING.pop(threading.get_ident(), None)
+    elapsed = time.perf_counter() - started
+    with PROFILES_LOCK:
+        prof = route_profile(request.endpoint)
+        prof["requests"] += 1
+        prof["seconds"] += elapsed
+        if profiler is not None:
+            if prof["stats"] is None:
+                prof["stats"] = pstats.Stats(profiler)
+            else:
+                prof["stats"].add(profiler)
+
+# -------------------------
+# "Current game" state
+# (Results are saved to games/game_players when you hit Finish)
+# The live game is one JSON row in active_state, so every worker process
+# (gunicorn -w N) plays the same game and it survives restarts. STATE is
+# this process's copy: ensure_active re-reads it before each request, but
+# only when the row's version moved. Changes go through active_write, which
+# holds the database write lock from read to commit and works on a copy of
+# its own; STATE is only ever replaced whole, never changed in place.
+# -------------------------
+def blank_state():
+    return {
+        "active_game_id": None,     # games.id
+        "game_type": None,          # "501"
+        "mode": None,               # "ffa" | "teams"
+        "players": [],              # list of player dicts {id,name}
+        "teamA": None,              # {id,name,members:[{id,name}]}
         "teamB": None,
-        "current_turn_idx": 0,
-        "team_turn": "A",
-        "team_member_idx": 0,
-        "scores": {},
+        "current_turn_idx": 0,      # for ffa: index into players
+        "team_turn": "A",           # for teams: A/B
+        "team_member_idx": 0,       # rotates within roster
+        "scores": {},               # key: player_id or team side
         "start_points": 501,
-        "winner": None
-    })
+        "winner": None              # player_id or "A"/"B"
+    }
+
+STATE = blank_state()
+ACTIVE = {"version": -1, "ready": False, "data": 0,     # version STATE was loaded at; schema checked; data version
+          "since": ""}                                   # started_at of the first game not archived
+ACTIVE_LOCK = threading.Lock()              # one writer per process at a time
+LOCAL = threading.local()                   # per-thread reader connection
+
+def reset_active(st):
+    st.update(blank_state())
+
+def decode_state(text):
+    st = json.loads(text)
+    # JSON object keys are strings; ffa scores are keyed by player id
+    st["scores"] = {int(k) if k.isdigit() else k: v for k, v in st["scores"].items()}
+    return st
+
+def reader():
+    conn = getattr(LOCAL, "conn", None)
+    if conn is None:
+        conn = LOCAL.conn = sqlite3.connect(APP_DB, isolation_level=None)
+    return conn
 
+@app.before_request
 def ensure_active():
-    # If server restarts, active in-memory game is gone.
-    # MVP: that’s ok for party use.
-    pass
+    global STATE
+    if not ACTIVE["ready"]:
+        init_db()       # workers started by gunicorn never run __main__
+        start_job_workers()
+        ACTIVE["ready"] = True
+    # under ACTIVE_LOCK, so a write committing in another thread can't be
+    # replaced by the older row this one read
+    with ACTIVE_LOCK:
+        row = reader().execute("""
+            SELECT version, CASE WHEN version != ? THEN state END,
+                   (SELECT value FROM hub_meta WHERE key='data_version'),
+                   (SELECT value FROM hub_meta WHERE key='archived_before')
+            FROM active_state WHERE id=1
+        """, (ACTIVE["version"],)).fetchone()
+        if row[1] is not None:
+            STATE = decode_state(row[1])
+            ACTIVE["version"] = row[0]
+        ACTIVE["data"] = row[2]
+        ACTIVE["since"] = season_start(row[3])
+
+@contextmanager
+def active_write():
+    # read-modify-write of the shared game; other workers' writes wait at BEGIN IMMEDIATE.
+    # Yields (conn, st): st is this write's own copy, which becomes STATE once it has committed
+    global STATE
+    with ACTIVE_LOCK:
+        conn = sqlite3.connect(APP_DB, isolation_level=None, timeout=10)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            version, text = conn.execute("SELECT version, state FROM active_state WHERE id=1").fetchone()
+            st = decode_state(text)
+            yield conn, st
+            conn.execute("UPDATE active_state SET version=?, state=?, updated_at=? WHERE id=1",
+                         (version + 1, json.dumps(st), now_iso()))
+            conn.execute("COMMIT")
+            STATE = st
+            ACTIVE["version"] = version + 1
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
 
 def current_turn_label():
-    if not STATE["active_game_id"]:
+    st = STATE     # one copy throughout: another thread may swap STATE meanwhile
+    if not st["active_game_id"]:
         return "No active game"
-    if STATE["mode"] == "ffa":
-        if not STATE["players"]:
+    if st["mode"] == "ffa":
+        if not st["players"]:
             return "—"
-        p = STATE["players"][STATE["current_turn_idx"] % len(STATE["players"])]
+        p = st["players"][st["current_turn_idx"] % len(st["players"])]
         return f"Turn: {p['name']}"
-    if STATE["mode"] == "teams":
-        side = STATE["team_turn"]
-        team = STATE["teamA"] if side == "A" else STATE["teamB"]
+    if st["mode"] == "teams":
+        side = st["team_turn"]
+        team = st["teamA"] if side == "A" else st["teamB"]
         members = team["members"]
-        idx = STATE["team_member_idx"] % max(1, len(members))
+        idx = st["team_member_idx"] % max(1, len(members))
         who = members[idx]["name"] if members else "(no members)"
         return f"Turn: {team['name']} ({who})"
     return "—"
 
-def advance_turn():
-    if STATE["mode"] == "ffa":
-        STATE["current_turn_idx"] = (STATE["current_turn_idx"] + 1) % max(1, len(STATE["players"]))
+def advance_turn(st):
+    if st["mode"] == "ffa":
+        st["current_turn_idx"] = (st["current_turn_idx"] + 1) % max(1, len(st["players"]))
         return
-    if STATE["mode"] == "teams":
-        if STATE["team_turn"] == "A":
-            STATE["team_turn"] = "B"
+    if st["mode"] == "teams":
+        if st["team_turn"] == "A":
+            st["team_turn"] = "B"
         else:
-            STATE["team_turn"] = "A"
-            STATE["team_member_idx"] += 1
+            st["team_turn"] = "A"
+            st["team_member_idx"] += 1
 
-def apply_501_turn(turn_points: int):
-    if not STATE["active_game_id"] or STATE["winner"]:
+def apply_501_turn(st, turn_points: int):
+    if not st["active_game_id"] or st["winner"]:
         return
     turn_points = max(0, min(180, int(turn_points)))
 
     # Bust rule MVP: if below 0 or exactly 1 => bust (no change)
-    if STATE["mode"] == "ffa":
-        p = STATE["players"][STATE["current_turn_idx"] % len(STATE["players"])]
+    if st["mode"] == "ffa":
+        p = st["players"][st["current_turn_idx"] % len(st["players"])]
         pid = p["id"]
-        start_score = STATE["scores"][pid]
+        start_score = st["scores"][pid]
         new_score = start_score - turn_points
         bust = (new_score < 0 or new_score == 1)
         if not bust:
-            STATE["scores"][pid] = new_score
+            st["scores"][pid] = new_score
             if new_score == 0:
-                STATE["winner"] = pid
-        advance_turn()
+                st["winner"] = pid
+        advance_turn(st)
         return
 
-    if STATE["mode"] == "teams":
-        side = STATE["team_turn"]
-        start_score = STATE["scores"][side]
+    if st["mode"] == "teams":
+        side = st["team_turn"]
+        start_score = st["scores"][side]
         new_score = start_score - turn_points
         bust = (new_score < 0 or new_score == 1)
         if not bust:
-            STATE["scores"][side] = new_score
+            st["scores"][side] = new_score
             if new_score == 0:
-                STATE["winner"] = side
-        advance_turn()
+                st["winner"] = side
+        advance_turn(st)
         return
 
+# -------------------------
+# Admin access
+# The jobs API, backups, profiling and the page cache stats queue heavy
+# work or show files and internals, so they answer only requests carrying
+# ADMIN_TOKEN, as "Authorization: Bearer <token>" or an X-Admin-Token
+# header. With no ADMIN_TOKEN set they are off.
+# -------------------------
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def admin_only(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        auth = request.headers.get("Authorization", "")
+        sent = auth[7:] if auth.startswith("Bearer ") else request.headers.get("X-Admin-Token", "")
+        if not ADMIN_TOKEN or not hmac.compare_digest(sent.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "admin token required"}), 401
+        return fn(*args, **kwargs)
+    return wrapper
+
+# -------------------------
+# Page cache
+# Player, team and history pages only change when saved data does, so the
+# rendered HTML is kept per URL, data version and day (pages default to
+# this year's season). Every write path calls bump_data_version (a shared
+# counter, so all workers drop their copies); ensure_active reads it with
+# the game state. ETags are the data version and day too, which answers a
+# browser's revalidation of a page already rendered without rendering it
+# again. Only 200 pages are kept or revalidated; "Not found" and friends
+# are rendered every time.
+# -------------------------
+PAGE_CACHE_BYTES = int(os.environ.get("PAGE_CACHE_BYTES", str(4 * 1024 * 1024)))
+with open(__file__, "rb") as src:
+    PAGE_SALT = hashlib.sha1(src.read()).hexdigest()[:8]     # new code, new ETags
+PAGE_CACHE = OrderedDict()      # path -> body, for PAGE_CACHE_STATS["version"]
+PAGE_CACHE_LOCK = threading.Lock()
+PAGE_CACHE_STATS = {"version": None, "bytes": 0, "hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+
+def bump_data_version(conn=None):
+    # conn: count it in that connection's open transaction
+    sql = "UPDATE hub_meta SET value = value + 1 WHERE key='data_version'"
+    if conn is None:
+        exec_sql(sql)
+    else:
+        conn.execute(sql)
+
+def cached_page(fn):
+    @functools.wraps(fn)
+    def wrapper(**kwargs):
+        version = f"{ACTIVE['data']}-{datetime.date.today():%Y%m%d}"
+        etag = f"{PAGE_SALT}-{version}"
+        st = PAGE_CACHE_STATS
+        path = request.full_path
+        with PAGE_CACHE_LOCK:
+            if st["version"] != version:
+                # older versions can never be asked for again
+                st["evictions"] += len(PAGE_CACHE)
+                PAGE_CACHE.clear()
+                st["version"], st["bytes"] = version, 0
+            body = PAGE_CACHE.get(path)
+            if body is not None:
+                PAGE_CACHE.move_to_end(path)
+        if body is None:
+            out = fn(**kwargs)
+            if not isinstance(out, str):
+                return out      # "Not found" and friends aren't cached
+            body = out.encode()
+            st["misses"] += 1
+            with PAGE_CACHE_LOCK:
+                if st["version"] == version and path not in PAGE_CACHE:
+                    PAGE_CACHE[path] = body
+                    st["bytes"] += len(body)
+                    while st["bytes"] > PAGE_CACHE_BYTES and PAGE_CACHE:
+                        st["bytes"] -= len(PAGE_CACHE.popitem(last=False)[1])
+                        st["evictions"] += 1
+        else:
+            st["hits"] += 1
+        if request.if_none_match.contains(etag):
+            st["not_modified"] += 1
+            resp = app.response_class(status=304)
+        else:
+            resp = app.response_class(body, mimetype="text/html")
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    return wrapper
+
+@app.get("/cache/stats")
+@admin_only
+def cache_stats():
+    st = PAGE_CACHE_STATS
+    lookups = st["hits"] + st["misses"]
+    return jsonify({**st, "entries": len(PAGE_CACHE), "max_bytes": PAGE_CACHE_BYTES,
+                    "hit_rate": round(st["hits"] / lookups, 3) if lookups else None})
+
 def finish_game():
     """Persist current game results into DB and clear active state."""
-    gid = STATE["active_game_id"]
-    if not gid:
-        return
-
+    # results and the cleared game commit together, so two workers can't both
+    # save it and a failed save leaves the game in play
+    with active_write() as (conn, st):
+        if not st["active_game_id"]:
+            return
+        save_results(dict(st), conn)
+        bump_data_version(conn)
+        reset_active(st)
+
+def save_results(st, conn):
+    gid = st["active_game_id"]
     ended = now_iso()
     winner_player_id = None
     winner_team_id = None
 
-    if STATE["mode"] == "ffa":
-        if isinstance(STATE["winner"], int):
-            winner_player_id = STATE["winner"]
+    if st["mode"] == "ffa":
+        if isinstance(st["winner"], int):
+            winner_player_id = st["winner"]
 
-        exec_sql("UPDATE games SET ended_at=?, winner_player_id=? WHERE id=?",
-                 (ended, winner_player_id, gid))
+        conn.execute("UPDATE games SET winner_player_id=? WHERE id=?", (winner_player_id, gid))
 
         # Write game_players final scores + won
-        for p in STATE["players"]:
+        for p in st["players"]:
             pid = p["id"]
-            final_score = int(STATE["scores"].get(pid, STATE["start_points"]))
+            final_score = int(st["scores"].get(pid, st["start_points"]))
             won = 1 if (winner_player_id == pid) else 0
-            exec_sql("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
-                     (final_score, won, gid, pid))
+            conn.execute("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
+                         (final_score, won, gid, pid))
 
-    elif STATE["mode"] == "teams":
-        if STATE["winner"] in ("A", "B"):
+    elif st["mode"] == "teams":
+        if st["winner"] in ("A", "B"):
             # map to team id
-            winner_team_id = STATE["teamA"]["id"] if STATE["winner"] == "A" else STATE["teamB"]["id"]
+            winner_team_id = st["teamA"]["id"] if st["winner"] == "A" else st["teamB"]["id"]
 
-        exec_sql("UPDATE games SET ended_at=?, winner_team_id=? WHERE id=?",
-                 (ended, winner_team_id, gid))
+        conn.execute("UPDATE games SET winner_team_id=? WHERE id=?", (winner_team_id, gid))
 
         # Each participating player gets a final_score = team remaining
-        scoreA = int(STATE["scores"].get("A", STATE["start_points"]))
-        scoreB = int(STATE["scores"].get("B", STATE["start_points"]))
-        for member in STATE["teamA"]["members"]:
-            exec_sql("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
-                     (scoreA, 1 if STATE["winner"] == "A" else 0, gid, member["id"]))
-        for member in STATE["teamB"]["members"]:
-            exec_sql("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
-                     (scoreB, 1 if STATE["winner"] == "B" else 0, gid, member["id"]))
+        scoreA = int(st["scores"].get("A", st["start_points"]))
+        scoreB = int(st["scores"].get("B", st["start_points"]))
+        for member in st["teamA"]["members"]:
+            conn.execute("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
+                         (scoreA, 1 if st["winner"] == "A" else 0, gid, member["id"]))
+        for member in st["teamB"]["members"]:
+            conn.execute("""UPDATE game_players SET final_score=?, won=? WHERE game_id=? AND player_id=?""",
+                         (scoreB, 1 if st["winner"] == "B" else 0, gid, member["id"]))
+
+    # ended_at goes in with the rollup, so a rebuild_rollups job sees the game whole or not at all
+    conn.execute("UPDATE games SET ended_at=? WHERE id=?", (ended, gid))
+    rollup_games(conn, "g.id=?", (gid,))
 
-    reset_active()
+# -------------------------
+# Stats rollups
+# Games and wins per player (and team) per day and per month, so a season is
+# twelve month rows each and any other range is its whole months plus the
+# loose days at either end. Only finished games count; a game belongs to
+# the day it started.
+# -------------------------
+PLAYER_ROLLUP = """
+    INSERT INTO {prefix}player_{table}({col}, player_id, games, wins)
+    SELECT substr(g.started_at, 1, {width}), gp.player_id, COUNT(*), SUM(gp.won IS 1)
+    FROM games g
+    JOIN game_players gp ON gp.game_id = g.id
+    WHERE {where}
+    GROUP BY 1, 2
+    ON CONFLICT({col}, player_id) DO UPDATE SET games = games + excluded.games, wins = wins + excluded.wins
+"""
+TEAM_ROLLUP = """
+    INSERT INTO {prefix}team_{table}({col}, team_id, games, wins)
+    SELECT substr(t.started_at, 1, {width}), t.team_id, COUNT(*), SUM(t.team_id IS t.winner_team_id)
+    FROM (SELECT g.started_at, g.winner_team_id, CASE s.side WHEN 'A' THEN g.team_a_id ELSE g.team_b_id END AS team_id
+          FROM games g, (SELECT 'A' AS side UNION ALL SELECT 'B') s
+          WHERE {where}) t
+    WHERE t.team_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT({col}, team_id) DO UPDATE SET games = games + excluded.games, wins = wins + excluded.wins
+"""
+ROLLUP_TABLE = """
+    CREATE {temp} TABLE IF NOT EXISTS {name} (
+        {col} TEXT NOT NULL,          -- YYYY-MM-DD or YYYY-MM
+        {kind}_id INTEGER NOT NULL,
+        games INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        PRIMARY KEY ({col}, {kind}_id)
+    ) WITHOUT ROWID"""
+ROLLUP_LEVELS = [("daily", "day", 10), ("monthly", "month", 7)]
+
+def rollup_games(conn, where, args=(), prefix=""):
+    for table, col, width in ROLLUP_LEVELS:
+        conn.execute(PLAYER_ROLLUP.format(prefix=prefix, table=table, col=col, width=width, where=where), args)
+        conn.execute(TEAM_ROLLUP.format(prefix=prefix, table=table, col=col, width=width, where=where), args)
+
+def next_month(d):
+    return datetime.date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+def stats_range(args):
+    """Date range from ?season=YYYY, ?month=YYYY-MM, ?week=YYYY-Www or ?from=&to= (default: this season).
+
+    Raises ValueError for anything it can't read."""
+    if args.get("month"):
+        lo = datetime.date.fromisoformat(args["month"] + "-01")
+        hi = next_month(lo) - datetime.timedelta(days=1)
+        label = lo.strftime("%B %Y")
+    elif args.get("week"):
+        year, week = args["week"].split("-W")
+        lo = datetime.date.fromisocalendar(int(year), int(week), 1)
+        hi = lo + datetime.timedelta(days=6)
+        label = args["week"]
+    elif args.get("from") or args.get("to"):
+        lo = datetime.date.fromisoformat(args.get("from") or "1900-01-01")
+        hi = datetime.date.fromisoformat(args.get("to") or "2999-12-31")
+        label = f"{args.get('from') or '…'} – {args.get('to') or '…'}"
+    else:
+        season = int(args.get("season") or datetime.date.today().year)
+        lo, hi = datetime.date(season, 1, 1), datetime.date(season, 12, 31)
+        label = f"Season {season}"
+    if lo > hi:
+        raise ValueError("range ends before it starts")
+    # whole months are [first, after); the loose days are [lo, first) and [after, hi]
+    first = lo if lo.day == 1 else next_month(lo)
+    after = next_month(hi) if hi.day == calendar.monthrange(hi.year, hi.month)[1] else hi.replace(day=1)
+    first, after = first.isoformat(), max(first, after).isoformat()
+    lo, hi = lo.isoformat(), hi.isoformat()
+    return {"from": lo, "to": hi, "label": label,
+            "parts": (first[:7], after[:7], lo, first, hi, after, hi)}
+
+def rank_table(kind, rng):
+    return q_all(f"""
+        SELECT x.id, x.name, d.games, d.wins
+        FROM (SELECT {kind}_id, SUM(games) AS games, SUM(wins) AS wins
+              FROM (SELECT {kind}_id, games, wins FROM {kind}_monthly WHERE month >= ? AND month < ?
+                    UNION ALL
+                    SELECT {kind}_id, games, wins FROM {kind}_daily WHERE day >= ? AND day < ? AND day <= ?
+                    UNION ALL
+                    SELECT {kind}_id, games, wins FROM {kind}_daily WHERE day >= ? AND day <= ?)
+              GROUP BY {kind}_id) d
+        JOIN {kind}s x ON x.id = d.{kind}_id
+        ORDER BY d.wins DESC, d.games, x.name COLLATE NOCASE
+    """, rng["parts"])
+
+def table_json(rows):
+    return [{"id": r["id"], "name": r["name"], "games": r["games"], "wins": r["wins"],
+             "win_rate": round(r["wins"] / r["games"], 3)} for r in rows]
+
+BUCKETS = {
+    "day": lambda d: d,
+    "week": lambda d: "%d-W%02d" % datetime.date.fromisoformat(d).isocalendar()[:2],
+    "month": lambda d: d[:7],
+    "season": lambda d: d[:4],
+}
+
+# -------------------------
+# Background jobs
+# Slow work (exports, rollup rebuilds, backups, DB maintenance) runs on a
+# few worker threads per process instead of inside a request. The queue is the jobs
+# table, so any worker process can take a job, status survives restarts
+# and the API can be asked from any process. Jobs report progress through
+# their JobContext, which doubles as the heartbeat and the cancel check; a
+# running job that stops reporting for JOB_STALE seconds (its process died)
+# goes back to the queue, up to JOB_ATTEMPTS times, and then fails. A step
+# that is one long statement (VACUUM, an integrity check) runs inside
+# ctx.beating(), which keeps the heartbeat going from a side thread.
+# -------------------------
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))          # threads per process
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))    # queued jobs before submits are refused
+JOB_NICE = int(os.environ.get("JOB_NICE", "10"))              # CPU priority of the worker threads
+JOB_STALE = 300
+JOB_ATTEMPTS = 3
+JOB_BEAT = JOB_STALE / 10      # seconds between heartbeats inside ctx.beating()
+JOB_POLL = 2.0
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(os.path.dirname(os.path.abspath(APP_DB)), "exports"))
+JOB_KINDS = {}
+JOB_WAKE = threading.Event()
+
+class JobCancelled(Exception):
+    pass
+
+def job(kind):
+    def register(fn):
+        JOB_KINDS[kind] = fn
+        return fn
+    return register
+
+class JobContext:
+    def __init__(self, job_id):
+        self.id = job_id
+
+    def progress(self, fraction, message=None):
+        conn = db()
+        row = conn.execute("""
+            UPDATE jobs SET progress=?, message=COALESCE(?, message), heartbeat=?
+            WHERE id=? RETURNING cancel
+        """, (min(1.0, fraction), message, time.time(), self.id)).fetchone()
+        conn.commit()
+        conn.close()
+        if row["cancel"]:
+            raise JobCancelled()
+
+    @contextmanager
+    def beating(self):
+        # while the write lock is taken (VACUUM, ANALYZE) the beats wait for
+        # it, but so does every claim_job that could take the job over
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(JOB_BEAT):
+                conn = db()
+                try:
+                    conn.execute("UPDATE jobs SET heartbeat=? WHERE id=?", (time.time(), self.id))
+                    conn.commit()
+                except sqlite3.OperationalError:
+                    pass        # busy; the next beat tries again
+                finally:
+                    conn.close()
+
+        thread = threading.Thread(target=beat, name=f"job-{self.id}-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+def submit_job(kind, params=None, priority=0):
+    job_id = exec_sql("INSERT INTO jobs(kind, priority, status, params, created_at) VALUES(?,?,'queued',?,?)",
+                      (kind, priority, json.dumps(params or {}), now_iso()))
+    JOB_WAKE.set()
+    return job_id
+
+def claim_job():
+    now = time.time()
+    conn = db()
+    # a stale job with no attempts left would otherwise stay "running" for good
+    conn.execute("""
+        UPDATE jobs SET status='failed', finished_at=?,
+                        error=COALESCE(error, 'worker stopped reporting, attempts used up')
+        WHERE status='running' AND heartbeat < ? AND attempts >= ?
+    """, (now_iso(), now - JOB_STALE, JOB_ATTEMPTS))
+    row = conn.execute("""
+        UPDATE jobs SET status='running', worker=?, attempts=attempts+1, heartbeat=?,
+                        started_at=COALESCE(started_at, ?)
+        WHERE id = (SELECT id FROM jobs
+                    WHERE status='queued'
+                       OR (status='running' AND heartbeat < ? AND attempts < ?)
+                    ORDER BY priority DESC, id
+                    LIMIT 1)
+        RETURNING id, kind, params
+    """, (f"pid {os.getpid()}", now, now_iso(), now - JOB_STALE, JOB_ATTEMPTS)).fetchone()
+    conn.commit()
+    conn.close()
+    return row
+
+def end_job(job_id, status, result=None, error=None):
+    exec_sql("""UPDATE jobs SET status=?, result=?, error=?, finished_at=?,
+                progress=CASE WHEN ?='done' THEN 1 ELSE progress END
+                WHERE id=?""",
+             (status, json.dumps(result) if result is not None else None, error, now_iso(), status, job_id))
+
+def run_job(row):
+    try:
+        result = JOB_KINDS[row["kind"]](JobContext(row["id"]), **json.loads(row["params"]))
+        end_job(row["id"], "done", result)
+    except JobCancelled:
+        end_job(row["id"], "cancelled")
+    except Exception as e:
+        end_job(row["id"], "failed", error=f"{type(e).__name__}: {e}")
+
+def job_worker():
+    if JOB_NICE and hasattr(os, "setpriority"):
+        # Linux nices a single thread by its id; requests keep first call on the CPU
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), JOB_NICE)
+    while True:
+        try:
+            schedule_backup()
+            row = claim_job()
+            if row is not None:
+                run_job(row)
+                continue
+        except sqlite3.OperationalError:
+            # database busy; an unrecorded job is picked up again once it goes stale
+            app.logger.exception("job worker")
+        JOB_WAKE.wait(JOB_POLL)
+        JOB_WAKE.clear()
+
+def run_job_here(kind, params):
+    # claimed as it's queued, so no worker takes it too
+    job_id = exec_sql("""INSERT INTO jobs(kind, status, params, worker, attempts, heartbeat, created_at, started_at)
+                         VALUES(?, 'running', ?, ?, 1, ?, ?, ?)""",
+                      (kind, json.dumps(params), f"pid {os.getpid()}", time.time(), now_iso(), now_iso()))
+    run_job(q_one("SELECT id, kind, params FROM jobs WHERE id=?", (job_id,)))
+    return job_json(q_one("SELECT * FROM jobs WHERE id=?", (job_id,)))
+
+def start_job_workers():
+    for i in range(JOB_WORKERS):
+        threading.Thread(target=job_worker, name=f"job-worker-{i}", daemon=True).start()
+
+def job_json(row):
+    out = dict(row)
+    out["params"] = json.loads(out["params"])
+    out["result"] = json.loads(out["result"]) if out["result"] else None
+    return out
+
+@job("rebuild_rollups")
+def rebuild_rollups(ctx, chunk=2000):
+    """Recompute the stats rollups from games/game_players."""
+    conn = db()
+    # build next to the live tables, one chunk of games at a time; games that
+    # finish meanwhile (newer than the last chunk, or still open when theirs
+    # was read) are picked up in the final swap
+    conn.execute("CREATE TEMP TABLE rebuild_done (game_id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE rebuild_open (game_id INTEGER PRIMARY KEY)")
+    for kind in ("player", "team"):
+        for table, col, width in ROLLUP_LEVELS:
+            conn.execute(ROLLUP_TABLE.format(temp="TEMP", name=f"rebuild_{kind}_{table}", col=col, kind=kind))
+    total = conn.execute("SELECT COUNT(*) FROM games WHERE ended_at IS NOT NULL").fetchone()[0]
+    done, last = 0, 0
+    while True:
+        ids = [r[0] for r in conn.execute("SELECT id FROM games WHERE ended_at IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+                                          (last, chunk))]
+        if not ids:
+            break
+        conn.execute("INSERT INTO rebuild_open SELECT id FROM games WHERE id > ? AND id < ? AND ended_at IS NULL",
+                     (last, ids[-1]))
+        last = ids[-1]
+        conn.executemany("INSERT INTO rebuild_done VALUES(?)", [(i,) for i in ids])
+        rollup_games(conn, "g.id IN (SELECT game_id FROM rebuild_done WHERE game_id BETWEEN ? AND ?)",
+                     (ids[0], last), prefix="temp.rebuild_")
+        conn.commit()
+        done += len(ids)
+        ctx.progress(0.95 * done / max(total, 1), f"{done} of {total} games")
+    conn.execute("BEGIN IMMEDIATE")
+    rollup_games(conn, "g.id > ? AND g.ended_at IS NOT NULL", (last,), prefix="temp.rebuild_")
+    rollup_games(conn, "g.id IN (SELECT game_id FROM rebuild_open) AND g.ended_at IS NOT NULL", prefix="temp.rebuild_")
+    # archived seasons' games are gone, but their rollup rows stay
+    since = season_start(conn.execute("SELECT value FROM hub_meta WHERE key='archived_before'").fetchone()[0])
+    for kind in ("player", "team"):
+        for table, col, width in ROLLUP_LEVELS:
+            conn.execute(f"DELETE FROM main.{kind}_{table} WHERE {col} >= ?", (since[:width],))
+            conn.execute(f"INSERT INTO main.{kind}_{table} SELECT * FROM temp.rebuild_{kind}_{table} WHERE {col} >= ?",
+                         (since[:width],))
+    conn.commit()
+    conn.close()
+    bump_data_version()
+    return {"games": done}
+
+@job("export_games")
+def export_games(ctx, chunk=5000):
+    """Every saved game, one CSV row per player; archived seasons first."""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    path = os.path.join(JOB_DIR, f"games-{ctx.id}.csv")
+    conn = db()
+    archives = conn.execute("SELECT season, file, game_players FROM archives ORDER BY season").fetchall()
+    since = season_start(conn.execute("SELECT value FROM hub_meta WHERE key='archived_before'").fetchone()[0])
+    total = conn.execute("SELECT COUNT(*) FROM game_players").fetchone()[0] + sum(a["game_players"] for a in archives)
+    rows = 0
+    with open(path + ".part", "w", newline="") as f:
+        out = csv.writer(f)
+        out.writerow(["game_id", "game_type", "mode", "started_at", "ended_at", "player", "team_side", "final_score", "won"])
+        for a in list(archives) + [None]:
+            if a is not None:
+                conn.execute("ATTACH DATABASE ? AS arch", (archive_uri(a["file"]),))
+            last = (0, 0)
+            while True:
+                batch = conn.execute("""
+                    SELECT gp.game_id, g.game_type, g.mode, g.started_at, g.ended_at, p.name, gp.team_side, gp.final_score, gp.won,
+                           gp.player_id
+                    FROM {db}game_players gp
+                    JOIN {db}games g ON g.id = gp.game_id
+                    JOIN players p ON p.id = gp.player_id
+                    WHERE (gp.game_id, gp.player_id) > (?, ?) AND g.started_at >= ?
+                    ORDER BY gp.game_id, gp.player_id
+                    LIMIT ?
+                """.format(db="arch." if a else "main."), (*last, "" if a else since, chunk)).fetchall()
+                if not batch:
+                    break
+                out.writerows([tuple(r)[:-1] for r in batch])
+                last = (batch[-1]["game_id"], batch[-1]["player_id"])
+                rows += len(batch)
+                ctx.progress(rows / max(total, 1), f"{rows} of {total} rows")
+            if a is not None:
+                conn.execute("DETACH DATABASE arch")
+    conn.close()
+    os.replace(path + ".part", path)
+    return {"file": os.path.basename(path), "rows": rows}
+
+@job("db_maintenance")
+def db_maintenance(ctx, vacuum=False):
+    """Integrity check, planner statistics, WAL checkpoint and (optionally) VACUUM."""
+    conn = sqlite3.connect(APP_DB, isolation_level=None, timeout=30)
+    # the checkpoint goes last: a VACUUM only shrinks the file once its pages are out of the WAL
+    steps = ([("quick_check", "PRAGMA quick_check"), ("analyze", "ANALYZE")] + ([("vacuum", "VACUUM")] if vacuum else [])
+             + [("checkpoint", "PRAGMA wal_checkpoint(TRUNCATE)")])
+    result = {}
+    for i, (name, sql) in enumerate(steps):
+        ctx.progress(i / len(steps), name)
+        with ctx.beating():
+            result[name] = [list(r) for r in conn.execute(sql).fetchall()]
+    conn.close()
+    return result
+
+# -------------------------
+# Backups
+# The "backup" job copies the database with SQLite's online backup API,
+# BACKUP_PAGES pages per step with a BACKUP_SLEEP pause after each, so a
+# backup never hogs the disk or the CPU while a game is being scored. The
+# copy comes from one read snapshot held for the whole backup: in WAL mode
+# that never blocks the writer, and turns saved meanwhile don't restart the
+# copy (they are in the next one; the WAL just can't be checkpointed past
+# them until it ends). Every copy is integrity-checked under a .part name
+# before it counts, and only the newest BACKUP_KEEP are kept. Job workers
+# queue one every BACKUP_EVERY hours; 0 leaves it to POST /jobs.
+# -------------------------
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(os.path.dirname(os.path.abspath(APP_DB)), "backups"))
+BACKUP_EVERY = float(os.environ.get("BACKUP_EVERY", "24"))     # hours
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.environ.get("BACKUP_PAGES", "64"))
+BACKUP_SLEEP = float(os.environ.get("BACKUP_SLEEP", "0.01"))   # seconds
+BACKUP_PREFIX = os.path.splitext(os.path.basename(APP_DB))[0] + "-"
+
+def backup_files():
+    # oldest first; the names sort by time
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    return sorted(f for f in os.listdir(BACKUP_DIR) if f.startswith(BACKUP_PREFIX) and f.endswith(".db"))
+
+def schedule_backup():
+    if BACKUP_EVERY <= 0:
+        return
+    since = (datetime.datetime.now() - datetime.timedelta(hours=BACKUP_EVERY)).isoformat(timespec="seconds")
+    if q_one("SELECT 1 FROM jobs WHERE kind='backup' AND created_at > ? LIMIT 1", (since,)):
+        return
+    # checked again inside the insert, so only one worker of one process queues it
+    exec_sql("""INSERT INTO jobs(kind, priority, status, params, created_at)
+                SELECT 'backup', -1, 'queued', '{}', ?
+                WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind='backup' AND created_at > ?)""", (now_iso(), since))
+
+@job("backup")
+def backup(ctx, pages=None, pause=None):
+    """Online copy of the database into BACKUP_DIR, verified, older copies rotated out."""
+    pages = pages or BACKUP_PAGES
+    pause = BACKUP_SLEEP if pause is None else pause
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.datetime.now():%Y%m%d-%H%M%S}.db"
+    part = os.path.join(BACKUP_DIR, name + ".part")
+    reported = [time.monotonic()]
+
+    def step(status, remaining, total):
+        if time.monotonic() - reported[0] >= 1.0:
+            reported[0] = time.monotonic()
+            ctx.progress(0.9 * (total - remaining) / max(total, 1), f"{total - remaining} of {total} pages")
+        time.sleep(pause)
+
+    t0 = time.perf_counter()
+    src = sqlite3.connect(APP_DB, isolation_level=None, timeout=30)
+    dst = sqlite3.connect(part)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT value FROM hub_meta WHERE key='data_version'").fetchone()     # takes the snapshot
+        src.backup(dst, pages=pages, progress=step)
+        src.execute("COMMIT")
+        copied = time.perf_counter() - t0
+        dst.execute("PRAGMA journal_mode=DELETE").fetchone()        # a single file, whatever opens it later
+        ctx.progress(0.9, "integrity check")
+        with ctx.beating():
+            check = [r[0] for r in dst.execute("PRAGMA integrity_check")]
+        if check != ["ok"]:
+            raise sqlite3.DatabaseError("integrity_check: " + "; ".join(check[:5]))
+        dst.close()
+        os.replace(part, os.path.join(BACKUP_DIR, name))
+    except BaseException:
+        dst.close()
+        for f in (part, part + "-journal", part + "-wal", part + "-shm"):
+            if os.path.exists(f):
+                os.remove(f)
+        raise
+    finally:
+        src.close()
+    removed = backup_files()[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []
+    for f in removed:
+        os.remove(os.path.join(BACKUP_DIR, f))
+    return {"file": name, "bytes": os.path.getsize(os.path.join(BACKUP_DIR, name)),
+            "copy_seconds": round(copied, 2), "total_seconds": round(time.perf_counter() - t0, 2), "removed": removed}
+
+# -------------------------
+# Season archives
+# The "archive_seasons" job moves closed seasons (calendar years, as on the
+# leaderboard) out of games/game_players into one file per season under
+# ARCHIVE_DIR, same tables and indexes, so the live tables only hold the
+# seasons still being played. Seasons go oldest first: hub_meta
+# 'archived_before' is the first season still live, and live queries that
+# add up a player's games only count games from then on. What archived
+# seasons add is counted once, as the season goes, into archive_players,
+# which lifetime stats UNION in; the day/month rollups stay, so
+# leaderboards and /stats cover every season as before. Pages that need an
+# archived season's rows (old history, a quiet player's last games, the
+# CSV export) attach its file read-only for that one query.
+# -------------------------
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(APP_DB)), "archive"))
+ARCHIVE_PREFIX = os.path.splitext(os.path.basename(APP_DB))[0] + "-season-"
+
+def season_start(season):
+    # started_at >= "" holds for every game, so nothing archived means no cut-off
+    return f"{season:04d}-01-01" if season else ""
+
+def archive_uri(name):
+    return "file:" + urllib.request.pathname2url(os.path.join(ARCHIVE_DIR, name)) + "?mode=ro"
+
+def q_archive(season, sql, args=()):
+    """q_all with that season's archive attached read-only as `arch`."""
+    conn = db()
+    row = conn.execute("SELECT file FROM archives WHERE season=?", (season,)).fetchone()
+    if row is None:
+        conn.close()
+        return []
+    conn.execute("ATTACH DATABASE ? AS arch", (archive_uri(row["file"]),))
+    rows = conn.execute(sql, args).fetchall()
+    conn.close()
+    return rows
+
+@job("archive_seasons")
+def archive_seasons(ctx, before=None, chunk=2000):
+    """Move every season before `before` (default: this one) into its archive file."""
+    before = int(before or datetime.date.today().year)
+    if before > datetime.date.today().year:
+        raise ValueError(f"season {before - 1} isn't over yet")
+    conn = sqlite3.connect(APP_DB, isolation_level=None, timeout=30)
+    playing = json.loads(conn.execute("SELECT state FROM active_state WHERE id=1").fetchone()[0])["active_game_id"]
+    if conn.execute("SELECT 1 FROM games WHERE id=? AND started_at < ?", (playing, season_start(before))).fetchone():
+        raise ValueError("the game in progress started in a season being archived")
+    tables = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name IN ('games', 'game_players')").fetchall()
+    indexes = conn.execute("""SELECT sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL
+                              AND tbl_name IN ('games', 'game_players')""").fetchall()
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    def drop(ids, season):
+        # out of the live tables a chunk at a time, so scoring never waits long for the write lock
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            marks = ",".join(["?"] * len(part))
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DELETE FROM game_players WHERE game_id IN ({marks})", part)
+            conn.execute(f"DELETE FROM games WHERE id IN ({marks})", part)
+            conn.execute("COMMIT")
+            ctx.progress((season - first + (i + len(part)) / len(ids)) / max(1, before - first),
+                         f"season {season}: {i + len(part)} of {len(ids)} games moved")
+
+    live = conn.execute("SELECT value FROM hub_meta WHERE key='archived_before'").fetchone()[0]
+    oldest = conn.execute("SELECT MIN(started_at) FROM games").fetchone()[0]
+    first = min(before, int(oldest[:4])) if oldest else before
+    # rows of a season archived by a run that died before it finished removing them
+    drop([r[0] for r in conn.execute("SELECT id FROM games WHERE started_at < ?", (season_start(live),))], first)
+    done = []
+    for season in range(max(first, live), before):
+        lo, hi = season_start(season), season_start(season + 1)
+        ctx.progress((season - first) / max(1, before - first), f"season {season}: copying")
+        if not conn.execute("SELECT 1 FROM games WHERE started_at >= ? AND started_at < ? LIMIT 1", (lo, hi)).fetchone():
+            conn.execute("UPDATE hub_meta SET value=? WHERE key='archived_before'", (season + 1,))
+            continue
+
+        # 1. the season's rows into a fresh file
+        name = f"{ARCHIVE_PREFIX}{season}.db"
+        part = os.path.join(ARCHIVE_DIR, name + ".part")
+        if os.path.exists(part):
+            os.remove(part)
+        conn.execute("ATTACH DATABASE ? AS arch", (part,))
+        conn.execute("BEGIN")
+        for (sql,) in tables:
+            conn.execute(sql.replace("CREATE TABLE ", "CREATE TABLE arch.", 1))
+        conn.execute("INSERT INTO arch.games SELECT * FROM main.games WHERE started_at >= ? AND started_at < ?", (lo, hi))
+        conn.execute("INSERT INTO arch.game_players SELECT * FROM main.game_players WHERE game_id IN (SELECT id FROM arch.games)")
+        for (sql,) in indexes:
+            conn.execute(sql.replace("CREATE INDEX ", "CREATE INDEX arch.", 1))
+        conn.execute("COMMIT")
+        conn.execute("DETACH DATABASE arch")
+        os.replace(part, os.path.join(ARCHIVE_DIR, name))
+
+        # 2. count it in and move the cut-off past it together; from then on its live rows don't count
+        conn.execute("ATTACH DATABASE ? AS arch", (archive_uri(name),))
+        conn.execute("BEGIN IMMEDIATE")
+        n_games = conn.execute("SELECT COUNT(*) FROM arch.games").fetchone()[0]
+        n_seats = conn.execute("SELECT COUNT(*) FROM arch.game_players").fetchone()[0]
+        conn.execute("""
+            INSERT OR REPLACE INTO archive_players(player_id, season, games, wins, last_played)
+            SELECT gp.player_id, ?, COUNT(*), SUM(CASE WHEN gp.won=1 THEN 1 ELSE 0 END), MAX(g.started_at)
+            FROM arch.game_players gp
+            JOIN arch.games g ON g.id = gp.game_id
+            GROUP BY gp.player_id
+        """, (season,))
+        conn.execute("INSERT OR REPLACE INTO archives(season, file, games, game_players, created_at) VALUES(?,?,?,?,?)",
+                     (season, name, n_games, n_seats, now_iso()))
+        conn.execute("UPDATE hub_meta SET value=? WHERE key='archived_before'", (season + 1,))
+        conn.execute("COMMIT")
+        ids = [r[0] for r in conn.execute("SELECT id FROM arch.games ORDER BY id")]
+        conn.execute("DETACH DATABASE arch")
+        bump_data_version()
+
+        # 3. then out of the live tables
+        drop(ids, season)
+        done.append({"season": season, "file": name, "games": n_games, "game_players": n_seats})
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+    # new games reuse the freed pages; db_maintenance with vacuum gives them back to the disk
+    return {"archived": done, "free_bytes": free}
 
 # -------------------------
 # HTML Templates (minimal)
@@ -282,6 +1183,7 @@ def home():
           <a class="pill" href="/players">/players</a>
           <a class="pill" href="/teams">/teams</a>
           <a class="pill" href="/history">/history</a>
+          <a class="pill" href="/leaderboard">/leaderboard</a>
         </div>
       </div>
     </div>
@@ -291,13 +1193,17 @@ def home():
 # Players
 # -------------------------
 @app.get("/players")
+@cached_page
 def players_page():
     players = q_all("""
         SELECT p.id, p.name,
-               (SELECT MAX(g.started_at)
-                FROM game_players gp
-                JOIN games g ON g.id = gp.game_id
-                WHERE gp.player_id = p.id) AS last_played
+               COALESCE((SELECT g.started_at
+                         FROM game_players gp
+                         JOIN games g ON g.id = gp.game_id
+                         WHERE gp.player_id = p.id
+                         ORDER BY gp.game_id DESC       -- ids go out in start order; one index probe per player
+                         LIMIT 1),
+                        (SELECT MAX(last_played) FROM archive_players a WHERE a.player_id = p.id)) AS last_played
         FROM players p
         ORDER BY p.name COLLATE NOCASE
     """)
@@ -335,34 +1241,52 @@ def players_add():
     if name:
         try:
             exec_sql("INSERT INTO players(name, created_at) VALUES(?,?)", (name, now_iso()))
+            bump_data_version()
         except sqlite3.IntegrityError:
             pass
     return redirect(url_for("players_page"))
 
 @app.get("/player/<int:player_id>")
+@cached_page
 def player_detail(player_id):
     p = q_one("SELECT id, name, created_at FROM players WHERE id=?", (player_id,))
     if not p:
         return "Not found", 404
 
     stats = q_one("""
-        SELECT
-          COUNT(*) AS games_played,
-          SUM(CASE WHEN gp.won=1 THEN 1 ELSE 0 END) AS wins,
-          MAX(g.started_at) AS last_played
-        FROM game_players gp
-        JOIN games g ON g.id = gp.game_id
-        WHERE gp.player_id=?
-    """, (player_id,))
-
-    recent = q_all("""
+        SELECT SUM(games) AS games_played, SUM(wins) AS wins, MAX(last_played) AS last_played
+        FROM (SELECT
+                COUNT(*) AS games,
+                SUM(CASE WHEN gp.won=1 THEN 1 ELSE 0 END) AS wins,
+                MAX(g.started_at) AS last_played
+              FROM game_players gp
+              JOIN games g ON g.id = gp.game_id
+              WHERE gp.player_id=? AND g.started_at >= ?
+              UNION ALL
+              SELECT games, wins, last_played FROM archive_players WHERE player_id=?)
+    """, (player_id, ACTIVE["since"], player_id))
+
+    season = datetime.date.today().year
+    this_season = q_one("""
+        SELECT SUM(games) AS games, SUM(wins) AS wins
+        FROM player_monthly
+        WHERE player_id=? AND month BETWEEN ? AND ?
+    """, (player_id, f"{season}-01", f"{season}-12"))
+
+    recent_sql = """
         SELECT g.id, g.game_type, g.mode, g.started_at, g.ended_at, gp.final_score, gp.won
-        FROM game_players gp
-        JOIN games g ON g.id = gp.game_id
-        WHERE gp.player_id=?
+        FROM {db}game_players gp
+        JOIN {db}games g ON g.id = gp.game_id
+        WHERE gp.player_id=? AND g.started_at >= ?
         ORDER BY g.started_at DESC
-        LIMIT 15
-    """, (player_id,))
+        LIMIT ?
+    """
+    recent = q_all(recent_sql.format(db=""), (player_id, ACTIVE["since"], 15))
+    # not 15 games since the last archived season: the rest come from the archives
+    for (archived,) in q_all("SELECT season FROM archive_players WHERE player_id=? ORDER BY season DESC", (player_id,)):
+        if len(recent) >= 15:
+            break
+        recent += q_archive(archived, recent_sql.format(db="arch."), (player_id, "", 15 - len(recent)))
 
     return render_template_string(f"""
     {BASE_CSS}
@@ -383,6 +1307,12 @@ def player_detail(player_id):
         </div>
       </div>
 
+      <div class="card">
+        <div class="pill">Season {season}</div>
+        <div class="big" style="font-size:22px">{this_season['wins'] or 0} wins in {this_season['games'] or 0} games</div>
+        <div class="muted"><a href="/stats/player/{p['id']}?bucket=month&season={season}">by month (JSON)</a></div>
+      </div>
+
       <div class="card">
         <div class="pill">Last played</div>
         <div class="big" style="font-size:22px">{stats['last_played'] or "—"}</div>
@@ -404,6 +1334,7 @@ def player_detail(player_id):
 # Teams
 # -------------------------
 @app.get("/teams")
+@cached_page
 def teams_page():
     teams = q_all("""
         SELECT t.id, t.name,
@@ -451,11 +1382,13 @@ def teams_add():
     if name:
         try:
             exec_sql("INSERT INTO teams(name, created_at) VALUES(?,?)", (name, now_iso()))
+            bump_data_version()
         except sqlite3.IntegrityError:
             pass
     return redirect(url_for("teams_page"))
 
 @app.get("/team/<int:team_id>")
+@cached_page
 def team_detail(team_id):
     t = q_one("SELECT id, name FROM teams WHERE id=?", (team_id,))
     if not t:
@@ -510,6 +1443,7 @@ def team_members_save(team_id):
             pass
     conn.commit()
     conn.close()
+    bump_data_version()
     return redirect(url_for("team_detail", team_id=team_id))
 
 # -------------------------
@@ -614,36 +1548,37 @@ def display():
     """)
 
 def render_display_body():
-    if not STATE["active_game_id"]:
+    st = STATE
+    if not st["active_game_id"]:
         return "<div class='card'><div class='big'>No game</div><div class='muted'>Start a game from /control</div></div>"
 
-    if STATE["mode"] == "ffa":
+    if st["mode"] == "ffa":
         cards = []
-        for i, p in enumerate(STATE["players"]):
+        for i, p in enumerate(st["players"]):
             pid = p["id"]
-            score = STATE["scores"].get(pid, STATE["start_points"])
+            score = st["scores"].get(pid, st["start_points"])
             cls = "card"
-            if i == (STATE["current_turn_idx"] % len(STATE["players"])):
+            if i == (st["current_turn_idx"] % len(st["players"])):
                 cls += " active"
-            if STATE["winner"] == pid:
+            if st["winner"] == pid:
                 cls += " win"
             cards.append(f"<div class='{cls}'><div class='pill'>{p['name']}</div><div class='big'>{score}</div></div>")
         win_banner = ""
-        if isinstance(STATE["winner"], int):
-            wname = next((p["name"] for p in STATE["players"] if p["id"] == STATE["winner"]), "Winner")
+        if isinstance(st["winner"], int):
+            wname = next((p["name"] for p in st["players"] if p["id"] == st["winner"]), "Winner")
             win_banner = f"<div class='card win'><div class='big'>{wname} wins ✅</div></div>"
         return win_banner + "<div class='grid'>" + "".join(cards) + "</div>"
 
-    if STATE["mode"] == "teams":
-        A = STATE["teamA"]; B = STATE["teamB"]
-        scoreA = STATE["scores"].get("A", STATE["start_points"])
-        scoreB = STATE["scores"].get("B", STATE["start_points"])
-        clsA = "card" + (" active" if STATE["team_turn"] == "A" else "") + (" win" if STATE["winner"] == "A" else "")
-        clsB = "card" + (" active" if STATE["team_turn"] == "B" else "") + (" win" if STATE["winner"] == "B" else "")
+    if st["mode"] == "teams":
+        A = st["teamA"]; B = st["teamB"]
+        scoreA = st["scores"].get("A", st["start_points"])
+        scoreB = st["scores"].get("B", st["start_points"])
+        clsA = "card" + (" active" if st["team_turn"] == "A" else "") + (" win" if st["winner"] == "A" else "")
+        clsB = "card" + (" active" if st["team_turn"] == "B" else "") + (" win" if st["winner"] == "B" else "")
 
         banner = ""
-        if STATE["winner"] in ("A", "B"):
-            wteam = A["name"] if STATE["winner"] == "A" else B["name"]
+        if st["winner"] in ("A", "B"):
+            wteam = A["name"] if st["winner"] == "A" else B["name"]
             banner = f"<div class='card win'><div class='big'>{wteam} wins ✅</div></div>"
 
         return banner + f"""
@@ -685,15 +1620,17 @@ def start_501_ffa():
     # game_players
     for p in selected:
         exec_sql("INSERT INTO game_players(game_id, player_id, team_side) VALUES(?,?,NULL)", (gid, p["id"]))
-
-    reset_active()
-    STATE["active_game_id"] = gid
-    STATE["game_type"] = "501"
-    STATE["mode"] = "ffa"
-    STATE["players"] = [{"id": int(p["id"]), "name": p["name"]} for p in selected]
-    STATE["start_points"] = start_points
-    STATE["scores"] = {int(p["id"]): start_points for p in selected}
-    STATE["current_turn_idx"] = 0
+    bump_data_version()
+
+    with active_write() as (conn, st):
+        reset_active(st)
+        st["active_game_id"] = gid
+        st["game_type"] = "501"
+        st["mode"] = "ffa"
+        st["players"] = [{"id": int(p["id"]), "name": p["name"]} for p in selected]
+        st["start_points"] = start_points
+        st["scores"] = {int(p["id"]): start_points for p in selected}
+        st["current_turn_idx"] = 0
     return redirect(url_for("control"))
 
 @app.post("/start_501_teams")
@@ -724,6 +1661,8 @@ def start_501_teams():
 
     if len(A_members) == 0 or len(B_members) == 0:
         return redirect(url_for("control"))
+    if {m["id"] for m in A_members} & {m["id"] for m in B_members}:
+        return redirect(url_for("control"))     # someone in both teams; they can only take one seat
 
     gid = exec_sql("""
         INSERT INTO games(game_type, mode, team_a_id, team_b_id, started_at)
@@ -736,17 +1675,19 @@ def start_501_teams():
     for m in B_members:
         exec_sql("INSERT INTO game_players(game_id, player_id, team_side) VALUES(?,?,?)",
                  (gid, m["id"], "B"))
-
-    reset_active()
-    STATE["active_game_id"] = gid
-    STATE["game_type"] = "501"
-    STATE["mode"] = "teams"
-    STATE["teamA"] = {"id": int(A["id"]), "name": A["name"], "members": [{"id": int(x["id"]), "name": x["name"]} for x in A_members]}
-    STATE["teamB"] = {"id": int(B["id"]), "name": B["name"], "members": [{"id": int(x["id"]), "name": x["name"]} for x in B_members]}
-    STATE["start_points"] = start_points
-    STATE["scores"] = {"A": start_points, "B": start_points}
-    STATE["team_turn"] = "A"
-    STATE["team_member_idx"] = 0
+    bump_data_version()
+
+    with active_write() as (conn, st):
+        reset_active(st)
+        st["active_game_id"] = gid
+        st["game_type"] = "501"
+        st["mode"] = "teams"
+        st["teamA"] = {"id": int(A["id"]), "name": A["name"], "members": [{"id": int(x["id"]), "name": x["name"]} for x in A_members]}
+        st["teamB"] = {"id": int(B["id"]), "name": B["name"], "members": [{"id": int(x["id"]), "name": x["name"]} for x in B_members]}
+        st["start_points"] = start_points
+        st["scores"] = {"A": start_points, "B": start_points}
+        st["team_turn"] = "A"
+        st["team_member_idx"] = 0
     return redirect(url_for("control"))
 
 # -------------------------
@@ -757,13 +1698,15 @@ def turn_501():
     if not STATE["active_game_id"]:
         return redirect(url_for("control"))
     pts = int(request.form.get("turn_points") or 0)
-    apply_501_turn(pts)
+    with active_write() as (conn, st):
+        apply_501_turn(st, pts)
     return redirect(url_for("control"))
 
 @app.post("/next_turn")
 def next_turn():
-    if STATE["active_game_id"]:
-        advance_turn()
+    with active_write() as (conn, st):
+        if st["active_game_id"]:
+            advance_turn(st)
     return redirect(url_for("control"))
 
 @app.post("/finish")
@@ -773,33 +1716,45 @@ def finish():
 
 @app.post("/reset_active")
 def reset_active_route():
-    reset_active()
+    with active_write() as (conn, st):
+        reset_active(st)
     return redirect(url_for("control"))
 
 # -------------------------
 # History (quick view)
 # -------------------------
 @app.get("/history")
+@cached_page
 def history():
-    games = q_all("""
+    # ?season=YYYY ends the list at that season's last game (an archived one is read from its file)
+    season = request.args.get("season", type=int)
+    archived = q_all("SELECT season, games FROM archives ORDER BY season DESC")
+    sql = """
         SELECT g.id, g.game_type, g.mode, g.started_at, g.ended_at,
                ta.name AS teamA, tb.name AS teamB,
                wp.name AS winner_player,
                wt.name AS winner_team
-        FROM games g
+        FROM {db}games g
         LEFT JOIN teams ta ON ta.id=g.team_a_id
         LEFT JOIN teams tb ON tb.id=g.team_b_id
         LEFT JOIN players wp ON wp.id=g.winner_player_id
         LEFT JOIN teams wt ON wt.id=g.winner_team_id
+        WHERE g.started_at < ?
         ORDER BY g.started_at DESC
         LIMIT 30
-    """)
+    """
+    until = season_start(season + 1) if season else "9999"
+    if season and season_start(season) < ACTIVE["since"]:
+        games = q_archive(season, sql.format(db="arch."), (until,))
+    else:
+        games = q_all(sql.format(db=""), (until,))
     return render_template_string(f"""
     {BASE_CSS}
     <div class="wrap">
       <div class="card">
-        <div class="big">Game History</div>
-        <div class="muted"><a href="/">Home</a></div>
+        <div class="big">Game History{f" · {season}" if season else ""}</div>
+        <div class="muted"><a href="/">Home</a>{" · <a href='/history'>latest</a>" if season else ""}
+          {"".join(f" · <a href='/history?season={a['season']}'>{a['season']}</a> ({a['games']} games, archived)" for a in archived)}</div>
       </div>
       <div class="card">
         <table>
@@ -812,9 +1767,212 @@ def history():
     </div>
     """)
 
+# -------------------------
+# Leaderboards and stats (from the daily rollups)
+# -------------------------
+@app.get("/leaderboard")
+@cached_page
+def leaderboard():
+    try:
+        rng = stats_range(request.args)
+    except ValueError:
+        return "Bad date range", 400
+    players = rank_table("player", rng)
+    teams = rank_table("team", rng)
+    span = q_one("SELECT (SELECT MIN(month) FROM player_monthly) AS lo, (SELECT MAX(month) FROM player_monthly) AS hi")
+    seasons = range(int(span["hi"][:4]), int(span["lo"][:4]) - 1, -1) if span["lo"] else []
+    rows = lambda items: ''.join([f"<tr><td>{i + 1}</td><td><b>{r['name']}</b></td><td>{r['wins']}</td><td>{r['games']}</td><td>{round(100 * r['wins'] / r['games'])}%</td></tr>" for i, r in enumerate(items)])
+    return render_template_string(f"""
+    {BASE_CSS}
+    <div class="wrap">
+      <div class="card">
+        <div class="big">{rng['label']}</div>
+        <div class="muted"><a href="/">Home</a> · {rng['from']} to {rng['to']}</div>
+        <div class="row" style="margin-top:10px">
+          {''.join([f"<a class='pill' href='/leaderboard?season={s}'>{s}</a>" for s in seasons])}
+        </div>
+      </div>
+      <div class="card">
+        <div class="pill">Players</div>
+        <table>
+          <thead><tr><th>#</th><th>Name</th><th>Wins</th><th>Games</th><th>Win %</th></tr></thead>
+          <tbody>{rows(players)}</tbody>
+        </table>
+      </div>
+      <div class="card">
+        <div class="pill">Teams</div>
+        <table>
+          <thead><tr><th>#</th><th>Team</th><th>Wins</th><th>Games</th><th>Win %</th></tr></thead>
+          <tbody>{rows(teams)}</tbody>
+        </table>
+      </div>
+    </div>
+    """)
+
+@app.get("/stats/players")
+def stats_players():
+    try:
+        rng = stats_range(request.args)
+    except ValueError:
+        return jsonify({"error": "bad date range"}), 400
+    return jsonify({"from": rng["from"], "to": rng["to"], "label": rng["label"],
+                    "players": table_json(rank_table("player", rng))})
+
+@app.get("/stats/teams")
+def stats_teams():
+    try:
+        rng = stats_range(request.args)
+    except ValueError:
+        return jsonify({"error": "bad date range"}), 400
+    return jsonify({"from": rng["from"], "to": rng["to"], "label": rng["label"],
+                    "teams": table_json(rank_table("team", rng))})
+
+@app.get("/stats/<any(player, team):kind>/<int:item_id>")
+def stats_series(kind, item_id):
+    """Games and wins for one player or team per day, week, month or season (?bucket=)."""
+    bucket = BUCKETS.get(request.args.get("bucket", "month"))
+    try:
+        rng = stats_range(request.args)
+    except ValueError:
+        bucket = None
+    if bucket is None:
+        return jsonify({"error": "bad bucket or date range"}), 400
+    rows = q_all(f"SELECT day, games, wins FROM {kind}_daily WHERE {kind}_id=? AND day BETWEEN ? AND ? ORDER BY day",
+                 (item_id, rng["from"], rng["to"]))
+    series = {}
+    for r in rows:
+        b = series.setdefault(bucket(r["day"]), {"games": 0, "wins": 0})
+        b["games"] += r["games"]
+        b["wins"] += r["wins"]
+    return jsonify({"from": rng["from"], "to": rng["to"], "label": rng["label"],
+                    "series": [{"bucket": k, **v} for k, v in series.items()]})
+
+# -------------------------
+# Jobs API
+# -------------------------
+@app.post("/jobs")
+@admin_only
+def jobs_submit():
+    body = request.get_json(silent=True) or {}
+    kind = body.get("kind")
+    params = body.get("params") or {}
+    if kind not in JOB_KINDS or not isinstance(params, dict):
+        return jsonify({"error": "unknown job kind", "kinds": sorted(JOB_KINDS)}), 400
+    try:
+        priority = int(body.get("priority") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+    if q_one("SELECT COUNT(*) AS n FROM jobs WHERE status='queued'")["n"] >= JOB_QUEUE_MAX:
+        return jsonify({"error": "job queue is full"}), 429
+    job_id = submit_job(kind, params, priority)
+    return jsonify({"id": job_id, "status": "queued", "url": url_for("jobs_status", job_id=job_id)}), 202
+
+@app.get("/jobs")
+@admin_only
+def jobs_list():
+    rows = q_all("SELECT * FROM jobs ORDER BY id DESC LIMIT 50")
+    return jsonify({"kinds": sorted(JOB_KINDS), "jobs": [job_json(r) for r in rows]})
+
+@app.get("/jobs/<int:job_id>")
+@admin_only
+def jobs_status(job_id):
+    row = q_one("SELECT * FROM jobs WHERE id=?", (job_id,))
+    if not row:
+        return jsonify({"error": "no such job"}), 404
+    return jsonify(job_json(row))
+
+@app.post("/jobs/<int:job_id>/cancel")
+@admin_only
+def jobs_cancel(job_id):
+    # a queued job is cancelled here; a running one stops at its next progress report
+    exec_sql("""UPDATE jobs SET cancel=1,
+                status=CASE WHEN status='queued' THEN 'cancelled' ELSE status END,
+                finished_at=CASE WHEN status='queued' THEN ? ELSE finished_at END
+                WHERE id=? AND status IN ('queued', 'running')""", (now_iso(), job_id))
+    return jobs_status(job_id)
+
+@app.get("/jobs/<int:job_id>/download")
+@admin_only
+def jobs_download(job_id):
+    row = q_one("SELECT status, result FROM jobs WHERE id=?", (job_id,))
+    result = json.loads(row["result"]) if row and row["result"] else {}
+    if not row or row["status"] != "done" or "file" not in result:
+        return "Not found", 404
+    return send_from_directory(JOB_DIR, result["file"], as_attachment=True)
+
+@app.get("/backups")
+@admin_only
+def backups_list():
+    files = [{"file": f, "bytes": os.path.getsize(os.path.join(BACKUP_DIR, f))} for f in reversed(backup_files())]
+    last = q_one("SELECT * FROM jobs WHERE kind='backup' ORDER BY id DESC LIMIT 1")
+    return jsonify({"dir": BACKUP_DIR, "every_hours": BACKUP_EVERY, "keep": BACKUP_KEEP, "backups": files,
+                    "last_job": job_json(last) if last else None})
+
+# -------------------------
+# Profiling admin
+# -------------------------
+@app.get("/admin/profile")
+@admin_only
+def profile_status():
+    with PROFILES_LOCK:
+        routes = {ep: {"requests": p["requests"],
+                       "avg_ms": round(1000 * p["seconds"] / p["requests"], 2) if p["requests"] else None,
+                       "samples": p["samples"],
+                       "collapsed": url_for("profile_collapsed", route=ep) if p["stacks"] else None,
+                       "pstats": url_for("profile_pstats", route=ep) if p["stats"] else None}
+                  for ep, p in sorted(PROFILES.items())}
+    return jsonify({**PROFILE, "routes": routes})
+
+@app.post("/admin/profile")
+@admin_only
+def profile_settings():
+    body = request.get_json(silent=True) or {}
+    try:
+        rate = float(body.get("rate", PROFILE["rate"]))
+        interval = float(body.get("interval", PROFILE["interval"]))
+    except (TypeError, ValueError):
+        return jsonify({"error": "rate and interval must be numbers"}), 400
+    mode = body.get("mode", PROFILE["mode"])
+    if not 0 <= rate <= 1 or interval <= 0 or mode not in ("sample", "cprofile"):
+        return jsonify({"error": "rate is 0..1, interval > 0, mode is sample or cprofile"}), 400
+    PROFILE.update(rate=rate, mode=mode, interval=interval)
+    if body.get("reset"):
+        with PROFILES_LOCK:
+            PROFILES.clear()
+    return profile_status()
+
+@app.get("/admin/profile/<route>.collapsed")
+@admin_only
+def profile_collapsed(route):
+    # "frame;frame;frame count" lines, for flamegraph.pl or speedscope
+    with PROFILES_LOCK:
+        prof = PROFILES.get(route)
+        lines = [f"{stack} {n}\n" for stack, n in prof["stacks"].most_common()] if prof else []
+    if not lines:
+        return "No samples for that endpoint", 404
+    return app.response_class("".join(lines), mimetype="text/plain",
+                              headers={"Content-Disposition": f"attachment; filename={route}.collapsed"})
+
+@app.get("/admin/profile/<route>.pstats")
+@admin_only
+def profile_pstats(route):
+    # same format as Stats.dump_stats: python -m pstats <file>
+    with PROFILES_LOCK:
+        prof = PROFILES.get(route)
+        data = marshal.dumps(prof["stats"].stats) if prof and prof["stats"] else None
+    if data is None:
+        return "No cProfile data for that endpoint", 404
+    return app.response_class(data, mimetype="application/octet-stream",
+                              headers={"Content-Disposition": f"attachment; filename={route}.pstats"})
+
 # -------------------------
 # Startup
 # -------------------------
 if __name__ == "__main__":
     init_db()
+    if sys.argv[1:2] == ["job"]:
+        # python darts_hub.py job archive_seasons '{"before": 2025}': one job, here and now
+        out = run_job_here(sys.argv[2], json.loads(sys.argv[3]) if len(sys.argv) > 3 else {})
+        print(json.dumps(out, indent=2))
+        sys.exit(0 if out["status"] == "done" else 1)
     app.run(host="0.0.0.0", port=5000, debug=False)
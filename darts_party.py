@@ -1,412 +1,1290 @@
 import os
 APP_DB = os.environ.get("DB_PATH", "darts.db")
-
-from flask import Flask, request, jsonify, render_template_string
-import time, random
+CHECKOUT_CACHE = os.environ.get("CHECKOUT_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkouts.json"))
+
+from flask import Flask, request, jsonify, abort, g
+from json.encoder import encode_basestring_ascii as js_str
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from itertools import combinations_with_replacement
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor
+import time, random, json, pickle, queue, sqlite3, threading, re, zlib, gzip, hashlib
+import asyncio, multiprocessing, io, contextvars
+
+try:
+    import numpy as np
+except ImportError:  # win probabilities are optional
+    np = None
+try:
+    import brotli
+except ImportError:  # assets are then only offered gzipped
+    brotli = None
 
 app = Flask(__name__)
 
 CRICKET_NUMS = [20, 19, 18, 17, 16, 15, "BULL"]
+CRICKET_KEYS = [str(n) for n in CRICKET_NUMS]
+CRICKET_INDEX = {k: i for i, k in enumerate(CRICKET_KEYS)}
+CRICKET_VALUES = [25 if n == "BULL" else n for n in CRICKET_NUMS]
 
-STATE = {
-    "mode": "ffa",          # "ffa" | "teams" | "championship"
-    "game": None,           # "501" | "cricket" | "atc" | "leaderboard" | "match"
-    "players": [],          # used for ffa
-    "current": 0,
-    "started": False,
-    "created_at": time.time(),
-    "settings": {
-        "501_start": 501,
-        "501_double_out": False,
-        "match_start": 301,         # used for championship matches
-    },
-    "teams": {              # used for teams mode
-        "A": [],
-        "B": [],
-        "team_current": 0,  # 0..(max roster-1) to rotate A[i],B[i]
-        "team_turn": "A",   # "A" or "B"
-    },
-    "tournament": {         # used for championship mode
-        "players": [],
-        "round": 1,
-        "matches": [],      # list of {"p1","p2","winner":None}
-        "current_match": 0,
-        "champion": None,
-    },
-    "data": {}              # per-game data
-}
+SIDES = ("A", "B")
+SIDE_JSON = {"A": '"A"', "B": '"B"'}
+BYE = 0                     # reserved player id, named "BYE" in every name table
+BRACKETS = ["single", "double", "round_robin", "swiss"]
+LEAGUES = ("round_robin", "swiss")
+X01_START_MAX = 1001        # highest x01 start (match starts stop at 501)
+
+# ---------------------------
+# State model
+# Game state works on integer player ids; display names live in the
+# NameTable (pre-encoded as JSON) and are only looked up when the /state
+# payload is written. Each class writes its own JSON fragment.
+# ---------------------------
+def js_val(v):
+    if v is None: return "null"
+    if v is True: return "true"
+    if v is False: return "false"
+    if isinstance(v, str): return js_str(v)
+    return str(v)
+
+def js_list(ids, js):
+    return "[" + ",".join([js[i] for i in ids]) + "]"
+
+def js_map(d, kj, conv=str):
+    return "{" + ",".join([kj[k] + ":" + conv(v) for k, v in d.items()]) + "}"
+
+class NameTable:
+    __slots__ = ("names", "json", "ids")
+
+    def __init__(self):
+        self.names = ["BYE"]
+        self.json = [js_str("BYE")]
+        self.ids = {"BYE": BYE}
+
+    def intern(self, name):
+        pid = self.ids.get(name)
+        if pid is None:
+            pid = len(self.names)
+            self.names.append(name)
+            self.json.append(js_str(name))
+            self.ids[name] = pid
+        return pid
+
+    def intern_all(self, names):
+        return [self.intern(n) for n in names]
+
+class Settings:
+    __slots__ = ("x01_start", "double_out", "match_start", "boards", "bracket", "seeded", "swiss_rounds")
+
+    def __init__(self):
+        self.x01_start = 501
+        self.double_out = False
+        self.match_start = 301      # used for championship matches
+        self.boards = 1             # boards available for championship matches
+        self.bracket = "single"     # "single" | "double" elimination, "round_robin" | "swiss" league
+        self.seeded = False         # True: player list order is the seeding, else shuffled
+        self.swiss_rounds = 0       # 0: enough rounds to separate a winner (log2 of the field)
+
+    def to_json(self):
+        return ('{"501_start":%d,"501_double_out":%s,"match_start":%d,"boards":%d,"bracket":%s,"seeded":%s,"swiss_rounds":%d}'
+                % (self.x01_start, js_val(self.double_out), self.match_start, self.boards,
+                   js_str(self.bracket), js_val(self.seeded), self.swiss_rounds))
+
+class Teams:
+    __slots__ = ("A", "B", "team_current", "team_turn")
+
+    def __init__(self):
+        self.A = []
+        self.B = []
+        self.team_current = 0       # 0..(max roster-1) to rotate A[i],B[i]
+        self.team_turn = "A"        # "A" or "B"
+
+    def to_json(self, js):
+        return ('{"A":%s,"B":%s,"team_current":%d,"team_turn":%s}'
+                % (js_list(self.A, js), js_list(self.B, js), self.team_current, SIDE_JSON[self.team_turn]))
+
+def js_pid(pid, js):
+    return "null" if pid is None else js[pid]
+
+class Match:
+    __slots__ = ("p1", "p2", "winner", "stage", "next", "slot", "loser_next", "loser_slot", "board")
+
+    def __init__(self, p1, p2, stage):
+        self.p1 = p1                # None until the feeder match has a result
+        self.p2 = p2
+        self.winner = None
+        self.stage = stage          # index into Tournament.stages
+        self.next = None            # index of the match the winner moves on to
+        self.slot = 0               # 0 -> next.p1, 1 -> next.p2
+        self.loser_next = None      # double elimination: where the loser drops to
+        self.loser_slot = 0
+        self.board = None           # board index while (or after) being played
+
+    def to_json(self, js):
+        return ('{"p1":%s,"p2":%s,"winner":%s,"stage":%d,"board":%s}'
+                % (js_pid(self.p1, js), js_pid(self.p2, js), js_pid(self.winner, js),
+                   self.stage, js_val(self.board)))
+
+MATCH_FIELDS = attrgetter(*Match.__slots__)
+
+class Board:
+    __slots__ = ("match", "data", "version")
+
+    def __init__(self, match, data):
+        self.match = match          # index into Tournament.matches
+        self.data = data            # MatchData for the live scores
+        self.version = STATE.version    # last action that touched this board
+
+    def __setstate__(self, state):
+        self.version = 0
+        for k, v in state[1].items():
+            setattr(self, k, v)
+
+    def to_json(self, js, matches):
+        return ('{"match":%d,"m":%s,"data":%s}'
+                % (self.match, matches[self.match].to_json(js), self.data.to_json(js)))
+
+class Standing:
+    __slots__ = ("pid", "seed", "played", "wins", "losses", "byes", "opps")
+
+    def __init__(self, pid, seed):
+        self.pid = pid
+        self.seed = seed
+        self.played = 0
+        self.wins = 0
+        self.losses = 0
+        self.byes = 0               # swiss byes count as a win
+        self.opps = set()           # everyone already played, for rematch checks
+
+    @property
+    def points(self):
+        return self.wins + self.byes
+
+    def to_json(self, js, rank, buchholz):
+        return ('{"rank":%d,"player":%s,"played":%d,"wins":%d,"losses":%d,"byes":%d,"points":%d,"buchholz":%d}'
+                % (rank, js[self.pid], self.played, self.wins, self.losses, self.byes, self.points, buchholz))
+
+class Tournament:
+    __slots__ = ("players", "format", "stage", "stages", "matches", "left", "final", "ready", "busy",
+                 "boards", "table", "rounds", "champion")
+
+    def __init__(self, players=None):
+        self.players = players or []    # in seed order
+        self.format = "single"      # copied from settings when the bracket is built
+        self.stage = 0              # lowest stage that still has unfinished matches
+        self.stages = []            # (name, first match, end) per round, in build order
+        self.matches = []           # whole bracket, stage by stage
+        self.left = []              # unfinished matches per stage
+        self.final = None           # double elimination grand final (may need a reset match)
+        self.ready = deque()        # match indices with both players known, waiting for a board
+        self.busy = set()           # players currently at a board
+        self.boards = []            # Board or None (idle) per board
+        self.table = {}             # round robin / swiss: Standing per player id
+        self.rounds = 0             # swiss: rounds to play
+        self.champion = None
+
+    # snapshots: a big bracket is thousands of Match objects, which pickle far
+    # faster (both ways) as plain tuples
+    def __getstate__(self):
+        state = {k: getattr(self, k) for k in self.__slots__}
+        state["matches"] = [MATCH_FIELDS(m) for m in self.matches]
+        return state
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        new = Match.__new__
+        matches = self.matches = []
+        for fields in state["matches"]:
+            m = new(Match)
+            m.p1, m.p2, m.winner, m.stage, m.next, m.slot, m.loser_next, m.loser_slot, m.board = fields
+            matches.append(m)
+
+    def stage_json(self, i):
+        name, start, end = self.stages[i]
+        return '{"name":%s,"size":%d,"left":%d}' % (js_str(name), end - start, self.left[i])
+
+    def view_json(self, js, i):
+        # one round of the bracket, without touching the other stages
+        name, start, end = self.stages[i]
+        return ('{"stage":%d,"name":%s,"first":%d,"matches":[%s]}'
+                % (i, js_str(name), start, ",".join([m.to_json(js) for m in self.matches[start:end]])))
+
+    def to_json(self, js):
+        return ('{"entrants":%d,"format":%s,"stage":%d,"stages":[%s],"boards":[%s],"waiting":%d,"champion":%s}'
+                % (len(self.players), js_str(self.format), self.stage,
+                   ",".join([self.stage_json(i) for i in range(len(self.stages))]),
+                   ",".join(["null" if b is None else b.to_json(js, self.matches) for b in self.boards]),
+                   len(self.ready), js_pid(self.champion, js)))
+
+# Per-game data. Keys are player ids (ffa/championship) or sides "A"/"B" (teams).
+class GameData:
+    __slots__ = ("team", "winner")
+
+    def __init__(self, team=False):
+        self.team = team
+        self.winner = None
+
+    def key_json(self, js):
+        return SIDE_JSON if self.team else js
+
+    def winner_json(self, js):
+        if self.winner is None:
+            return "null"
+        return js_str(f"Team {self.winner}") if self.team else js[self.winner]
+
+    def to_json(self, js):
+        return "{}" if self.winner is None else '{"winner":%s}' % self.winner_json(js)
+
+class X01Data(GameData):
+    __slots__ = ("scores", "last")
+
+    def __init__(self, keys, start, team=False):
+        self.team = team
+        self.winner = None
+        self.scores = dict.fromkeys(keys, start)
+        self.last = dict.fromkeys(keys)
+
+    def fields_json(self, js):
+        kj = self.key_json(js)
+        return ('"%s":%s,"last":%s,"winner":%s'
+                % ("team_scores" if self.team else "scores", js_map(self.scores, kj),
+                   js_map(self.last, kj, js_val), self.winner_json(js)))
+
+    def to_json(self, js):
+        return "{" + self.fields_json(js) + "}"
+
+class MatchData(X01Data):
+    __slots__ = ("match_start", "turn")
+
+    def __init__(self, p1, p2, start):
+        X01Data.__init__(self, (p1, p2), start)
+        self.match_start = start
+        self.turn = p1              # alternates within match
+
+    def to_json(self, js):
+        return ('{%s,"match_start":%d,"turn":%s}'
+                % (self.fields_json(js), self.match_start, "null" if self.turn is None else js[self.turn]))
+
+class RankNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels   # level-0 steps to next[level]
+
+class RankedList:
+    # Indexable skip list of unique, comparable keys: insert, remove, rank
+    # of a key and the key at a rank are all O(log n) expected.
+    __slots__ = ("head", "tail", "size", "top", "rng")
+    LEVELS = 20                     # plenty for a million entries
+
+    def __init__(self):
+        self.tail = RankNode((float("inf"),), 0)
+        self.head = RankNode(None, self.LEVELS)
+        self.head.next = [self.tail] * self.LEVELS
+        self.size = 0
+        self.top = 1                    # levels in use; the head skips straight to the tail above
+        self.rng = random.Random(0)     # level coin flips; keeps RNG free for brackets
+
+    def __len__(self):
+        return self.size
+
+    def find(self, key):
+        # last node before key on every level, and its rank
+        chain = [self.head] * self.LEVELS
+        steps = [0] * self.LEVELS
+        node, pos = self.head, 0
+        for lvl in range(self.top - 1, -1, -1):
+            while node.next[lvl].key < key:
+                pos += node.width[lvl]
+                node = node.next[lvl]
+            chain[lvl], steps[lvl] = node, pos
+        return chain, steps
+
+    def insert(self, key):
+        chain, steps = self.find(key)
+        levels = 1
+        while levels < self.LEVELS and self.rng.random() < 0.5:
+            levels += 1
+        self.top = max(self.top, levels)
+        node = RankNode(key, levels)
+        pos = steps[0] + 1
+        for lvl in range(levels):
+            prev = chain[lvl]
+            node.next[lvl] = prev.next[lvl]
+            prev.next[lvl] = node
+            node.width[lvl] = prev.width[lvl] - (pos - steps[lvl]) + 1
+            prev.width[lvl] = pos - steps[lvl]
+        for lvl in range(levels, self.LEVELS):
+            chain[lvl].width[lvl] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self.find(key)
+        node = chain[0].next[0]
+        if node.key != key:
+            raise KeyError(key)
+        for lvl in range(self.LEVELS):
+            prev = chain[lvl]
+            if prev.next[lvl] is node:
+                prev.width[lvl] += node.width[lvl] - 1
+                prev.next[lvl] = node.next[lvl]
+            else:
+                prev.width[lvl] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        # 0-based position of key (or where it would go)
+        return self.find(key)[1][0]
+
+    def window(self, offset, limit):
+        node, i = self.head, offset + 1
+        for lvl in range(self.top - 1, -1, -1):
+            while node.width[lvl] <= i and node.next[lvl] is not self.tail:
+                i -= node.width[lvl]
+                node = node.next[lvl]
+        out = []
+        if i:
+            return out      # offset is past the end
+        while node is not self.tail and len(out) < limit:
+            out.append(node.key)
+            node = node.next[0]
+        return out
+
+class LeaderboardData(GameData):
+    __slots__ = ("points", "order", "ranked")
+
+    def __init__(self, keys, team=False):
+        self.team = team
+        self.winner = None
+        self.points = dict.fromkeys(keys, 0)
+        # ffa: players kept ranked by (-points, seat) so the display can page through them
+        self.order = {k: i for i, k in enumerate(keys)}
+        self.ranked = None if team else self.build_ranked()
+
+    def build_ranked(self):
+        ranked = RankedList()
+        for k, i in self.order.items():
+            ranked.insert((-self.points[k], i, k))
+        return ranked
+
+    def add(self, key, points):
+        old = self.points[key]
+        self.points[key] = old + points
+        if self.ranked is not None and points:
+            i = self.order[key]
+            self.ranked.remove((-old, i, key))
+            self.ranked.insert((-old - points, i, key))
+
+    # snapshots: the skip list is a long chain of nodes, so rebuild it instead
+    def __getstate__(self):
+        return self.team, self.winner, self.points, self.order
+
+    def __setstate__(self, state):
+        self.team, self.winner, self.points, self.order = state
+        self.ranked = None if self.team else self.build_ranked()
+
+    def to_json(self, js):
+        return '{"%s":%s}' % ("team_points" if self.team else "points", js_map(self.points, self.key_json(js)))
+
+class AtcData(GameData):
+    __slots__ = ("target",)
+
+    def __init__(self, keys, team=False):
+        self.team = team
+        self.winner = None
+        self.target = dict.fromkeys(keys, 1)
+
+    def to_json(self, js):
+        return ('{"%s":%s,"winner":%s}'
+                % ("team_target" if self.team else "target", js_map(self.target, self.key_json(js)), self.winner_json(js)))
+
+MARKS_JSON = "{" + ",".join(['"%s":%%d' % k for k in CRICKET_KEYS]) + "}"
+
+def js_marks(m):
+    return MARKS_JSON % tuple(m)
+
+class CricketData(GameData):
+    __slots__ = ("marks", "points")
+
+    def __init__(self, keys, team=False):
+        self.team = team
+        self.winner = None
+        self.marks = {k: [0] * len(CRICKET_NUMS) for k in keys}    # indexed like CRICKET_NUMS
+        self.points = dict.fromkeys(keys, 0)
+
+    def to_json(self, js):
+        kj = self.key_json(js)
+        return ('{"marks":%s,"points":%s,"winner":%s}'
+                % (js_map(self.marks, kj, js_marks), js_map(self.points, kj), self.winner_json(js)))
+
+class TurnHistory:
+    __slots__ = ("points", "co_tries", "co_hits")
+
+    def __init__(self):
+        self.points = deque(maxlen=200)     # recent 501/match turn totals
+        self.co_tries = 0                   # turns started on a finishable score
+        self.co_hits = 0                    # ... that finished
+
+class PartyState:
+    __slots__ = ("mode", "game", "players", "current", "started", "created_at",
+                 "settings", "teams", "tournament", "data", "names", "history", "turns",
+                 "version", "turn_version")
+
+    def __init__(self):
+        self.mode = "ffa"           # "ffa" | "teams" | "championship"
+        self.game = None            # "501" | "cricket" | "atc" | "leaderboard" | "match"
+        self.players = []           # player ids, used for ffa
+        self.current = 0
+        self.started = False
+        self.created_at = time.time()
+        self.settings = Settings()
+        self.teams = Teams()                # used for teams mode
+        self.tournament = Tournament()      # used for championship mode
+        self.data = GameData()              # per-game data
+        self.names = NameTable()
+        self.history = {}                   # TurnHistory per player id, for win probabilities
+        self.turns = 0                      # x01 turns recorded this session
+        self.version = 0                    # bumped by every action
+        self.turn_version = 0               # last action that could change whose turn it is
+
+    def __setstate__(self, state):
+        self.version = self.turn_version = 0    # snapshots from before versions
+        for k, v in state[1].items():
+            setattr(self, k, v)
+
+    def to_json(self):
+        js = self.names.json
+        return ('{"mode":%s,"game":%s,"players":%s,"current":%d,"started":%s,"settings":%s,'
+                '"teams":%s,"tournament":%s,"data":%s,"turn_label":%s,"version":%d}'
+                % (js_str(self.mode), js_val(self.game), js_list(self.players, js), self.current,
+                   js_val(self.started), self.settings.to_json(), self.teams.to_json(js),
+                   self.tournament.to_json(js), self.data.to_json(js), js_str(current_player_label()),
+                   self.version))
+
+def room_part(get):
+    # stands for get(the current room), so the engine keeps reading STATE, RNG
+    # and ROOM as globals while each thread serves its own room (see enter_room)
+    class RoomPart:
+        __slots__ = ()
+
+        def __getattribute__(self, name):
+            return getattr(get(), name)
+
+        def __setattr__(self, name, value):
+            setattr(get(), name, value)
+
+    return RoomPart()
+
+def current_state():
+    # the hot paths take this once into a local rather than going through STATE
+    return CURRENT_ROOM.get().state
+
+STATE = room_part(current_state)
+# bracket shuffles draw from here so a restored session replays them exactly
+RNG = room_part(lambda: CURRENT_ROOM.get().rng)
 
 # ---------------------------
 # Helpers
 # ---------------------------
 def reset_state():
-    STATE["mode"] = "ffa"
-    STATE["game"] = None
-    STATE["players"] = []
-    STATE["current"] = 0
-    STATE["started"] = False
-    STATE["settings"] = {"501_start": 501, "501_double_out": False, "match_start": 301}
-    STATE["teams"] = {"A": [], "B": [], "team_current": 0, "team_turn": "A"}
-    STATE["tournament"] = {"players": [], "round": 1, "matches": [], "current_match": 0, "champion": None}
-    STATE["data"] = {}
-    STATE["created_at"] = time.time()
+    state = current_state()
+    version = state.version     # stays monotonic so stale controllers are still caught
+    state.__init__()
+    state.version = state.turn_version = version
 
 def safe_int(val, default=0):
     try: return int(val)
     except: return default
 
 def ensure_players():
-    if STATE["mode"] == "ffa":
-        if not STATE["players"]:
-            STATE["players"] = ["Player 1", "Player 2"]
-    elif STATE["mode"] == "teams":
-        if not STATE["teams"]["A"]:
-            STATE["teams"]["A"] = [f"A{i+1}" for i in range(10)]
-        if not STATE["teams"]["B"]:
-            STATE["teams"]["B"] = [f"B{i+1}" for i in range(10)]
-    elif STATE["mode"] == "championship":
-        if not STATE["tournament"]["players"]:
-            STATE["tournament"]["players"] = [f"P{i+1}" for i in range(8)]
+    intern_all = STATE.names.intern_all
+    if STATE.mode == "ffa":
+        if not STATE.players:
+            STATE.players = intern_all(["Player 1", "Player 2"])
+    elif STATE.mode == "teams":
+        if not STATE.teams.A:
+            STATE.teams.A = intern_all([f"A{i+1}" for i in range(10)])
+        if not STATE.teams.B:
+            STATE.teams.B = intern_all([f"B{i+1}" for i in range(10)])
+    elif STATE.mode == "championship":
+        if not STATE.tournament.players:
+            STATE.tournament.players = intern_all([f"P{i+1}" for i in range(8)])
 
 def current_player_label():
     ensure_players()
-    if STATE["mode"] == "ffa":
-        return STATE["players"][STATE["current"] % len(STATE["players"])]
-    if STATE["mode"] == "teams":
-        A = STATE["teams"]["A"]; B = STATE["teams"]["B"]
-        idx = STATE["teams"]["team_current"] % max(len(A), len(B))
-        turn = STATE["teams"]["team_turn"]
-        roster = A if turn == "A" else B
-        if idx >= len(roster):  # if uneven rosters, wrap
-            idx = idx % len(roster)
-        return f"Team {turn}: {roster[idx]}"
-    # championship shows current match
-    t = STATE["tournament"]
-    if t["champion"]:
-        return f"Champion: {t['champion']}"
-    if not t["matches"]:
+    nm = STATE.names.names
+    if STATE.mode == "ffa":
+        return nm[STATE.players[STATE.current % len(STATE.players)]]
+    if STATE.mode == "teams":
+        return f"Team {STATE.teams.team_turn}: {nm[teams_current_thrower()]}"
+    # championship shows the matches on the boards
+    t = STATE.tournament
+    if t.champion is not None:
+        return f"Champion: {nm[t.champion]}"
+    if not t.matches:
         return "No matches"
-    m = t["matches"][t["current_match"]]
-    return f"Match: {m['p1']} vs {m['p2']}"
+    live = [f"Board {i+1}: {nm[t.matches[b.match].p1]} vs {nm[t.matches[b.match].p2]}"
+            for i, b in enumerate(t.boards) if b is not None]
+    return " • ".join(live) or "Waiting for matches"
 
 def advance_turn():
-    if STATE["mode"] == "ffa":
-        if STATE["players"]:
-            STATE["current"] = (STATE["current"] + 1) % len(STATE["players"])
+    state = current_state()
+    if state.mode == "ffa":
+        if state.players:
+            state.current = (state.current + 1) % len(state.players)
         return
 
-    if STATE["mode"] == "teams":
+    if state.mode == "teams":
         # alternate A/B each turn, advance player index after both have played
-        turn = STATE["teams"]["team_turn"]
-        if turn == "A":
-            STATE["teams"]["team_turn"] = "B"
+        teams = state.teams
+        if teams.team_turn == "A":
+            teams.team_turn = "B"
         else:
-            STATE["teams"]["team_turn"] = "A"
-            STATE["teams"]["team_current"] = STATE["teams"]["team_current"] + 1
+            teams.team_turn = "A"
+            teams.team_current += 1
         return
 
 def init_game(game):
     ensure_players()
-    STATE["game"] = game
-    STATE["started"] = True
-    STATE["data"] = {}
-
-    if STATE["mode"] == "ffa":
-        players = STATE["players"]
-        if game == "501":
-            start = int(STATE["settings"].get("501_start", 501))
-            STATE["data"] = {"scores": {p: start for p in players}, "last": {p: None for p in players}, "winner": None}
-        elif game == "leaderboard":
-            STATE["data"] = {"points": {p: 0 for p in players}}
-        elif game == "atc":
-            STATE["data"] = {"target": {p: 1 for p in players}, "winner": None}
-        elif game == "cricket":
-            STATE["data"] = {
-                "marks": {p: {str(n): 0 for n in CRICKET_NUMS} for p in players},
-                "points": {p: 0 for p in players},
-                "winner": None
-            }
-
-    if STATE["mode"] == "teams":
-        if game == "501":
-            start = int(STATE["settings"].get("501_start", 501))
-            STATE["data"] = {"team_scores": {"A": start, "B": start}, "last": {"A": None, "B": None}, "winner": None}
-        elif game == "leaderboard":
-            STATE["data"] = {"team_points": {"A": 0, "B": 0}}
-        elif game == "atc":
-            STATE["data"] = {"team_target": {"A": 1, "B": 1}, "winner": None}
-        elif game == "cricket":
-            STATE["data"] = {
-                "marks": {"A": {str(n): 0 for n in CRICKET_NUMS}, "B": {str(n): 0 for n in CRICKET_NUMS}},
-                "points": {"A": 0, "B": 0},
-                "winner": None
-            }
-        STATE["teams"]["team_current"] = 0
-        STATE["teams"]["team_turn"] = "A"
-
-    if STATE["mode"] == "championship":
+    STATE.game = game
+    STATE.started = True
+    STATE.data = GameData()
+
+    engine = GAMES.get(game)
+    if engine is not None and engine.make is not None and STATE.mode in engine.modes:
+        team = STATE.mode == "teams"
+        STATE.data = engine.make(SIDES if team else STATE.players, team)
+
+    if STATE.mode == "teams":
+        STATE.teams.team_current = 0
+        STATE.teams.team_turn = "A"
+
+    if STATE.mode == "championship":
         # championship uses a special internal "match" 501-style subtract (match_start default 301)
-        start = int(STATE["settings"].get("match_start", 301))
-        STATE["game"] = "match"
-        build_round_if_needed()
-        init_match_scores(start)
+        STATE.game = "match"
+        build_bracket_if_needed()
+        fill_boards()
 
 # ---------------------------
 # Championship logic
+# The whole bracket is laid out when the championship starts; every match
+# knows which match its winner (and, in double elimination, its loser)
+# feeds. A match becomes ready as soon as both of its players are known and
+# is handed to the next free board, so later rounds start while other boards
+# are still finishing earlier ones.
 # ---------------------------
-def build_round_if_needed():
-    t = STATE["tournament"]
-    if t["champion"]:
+def seed_order(size):
+    # seed (0-based) for each first-round slot: 1v8, 4v5, 2v7, 3v6 ... top seeds meet last
+    order = [0]
+    while len(order) < size:
+        n = len(order) * 2
+        order = [x for s in order for x in (s, n - 1 - s)]
+    return order
+
+def add_stage(t, name, pairs):
+    start = len(t.matches)
+    for p1, p2 in pairs:
+        t.matches.append(Match(p1, p2, len(t.stages)))
+    t.stages.append((name, start, len(t.matches)))
+    t.left.append(len(pairs))
+    return range(start, len(t.matches))
+
+def link(t, src, dst, slot):
+    m = t.matches[src]
+    m.next, m.slot = dst, slot
+
+def link_loser(t, src, dst, slot):
+    m = t.matches[src]
+    m.loser_next, m.loser_slot = dst, slot
+
+def build_bracket_if_needed():
+    t = STATE.tournament
+    if t.champion is not None or t.matches:
         return
-    if not t["matches"]:
-        # create first round from t["players"]
-        players = t["players"][:]
-        random.shuffle(players)
-        # if odd, add a BYE
-        if len(players) % 2 == 1:
-            players.append("BYE")
-        matches = []
-        for i in range(0, len(players), 2):
-            matches.append({"p1": players[i], "p2": players[i+1], "winner": None})
-        t["matches"] = matches
-        t["current_match"] = 0
-        t["round"] = 1
-
-def init_match_scores(start):
-    t = STATE["tournament"]
-    m = t["matches"][t["current_match"]]
-    p1, p2 = m["p1"], m["p2"]
-    # BYE auto-advance
-    if p1 == "BYE" and p2 != "BYE":
-        m["winner"] = p2
-        advance_match()
+    players = t.players[:]
+    if not STATE.settings.seeded:
+        RNG.shuffle(players)
+    t.format = STATE.settings.bracket
+    t.stage = 0
+    t.boards = [None] * STATE.settings.boards
+    if t.format in LEAGUES:
+        build_league(t, players)
         return
-    if p2 == "BYE" and p1 != "BYE":
-        m["winner"] = p1
-        advance_match()
+    size = 2
+    while size < len(players):
+        size *= 2
+    # byes fill the bottom seeds, so they land against the top seeds and never meet each other
+    seeds = players + [BYE] * (size - len(players))
+    slots = [seeds[i] for i in seed_order(size)]
+    double = STATE.settings.bracket == "double"
+    prefix = "Winners " if double else "Round "
+
+    wb = [add_stage(t, prefix + "1", [(slots[i], slots[i+1]) for i in range(0, size, 2)])]
+    while len(wb[-1]) > 1:
+        prev = wb[-1]
+        cur = add_stage(t, prefix + str(len(wb) + 1), [(None, None)] * (len(prev) // 2))
+        for j, f in enumerate(prev):
+            link(t, f, cur[j // 2], j % 2)
+        wb.append(cur)
+    if not double:
+        t.stages[-1] = ("Final",) + t.stages[-1][1:]
+    else:
+        build_losers_bracket(t, wb)
+
+    for i in wb[0]:
+        match_ready(i)
+
+def build_losers_bracket(t, wb):
+    k = len(wb)
+    if k == 1:
+        # two players: the loser of the only match gets a second chance straight away
+        gf = add_stage(t, "Grand Final", [(None, None)])[0]
+        link(t, wb[0][0], gf, 0)
+        link_loser(t, wb[0][0], gf, 1)
+        t.final = gf
         return
+    n = 1
+    drops = wb[0]
+    lb = add_stage(t, "Losers 1", [(None, None)] * (len(drops) // 2))
+    for j, f in enumerate(drops):
+        link_loser(t, f, lb[j // 2], j % 2)
+    for r in range(1, k):
+        # alternate the drop order so early opponents don't meet again straight away
+        drops = list(wb[r])
+        if r % 2:
+            drops.reverse()
+        n += 1
+        minor = add_stage(t, f"Losers {n}", [(None, None)] * len(lb))
+        for j, f in enumerate(lb):
+            link(t, f, minor[j], 0)
+        for j, f in enumerate(drops):
+            link_loser(t, f, minor[j], 1)
+        lb = minor
+        if r < k - 1:
+            n += 1
+            major = add_stage(t, f"Losers {n}", [(None, None)] * (len(lb) // 2))
+            for j, f in enumerate(lb):
+                link(t, f, major[j // 2], j % 2)
+            lb = major
+    gf = add_stage(t, "Grand Final", [(None, None)])[0]
+    link(t, wb[-1][0], gf, 0)
+    link(t, lb[0], gf, 1)
+    t.final = gf
 
-    STATE["data"] = {
-        "match_start": start,
-        "scores": {p1: start, p2: start},
-        "turn": p1,  # alternates within match
-        "winner": None,
-        "last": {p1: None, p2: None}
-    }
-
-def current_match_players():
-    t = STATE["tournament"]
-    if not t["matches"]:
-        return None, None
-    m = t["matches"][t["current_match"]]
-    return m["p1"], m["p2"]
-
-def advance_match():
-    t = STATE["tournament"]
-    # move to next match in round
-    t["current_match"] += 1
-    if t["current_match"] >= len(t["matches"]):
-        # round complete -> build next round from winners
-        winners = [m["winner"] for m in t["matches"] if m["winner"]]
-        if len(winners) == 1:
-            t["champion"] = winners[0]
-            STATE["data"] = {"winner": winners[0]}
-            return
-        t["round"] += 1
-        t["current_match"] = 0
-        # pair winners
-        if len(winners) % 2 == 1:
-            winners.append("BYE")
-        new_matches = []
-        for i in range(0, len(winners), 2):
-            new_matches.append({"p1": winners[i], "p2": winners[i+1], "winner": None})
-        t["matches"] = new_matches
-
-    # init next match
-    start = int(STATE["settings"].get("match_start", 301))
-    init_match_scores(start)
-
-def match_add(score):
-    if STATE["tournament"]["champion"]:
-        return
-    d = STATE["data"]
-    if d.get("winner"):
+# ---------------------------
+# League nights: round robin and swiss
+# Results update each player's Standing as they come in; the table is only
+# sorted when someone asks for standings (or a swiss round needs pairing).
+# ---------------------------
+def round_robin_rounds(players):
+    # circle method: fix the first player, rotate the rest one place per round
+    ps = players + ([BYE] if len(players) % 2 else [])
+    n = len(ps)
+    rounds = []
+    for _ in range(n - 1):
+        rounds.append([(ps[i], ps[n-1-i]) for i in range(n // 2)])
+        ps = [ps[0], ps[-1]] + ps[1:-1]
+    return rounds
+
+def build_league(t, players):
+    t.table = {pid: Standing(pid, seed) for seed, pid in enumerate(players)}
+    if t.format == "round_robin":
+        # every round is known up front; boards take any match whose players are free
+        for r, pairs in enumerate(round_robin_rounds(players)):
+            add_stage(t, f"Round {r+1}", pairs)
+        for i in range(len(t.matches)):
+            match_ready(i)
         return
+    rounds = STATE.settings.swiss_rounds
+    if rounds <= 0:
+        rounds = max(1, (len(players) - 1).bit_length())
+    t.rounds = min(rounds, len(players) - 1 + len(players) % 2)
+    pair_swiss_round(t)
+
+def standings(t):
+    return sorted(t.table.values(), key=lambda r: (-r.points, -buchholz(t, r), r.seed))
+
+def buchholz(t, row):
+    # tie-break: total points of everyone this player has met
+    return sum(t.table[o].points for o in row.opps)
+
+def swiss_pairs(order, table, budget=20000):
+    # pair down the standings avoiding rematches, backtracking a bounded amount
+    steps = [0]
+    def solve(rest):
+        if not rest:
+            return []
+        steps[0] += 1
+        if steps[0] > budget:
+            return None
+        a = rest[0]
+        for j in range(1, len(rest)):
+            b = rest[j]
+            if b in table[a].opps:
+                continue
+            tail = solve(rest[1:j] + rest[j+1:])
+            if tail is not None:
+                return [(a, b)] + tail
+            if steps[0] > budget:
+                return None
+        return None
+    pairs = solve(order)
+    if pairs is None:
+        # no rematch-free pairing found in budget: greedy, rematching only when forced
+        rest = order[:]
+        pairs = []
+        while rest:
+            a = rest.pop(0)
+            j = next((k for k, b in enumerate(rest) if b not in table[a].opps), 0)
+            pairs.append((a, rest.pop(j)))
+    return pairs
+
+def pair_swiss_round(t):
+    order = [r.pid for r in standings(t)]
+    bye = None
+    if len(order) % 2:
+        # lowest-ranked player who hasn't sat out yet gets the bye
+        bye = next((pid for pid in reversed(order) if not t.table[pid].byes), order[-1])
+        order.remove(bye)
+    pairs = swiss_pairs(order, t.table)
+    if bye is not None:
+        pairs.append((bye, BYE))
+    for i in add_stage(t, f"Round {len(t.stages) + 1}", pairs):
+        match_ready(i)
+
+def league_result(t, m, winner, loser):
+    # a dropped match passes BYE both ways and counts for nobody
+    if loser == BYE:
+        if winner != BYE and t.format == "swiss":
+            t.table[winner].byes += 1
+    else:
+        w = t.table[winner]; l = t.table[loser]
+        w.played += 1; w.wins += 1; w.opps.add(loser)
+        l.played += 1; l.losses += 1; l.opps.add(winner)
+    if t.stage == len(t.stages) - 1 and t.left[t.stage] == 0:
+        if t.format == "swiss" and len(t.stages) < t.rounds:
+            pair_swiss_round(t)
+            return
+        t.champion = standings(t)[0].pid
+        STATE.data = GameData()
+        STATE.data.winner = t.champion
 
-    p = d["turn"]
-    score = max(0, min(180, int(score)))
-    start_score = d["scores"][p]
-    new_score = start_score - score
+def match_ready(i):
+    t = STATE.tournament
+    m = t.matches[i]
+    # BYE auto-advance
+    if m.p1 == BYE or m.p2 == BYE:
+        finish_match(i, m.p2 if m.p1 == BYE else m.p1)
+    else:
+        t.ready.append(i)
 
+def place(i, slot, pid):
+    t = STATE.tournament
+    m = t.matches[i]
+    if slot == 0:
+        m.p1 = pid
+    else:
+        m.p2 = pid
+    if m.p1 is not None and m.p2 is not None:
+        match_ready(i)
+
+def finish_match(i, winner, loser=None):
+    # loser defaults to the other player; a dropped match passes BYE both ways
+    t = STATE.tournament
+    m = t.matches[i]
+    if loser is None:
+        loser = m.p2 if winner == m.p1 else m.p1
+    m.winner = winner
+    t.left[m.stage] -= 1
+    while t.stage < len(t.left) - 1 and t.left[t.stage] == 0:
+        t.stage += 1
+    if t.format in LEAGUES:
+        league_result(t, m, winner, loser)
+        return
+    if m.loser_next is not None:
+        place(m.loser_next, m.loser_slot, loser)
+    if m.next is not None:
+        place(m.next, m.slot, winner)
+        return
+    if i == t.final and winner == m.p2 and m.p1 != BYE:
+        # the losers-bracket side took the first grand final: one more match decides it
+        r = add_stage(t, "Final Reset", [(m.p1, m.p2)])[0]
+        t.stage = len(t.stages) - 1
+        match_ready(r)
+        return
+    t.champion = winner
+    STATE.data = GameData()
+    STATE.data.winner = winner
+
+def take_ready(t):
+    # oldest ready match whose players aren't already at a board
+    for k, i in enumerate(t.ready):
+        m = t.matches[i]
+        if m.p1 not in t.busy and m.p2 not in t.busy:
+            del t.ready[k]
+            return i
+    return None
+
+def fill_boards():
+    t = STATE.tournament
+    start = STATE.settings.match_start
+    for b, board in enumerate(t.boards):
+        if board is None and t.ready:
+            i = take_ready(t)
+            if i is None:
+                return
+            m = t.matches[i]
+            m.board = b
+            t.busy.update((m.p1, m.p2))
+            t.boards[b] = Board(i, MatchData(m.p1, m.p2, start))
+
+def resize_boards(n):
+    # boards can be added mid-championship; removing one waits for the next start
+    t = STATE.tournament
+    if t.matches and n > len(t.boards):
+        t.boards.extend([None] * (n - len(t.boards)))
+        fill_boards()
+
+def get_board(board):
+    state = current_state()
+    boards = state.tournament.boards
+    b = safe_int(board, 0)
+    return boards[b] if 0 <= b < len(boards) else None
+
+def droppable(t, i):
+    # a dropped match sends BYE on both ways, so wherever it goes a real player
+    # must already be waiting to walk over; otherwise BYE could meet BYE and go
+    # on through, up to champion. The deciding match can't be dropped at all.
+    m = t.matches[i]
+    if t.format in LEAGUES:
+        return True
+    if m.next is None and m.loser_next is None:
+        return False
+    for dst, slot in ((m.next, m.slot), (m.loser_next, m.loser_slot)):
+        if dst is not None:
+            n = t.matches[dst]
+            if (n.p2 if slot == 0 else n.p1) in (None, BYE):
+                return False
+    return True
+
+def release_board(board):
+    # "Next Match" on a board: a match left unfinished is dropped (nobody advances)
+    t = STATE.tournament
+    b = get_board(board)
+    if b is None:
+        return
+    m = t.matches[b.match]
+    if m.winner is None and not droppable(t, b.match):
+        return jsonify({"ok": False, "error": "Finish this match first: its next opponent isn't waiting yet"}), 400
+    t.boards[safe_int(board, 0)] = None
+    t.busy.difference_update((m.p1, m.p2))
+    if m.winner is None:
+        finish_match(b.match, BYE, BYE)
+    fill_boards()
+
+def record_turn(pid, score, start_score, last_double=None):
+    state = current_state()
+    h = state.history.get(pid)
+    if h is None:
+        h = state.history[pid] = TurnHistory()
+    h.points.append(score)
+    if checkout_routes(start_score, state.settings.double_out, 0)[1]:
+        h.co_tries += 1
+        if score == start_score and not x01_bust(0, score, last_double):
+            h.co_hits += 1
+    state.turns += 1
+
+def x01_bust(new_score, score, last_double=None):
+    # last_double: whether the finishing dart was a double, when the darts are known
+    state = current_state()
     bust = (new_score < 0 or new_score == 1)
-    if new_score == 0 and STATE["settings"].get("501_double_out", False):
-        if not (score == 50 or score % 2 == 0):
+    if new_score == 0 and state.settings.double_out:
+        if not (last_double if last_double is not None else (score == 50 or score % 2 == 0)):
             bust = True
+    return bust
 
-    if bust:
-        d["last"][p] = f"BUST (tried {score})"
+def match_add(score, board=0, last_double=None):
+    state = current_state()
+    t = state.tournament
+    if t.champion is not None:
+        return
+    b = get_board(board)
+    if b is None:
+        return
+    d = b.data
+    if d.winner is not None:
+        return
+
+    p = d.turn
+    score = max(0, min(180, int(score)))
+    new_score = d.scores[p] - score
+    record_turn(p, score, d.scores[p], last_double)
+
+    if x01_bust(new_score, score, last_double):
+        d.last[p] = f"BUST (tried {score})"
     else:
-        d["scores"][p] = new_score
-        d["last"][p] = f"-{score} → {new_score}"
+        d.scores[p] = new_score
+        d.last[p] = f"-{score} → {new_score}"
         if new_score == 0:
-            d["winner"] = p
-            # set match winner
-            t = STATE["tournament"]
-            t["matches"][t["current_match"]]["winner"] = p
+            d.winner = p
+            # set match winner; its next match may now be ready for a free board
+            finish_match(b.match, p)
+            fill_boards()
 
     # alternate turn within match
-    p1, p2 = current_match_players()
-    d["turn"] = p2 if p == p1 else p1
+    m = t.matches[b.match]
+    d.turn = m.p2 if p == m.p1 else m.p1
 
 # ---------------------------
 # Game logic (FFA + Teams)
 # ---------------------------
 def ffa_current_player():
-    return STATE["players"][STATE["current"] % len(STATE["players"])]
+    state = current_state()
+    return state.players[state.current % len(state.players)]
 
 def teams_current_team():
-    return STATE["teams"]["team_turn"]  # "A" or "B"
-
-def handle_501_add(score):
-    if STATE["data"].get("winner"):
+    return STATE.teams.team_turn  # "A" or "B"
+
+def teams_current_thrower():
+    state = current_state()
+    A = state.teams.A; B = state.teams.B
+    idx = state.teams.team_current % max(len(A), len(B))
+    roster = A if state.teams.team_turn == "A" else B
+    if idx >= len(roster):  # if uneven rosters, wrap
+        idx = idx % len(roster)
+    return roster[idx]
+
+def current_key():
+    # data key for whoever is throwing: player id (ffa) or side (teams)
+    state = current_state()
+    return ffa_current_player() if state.mode == "ffa" else teams_current_team()
+
+def handle_501_add(score, last_double=None):
+    state = current_state()
+    d = state.data
+    if d.winner is not None:
         return
     score = max(0, min(180, int(score)))
 
-    if STATE["mode"] == "ffa":
-        p = ffa_current_player()
-        start_score = STATE["data"]["scores"][p]
-        new_score = start_score - score
-
-        bust = (new_score < 0 or new_score == 1)
-        if new_score == 0 and STATE["settings"].get("501_double_out", False):
-            if not (score == 50 or score % 2 == 0):
-                bust = True
+    if state.mode in ("ffa", "teams"):
+        k = current_key()
+        new_score = d.scores[k] - score
+        record_turn(k if state.mode == "ffa" else teams_current_thrower(), score, d.scores[k], last_double)
 
-        if bust:
-            STATE["data"]["last"][p] = f"BUST (tried {score})"
+        if x01_bust(new_score, score, last_double):
+            d.last[k] = f"BUST (tried {score})"
         else:
-            STATE["data"]["scores"][p] = new_score
-            STATE["data"]["last"][p] = f"-{score} → {new_score}"
+            d.scores[k] = new_score
+            d.last[k] = f"-{score} → {new_score}"
             if new_score == 0:
-                STATE["data"]["winner"] = p
-
-        advance_turn()
-        return
-
-    if STATE["mode"] == "teams":
-        team = teams_current_team()
-        start_score = STATE["data"]["team_scores"][team]
-        new_score = start_score - score
-
-        bust = (new_score < 0 or new_score == 1)
-        if new_score == 0 and STATE["settings"].get("501_double_out", False):
-            if not (score == 50 or score % 2 == 0):
-                bust = True
-
-        if bust:
-            STATE["data"]["last"][team] = f"BUST (tried {score})"
-        else:
-            STATE["data"]["team_scores"][team] = new_score
-            STATE["data"]["last"][team] = f"-{score} → {new_score}"
-            if new_score == 0:
-                STATE["data"]["winner"] = f"Team {team}"
+                d.winner = k
 
         advance_turn()
         return
 
 def cricket_hit(number, hits):
-    if STATE["data"].get("winner"):
+    state = current_state()
+    if state.data.winner is not None:
         return
-    num_key = str(number).upper()
+    idx = CRICKET_INDEX.get(str(number).upper())
     hits = max(0, min(3, int(hits)))
-
-    if STATE["mode"] == "ffa":
-        p = ffa_current_player()
-        marks = STATE["data"]["marks"]
-        pts = STATE["data"]["points"]
-        if num_key not in marks[p]:
-            return
-
-        for _ in range(hits):
-            if marks[p][num_key] < 3:
-                marks[p][num_key] += 1
-            else:
-                not_closed = any(marks[o][num_key] < 3 for o in STATE["players"] if o != p)
-                if not_closed:
-                    val = 25 if num_key == "BULL" else int(num_key)
-                    pts[p] += val
-
-        all_closed = all(marks[p][str(n)] >= 3 for n in CRICKET_NUMS)
-        if all_closed:
-            max_other = max(pts[o] for o in STATE["players"] if o != p) if len(STATE["players"]) > 1 else 0
-            if pts[p] >= max_other:
-                STATE["data"]["winner"] = p
-
-        advance_turn()
+    if idx is None:
         return
+    cricket_turn(((idx, hits),))
 
-    if STATE["mode"] == "teams":
-        team = teams_current_team()
-        marks = STATE["data"]["marks"]
-        pts = STATE["data"]["points"]
-        opp = "B" if team == "A" else "A"
-        if num_key not in marks[team]:
-            return
-
-        for _ in range(hits):
-            if marks[team][num_key] < 3:
-                marks[team][num_key] += 1
-            else:
-                if marks[opp][num_key] < 3:
-                    val = 25 if num_key == "BULL" else int(num_key)
-                    pts[team] += val
+def cricket_turn(throws):
+    # throws: (CRICKET_NUMS index, hits) per dart that landed on a cricket number
+    state = current_state()
+    d = state.data
+    if d.winner is not None:
+        return
 
-        all_closed = all(marks[team][str(n)] >= 3 for n in CRICKET_NUMS)
-        if all_closed and pts[team] >= pts[opp]:
-            STATE["data"]["winner"] = f"Team {team}"
+    if state.mode in ("ffa", "teams"):
+        k = current_key()
+        marks = d.marks
+        pts = d.points
+        mine = marks[k]
+        others = [m for o, m in marks.items() if o != k]
+
+        for idx, hits in throws:
+            for _ in range(hits):
+                if mine[idx] < 3:
+                    mine[idx] += 1
+                elif any(m[idx] < 3 for m in others):
+                    pts[k] += CRICKET_VALUES[idx]
+
+            if min(mine) >= 3:
+                max_other = max((pts[o] for o in pts if o != k), default=0)
+                if pts[k] >= max_other:
+                    d.winner = k
+                    break
 
         advance_turn()
         return
 
 def atc_hit(success):
-    if STATE["data"].get("winner"):
-        return
-
-    if STATE["mode"] == "ffa":
-        p = ffa_current_player()
-        if success:
-            t = STATE["data"]["target"][p]
-            if t <= 20:
-                STATE["data"]["target"][p] = t + 1
-            else:
-                STATE["data"]["winner"] = p
-        advance_turn()
+    state = current_state()
+    d = state.data
+    if d.winner is not None:
         return
 
-    if STATE["mode"] == "teams":
-        team = teams_current_team()
+    if state.mode in ("ffa", "teams"):
+        k = current_key()
         if success:
-            t = STATE["data"]["team_target"][team]
+            t = d.target[k]
             if t <= 20:
-                STATE["data"]["team_target"][team] = t + 1
+                d.target[k] = t + 1
             else:
-                STATE["data"]["winner"] = f"Team {team}"
+                d.winner = k
         advance_turn()
         return
 
 def leaderboard_add(points):
+    state = current_state()
     points = safe_int(points, 0)
-    if STATE["mode"] == "ffa":
-        p = ffa_current_player()
-        STATE["data"]["points"][p] += points
-        advance_turn()
-        return
-    if STATE["mode"] == "teams":
-        team = teams_current_team()
-        STATE["data"]["team_points"][team] += points
+    if state.mode in ("ffa", "teams"):
+        state.data.add(current_key(), points)
         advance_turn()
         return
 
+# ---------------------------
+# Checkout table
+# Every 1-, 2- and 3-dart finish for every score, for straight-out and
+# double-out, worked out once at startup (or read back from CHECKOUT_CACHE)
+# and ranked so the first route is the one to suggest. Only the best
+# CHECKOUT_KEEP routes per score are kept, plus how many finishes exist.
+# ---------------------------
+CHECKOUT_VERSION = 1
+CHECKOUT_KEEP = 10
+CHECKOUT_MAX = 180              # straight-out can finish 180; double-out tops out at 170
+GOOD_DOUBLES = [20, 16, 8, 18, 12, 10, 4, 14, 6, 2, 19, 17, 15, 13, 11, 9, 7, 5, 3, 1, 25]
+
+def checkout_darts():
+    # (label, points, effort): trebles of big numbers to set up, singles are easy, bull is hard
+    darts = []
+    for n in range(20, 0, -1):
+        darts.append((f"T{n}", 3 * n, 2.0 + (20 - n) * 0.1))
+        darts.append((f"S{n}", n, 1.0))
+        darts.append((f"D{n}", 2 * n, 3.0))
+    darts += [("25", 25, 3.0), ("Bull", 50, 4.0)]
+    return darts
+
+def build_checkouts(double_out):
+    darts = checkout_darts()
+    found = [[] for _ in range(CHECKOUT_MAX + 1)]
+    if not double_out:
+        # any dart can finish, so order never matters: one route per combination, biggest first
+        for k in (1, 2, 3):
+            for combo in combinations_with_replacement(darts, k):
+                total = sum(d[1] for d in combo)
+                if total <= CHECKOUT_MAX:
+                    route = tuple(d[0] for d in sorted(combo, key=lambda d: -d[1]))
+                    found[total].append((k, sum(d[2] for d in combo), route))
+        return checkout_ranked(found)
+
+    finish = [(lbl, pts, 1.0 + GOOD_DOUBLES.index(pts // 2) * 0.25)
+              for lbl, pts, _ in darts if lbl[0] == "D" or lbl == "Bull"]
+    for f, fp, fc in finish:
+        found[fp].append((1, fc, (f,)))
+    for a, ap, ac in darts:
+        for f, fp, fc in finish:
+            if ap + fp <= CHECKOUT_MAX:
+                found[ap + fp].append((2, ac + fc, (a, f)))
+    for i, (a, ap, ac) in enumerate(darts):
+        for b, bp, bc in darts[i:]:
+            # the two set-up darts can come in either order; list the bigger one first
+            first, second = ((a, b) if ap >= bp else (b, a))
+            for f, fp, fc in finish:
+                total = ap + bp + fp
+                if total <= CHECKOUT_MAX:
+                    found[total].append((3, ac + bc + fc, (first, second, f)))
+    return checkout_ranked(found)
+
+def checkout_ranked(found):
+    # fewest darts first, then least effort
+    routes = []
+    counts = []
+    for rs in found:
+        rs.sort()
+        routes.append([list(r[2]) for r in rs[:CHECKOUT_KEEP]])
+        counts.append(len(rs))
+    return {"routes": routes, "counts": counts}
+
+def checkout_table_ok(table):
+    # the cache is only a file on disk: anything that isn't exactly what
+    # build_checkouts makes gets rebuilt rather than trusted
+    if not isinstance(table, dict) or table.get("version") != CHECKOUT_VERSION or table.get("keep") != CHECKOUT_KEEP:
+        return False
+    for key in ("straight", "double"):
+        part = table.get(key)
+        if not isinstance(part, dict):
+            return False
+        routes, counts = part.get("routes"), part.get("counts")
+        if (not isinstance(routes, list) or not isinstance(counts, list)
+                or len(routes) != CHECKOUT_MAX + 1 or len(counts) != CHECKOUT_MAX + 1):
+            return False
+        for rs, n in zip(routes, counts):
+            if (not isinstance(rs, list) or type(n) is not int or len(rs) > min(n, CHECKOUT_KEEP)
+                    or not all(isinstance(r, list) and r and all(isinstance(d, str) for d in r) for r in rs)):
+                return False
+    return True
+
+def load_checkouts():
+    try:
+        with open(CHECKOUT_CACHE) as f:
+            table = json.load(f)
+        if checkout_table_ok(table):
+            return table
+    except (OSError, ValueError):
+        pass
+    table = {"version": CHECKOUT_VERSION, "keep": CHECKOUT_KEEP,
+             "straight": build_checkouts(False), "double": build_checkouts(True)}
+    # written aside and renamed, so a process starting alongside never reads half a file
+    tmp = f"{CHECKOUT_CACHE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(table, f, separators=(",", ":"))
+        os.replace(tmp, CHECKOUT_CACHE)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return table
+
+CHECKOUTS = load_checkouts()
+# best route per score, pre-encoded for /checkout/table
+CHECKOUT_BEST_JSON = {
+    key: json.dumps({str(sc): " ".join(rs[0]) for sc, rs in enumerate(CHECKOUTS[key]["routes"]) if rs},
+                    separators=(",", ":"))
+    for key in ("straight", "double")
+}
+
+def checkout_routes(score, double_out, limit=CHECKOUT_KEEP):
+    table = CHECKOUTS["double" if double_out else "straight"]
+    if not 0 <= score <= CHECKOUT_MAX:
+        return [], 0
+    return table["routes"][score][:limit], table["counts"][score]
+
+# ---------------------------
+# Win probability (x01)
+# Monte Carlo over each thrower's recent turn totals: every trial plays the
+# remaining scores out turn by turn and the first to check out wins. Trials
+# run as numpy arrays, one array op per simulated turn for all trials at once.
+# ---------------------------
+WINPROB_TRIALS = int(os.environ.get("WINPROB_TRIALS", "20000"))
+WINPROB_WORKERS = int(os.environ.get("WINPROB_WORKERS", "0"))     # >0: simulate sides in a process pool
+WINPROB_TURNS = 60              # give up on trials that are still going after this
+WINPROB_CACHE_SIZE = 256
+# what a typical pub player scores per visit, blended with thin histories
+WINPROB_PRIOR = [26, 41, 45, 60, 26, 45, 55, 81, 41, 60, 30, 85, 43, 57, 100, 22, 45, 60, 140, 39]
+WINPROB_CACHE = OrderedDict()
+WINPROB_POOL = None
+SHARED_LOCK = threading.Lock()  # for what all rooms share: these caches, STATE_CACHE and the pool
+
+def winprob_finishable(double_out):
+    counts = CHECKOUTS["double" if double_out else "straight"]["counts"]
+    # indexed by remaining score, which can be anything up to the largest x01 start
+    return np.array([c > 0 for c in counts] + [False] * (X01_START_MAX + 1 - len(counts)), dtype=bool)
+
+def winprob_side(pids):
+    # turn pool + checkout rate for a player (or a team's combined roster)
+    pool = list(WINPROB_PRIOR)
+    tries = hits = 0
+    for pid in pids:
+        h = STATE.history.get(pid)
+        if h is not None:
+            pool.extend(h.points)
+            tries += h.co_tries
+            hits += h.co_hits
+    return np.array(pool, dtype=np.int32), (hits + 3) / (tries + 10)
+
+def winprob_turns(seed, remaining, pool, rate, finishable, trials):
+    # turn (0-based) on which each trial checks out, WINPROB_TURNS if never
+    rng = np.random.default_rng(seed)
+    done = np.full(trials, WINPROB_TURNS, dtype=np.int32)
+    idx = np.arange(trials)                 # trials still going
+    rem = np.full(trials, remaining, dtype=np.int32)
+    for k in range(WINPROB_TURNS):
+        pts = pool[rng.integers(len(pool), size=len(idx))]
+        go_out = finishable[rem] & (pts >= rem)
+        out = go_out & (rng.random(len(idx)) < rate)
+        done[idx[out]] = k
+        new = rem - pts
+        rem = np.where(go_out | (new < 2), rem, new)
+        keep = ~out
+        idx = idx[keep]
+        if not len(idx):
+            break
+        rem = rem[keep]
+    return done
+
+def winprob_estimate(sides, seed):
+    # sides: [(label, remaining, pool, rate)] in throwing order from whoever is up
+    global WINPROB_POOL
+    finishable = winprob_finishable(STATE.settings.double_out)
+    n = len(sides)
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    jobs = [(sd, remaining, pool, rate, finishable, WINPROB_TRIALS)
+            for sd, (_, remaining, pool, rate) in zip(seeds, sides)]
+    if WINPROB_WORKERS > 0 and n > 1:
+        with SHARED_LOCK:
+            if WINPROB_POOL is None:
+                WINPROB_POOL = ProcessPoolExecutor(WINPROB_WORKERS)
+        turns = list(WINPROB_POOL.map(winprob_turns, *zip(*jobs)))
+    else:
+        turns = [winprob_turns(*job) for job in jobs]
+    order = np.empty((n, WINPROB_TRIALS), dtype=np.int32)
+    for i, done in enumerate(turns):
+        # earlier turn wins; on the same turn whoever throws first in the round does
+        order[i] = done * n + i
+    wins = np.bincount(order.argmin(axis=0), minlength=n)
+    return {label: round(float(w) / WINPROB_TRIALS, 4) for (label, *_), w in zip(sides, wins)}
+
+def winprob_sides(board):
+    nm = STATE.names.names
+    if STATE.mode == "championship":
+        b = get_board(board)
+        if b is None or b.data.winner is not None:
+            return None
+        m = STATE.tournament.matches[b.match]
+        first = b.data.turn
+        seq = [first, m.p2 if first == m.p1 else m.p1]
+        return [(nm[p], b.data.scores[p]) + winprob_side([p]) for p in seq]
+    d = STATE.data
+    if STATE.game != "501" or not isinstance(d, X01Data) or d.winner is not None:
+        return None
+    if STATE.mode == "ffa":
+        ps = STATE.players
+        c = STATE.current % len(ps)
+        return [(nm[p], d.scores[p]) + winprob_side([p]) for p in ps[c:] + ps[:c]]
+    up = STATE.teams.team_turn
+    seq = [up, "B" if up == "A" else "A"]
+    return [("Team " + k, d.scores[k]) + winprob_side(getattr(STATE.teams, k)) for k in seq]
+
+def win_probabilities(board=0):
+    sides = winprob_sides(board)
+    if sides is None:
+        return None, False
+    key = (ROOM.id, STATE.mode, STATE.game, safe_int(board, 0), STATE.settings.double_out, STATE.turns,
+           tuple((label, remaining) for label, remaining, _, _ in sides))
+    with SHARED_LOCK:
+        probs = WINPROB_CACHE.get(key)
+        if probs is not None:
+            WINPROB_CACHE.move_to_end(key)
+            return probs, True
+    # crc32, not hash(): string hashes change per process, and the same board should get the same estimate anywhere
+    probs = winprob_estimate(sides, zlib.crc32(repr(key).encode()))
+    with SHARED_LOCK:
+        WINPROB_CACHE[key] = probs
+        if len(WINPROB_CACHE) > WINPROB_CACHE_SIZE:
+            WINPROB_CACHE.popitem(last=False)
+    return probs, False
+
 # ---------------------------
 # UI
 # ---------------------------
@@ -447,8 +1325,32 @@ DISPLAY_HTML = """
   <div class="wrap" id="content"></div>
 
 <script>
+const BASE = location.pathname.replace(/[/](display|control)?$/, "");   // "" or "/r/<room>"
+// best checkout per remaining score, loaded once per out-rule
+let checkouts = {key: null, table: {}};
+async function loadCheckouts(s){
+  const key = s.settings["501_double_out"] ? "1" : "0";
+  if (checkouts.key === key) return;
+  checkouts = {key, table: await (await fetch(BASE + '/checkout/table?double_out=' + key)).json()};
+}
+function co(score){
+  const r = checkouts.table[score];
+  return r ? `<div class="small">🎯 ${r}</div>` : "";
+}
+// live win chances; missing (no numpy, game over) just shows nothing
+async function loadWinprob(board){
+  try {
+    const r = await (await fetch(BASE + '/winprob?board=' + board)).json();
+    return r.ok ? r.probs : {};
+  } catch (e) { return {}; }
+}
+function wp(probs, label){
+  const p = probs[label];
+  return p === undefined ? "" : `<div class="small">Win ${Math.round(p * 100)}%</div>`;
+}
+
 async function refresh(){
-  const s = await (await fetch('/state')).json();
+  const s = await (await fetch(BASE + '/state?view=display')).json();
   document.getElementById('title').textContent =
     (s.mode ? s.mode.toUpperCase() : "FFA") + (s.game ? (" • " + s.game.toUpperCase()) : "");
 
@@ -456,7 +1358,8 @@ async function refresh(){
     s.mode === "teams"
       ? ("Team A: " + s.teams.A.length + " players • Team B: " + s.teams.B.length + " players")
       : (s.mode === "championship"
-          ? ("Round " + s.tournament.round + " • Match " + (s.tournament.current_match+1) + "/" + (s.tournament.matches.length||0))
+          ? ((s.tournament.stages.length ? s.tournament.stages[s.tournament.stage].name + " • " : "")
+             + s.tournament.entrants + " players • " + s.tournament.boards.length + " board(s)")
           : ("Players: " + (s.players.join(", ") || "—")));
 
   document.getElementById('turn').textContent = s.turn_label;
@@ -475,7 +1378,10 @@ async function refresh(){
     return;
   }
 
+  if (s.game === "501" || s.game === "match") await loadCheckouts(s);
+
   if (s.game === "501") {
+    const probs = s.data.winner ? {} : await loadWinprob(0);
     if (s.mode === "teams") {
       const w = s.data.winner;
       c.innerHTML = `
@@ -484,11 +1390,15 @@ async function refresh(){
           <div class="card ${s.teams.team_turn==="A" ? "active" : ""} ${w==="Team A" ? "winner" : ""}">
             <div class="pname">Team A</div>
             <div class="big">${s.data.team_scores.A}</div>
+            ${co(s.data.team_scores.A)}
+            ${wp(probs, "Team A")}
             <div class="small">${s.data.last.A || ""}</div>
           </div>
           <div class="card ${s.teams.team_turn==="B" ? "active" : ""} ${w==="Team B" ? "winner" : ""}">
             <div class="pname">Team B</div>
             <div class="big">${s.data.team_scores.B}</div>
+            ${co(s.data.team_scores.B)}
+            ${wp(probs, "Team B")}
             <div class="small">${s.data.last.B || ""}</div>
           </div>
         </div>`;
@@ -502,6 +1412,8 @@ async function refresh(){
       <div class="card ${(s.turn_label.includes(p) ? "active" : "")} ${(winner===p ? "winner":"")}">
         <div class="pname">${p}</div>
         <div class="big">${s.data.scores[p]}</div>
+        ${co(s.data.scores[p])}
+        ${wp(probs, p)}
         <div class="small">${s.data.last[p]||""}</div>
       </div>`).join("") + `</div>`;
     c.innerHTML = html;
@@ -523,12 +1435,16 @@ async function refresh(){
         </div>`;
       return;
     } else {
-      const rows = Object.entries(s.data.points).sort((a,b)=>b[1]-a[1]).map(([p,pt],i)=>(
-        `<tr><td>${i+1}</td><td>${p}</td><td><b>${pt}</b></td></tr>`
-      )).join("");
+      // ranked on the server; only the top of the table (and whoever is up) comes over
+      const up = s.players[s.current % s.players.length];
+      const lb = await (await fetch(BASE + '/leaderboard?limit=20&player=' + encodeURIComponent(up))).json();
+      const row = r => `<tr class="${r.player===up ? "active" : ""}"><td>${r.rank}</td><td>${r.player}</td><td><b>${r.points}</b></td></tr>`;
+      let rows = lb.rows.map(row).join("");
+      if (lb.player && lb.player.rank > lb.rows.length) rows += `<tr><td colspan="3">…</td></tr>` + row(lb.player);
       c.innerHTML = `
         <div class="card">
           <div class="pname">Leaderboard</div>
+          <div class="small">${lb.total} players</div>
           <table><thead><tr><th>#</th><th>Player</th><th>Points</th></tr></thead><tbody>${rows}</tbody></table>
         </div>`;
       return;
@@ -586,50 +1502,54 @@ async function refresh(){
   }
 
   if (s.game === "match") {
-    // championship match display
-    const d = s.data;
+    // championship: one card per board
     const t = s.tournament;
-    const m = t.matches[t.current_match] || null;
-    if (!m) { c.innerHTML = `<div class="card">No match</div>`; return; }
-    const p1 = m.p1, p2 = m.p2;
-    const w = t.champion || (m.winner ? m.winner : null);
+    let html = "";
 
-    let html = `
-      <div class="card">
-        <div class="pname">Round ${t.round} • Match ${t.current_match+1}/${t.matches.length}</div>
-        <div class="big">${p1} vs ${p2}</div>
-      </div>`;
-
-    if (m.winner) {
-      html += `<div class="card winner"><div class="pname">Match Winner</div><div class="big">${m.winner}</div></div>`;
+    if (t.champion) {
+      html += `<div class="card winner"><div class="pname">Champion</div><div class="big">${t.champion}</div></div>`;
     }
 
-    html += `
-      <div class="grid">
-        <div class="card ${d.turn===p1 ? "active":""}">
-          <div class="pname">${p1}</div>
-          <div class="big">${d.scores ? d.scores[p1] : ""}</div>
-          <div class="small">${d.last ? (d.last[p1]||"") : ""}</div>
-        </div>
-        <div class="card ${d.turn===p2 ? "active":""}">
-          <div class="pname">${p2}</div>
-          <div class="big">${d.scores ? d.scores[p2] : ""}</div>
-          <div class="small">${d.last ? (d.last[p2]||"") : ""}</div>
-        </div>
-      </div>`;
+    const probs = await Promise.all(t.boards.map((b,i) => b && !b.m.winner ? loadWinprob(i) : {}));
+    html += `<div class="grid">` + t.boards.map((b,i)=>{
+      if (!b) return `<div class="card"><div class="pname">Board ${i+1}</div><div class="small">Idle${t.waiting ? "" : " • waiting for results"}</div></div>`;
+      const m = b.m, d = b.data;
+      const side = p => `
+          <div class="pname">${p}${d.turn===p && !m.winner ? " 🎯" : ""}</div>
+          <div class="big">${d.scores[p]}</div>
+          ${m.winner ? "" : co(d.scores[p])}
+          ${wp(probs[i], p)}
+          <div class="small">${d.last[p]||""}</div>`;
+      return `
+        <div class="card ${m.winner ? "winner" : "active"}">
+          <div class="pill">Board ${i+1} • ${t.stages[m.stage].name}${m.winner ? " • Winner: " + m.winner : ""}</div>
+          <div class="grid">
+            <div>${side(m.p1)}</div>
+            <div>${side(m.p2)}</div>
+          </div>
+        </div>`;
+    }).join("") + `</div>`;
 
-    // show bracket list
-    const rows = t.matches.map((mm,i)=>`<tr><td>${i+1}</td><td>${mm.p1}</td><td>${mm.p2}</td><td><b>${mm.winner||""}</b></td></tr>`).join("");
+    // league nights: live standings
+    if (t.format === "round_robin" || t.format === "swiss") {
+      const st = await (await fetch(BASE + '/standings?limit=16')).json();
+      const srows = st.rows.map(r=>`<tr><td>${r.rank}</td><td>${r.player}</td><td>${r.played}</td><td>${r.wins}</td><td>${r.losses}</td><td><b>${r.points}</b></td></tr>`).join("");
+      html += `
+        <div class="card">
+          <div class="pname">Standings${st.total > st.rows.length ? " (top " + st.rows.length + " of " + st.total + ")" : ""}</div>
+          <table><thead><tr><th>#</th><th>Player</th><th>P</th><th>W</th><th>L</th><th>Pts</th></tr></thead><tbody>${srows}</tbody></table>
+        </div>`;
+    }
+
+    // show the current round of the bracket
+    const v = t.stages.length ? await (await fetch(BASE + '/bracket?stage=' + t.stage)).json() : {name: "", first: 0, matches: []};
+    const rows = v.matches.map((mm,i)=>`<tr><td>${v.first+i+1}</td><td>${mm.p1??"—"}</td><td>${mm.p2??"—"}</td><td>${mm.board===null ? "" : mm.board+1}</td><td><b>${mm.winner||""}</b></td></tr>`).join("");
     html += `
       <div class="card">
-        <div class="pname">Current Round Bracket</div>
-        <table><thead><tr><th>#</th><th>P1</th><th>P2</th><th>Winner</th></tr></thead><tbody>${rows}</tbody></table>
+        <div class="pname">Bracket • ${v.name}</div>
+        <table><thead><tr><th>#</th><th>P1</th><th>P2</th><th>Board</th><th>Winner</th></tr></thead><tbody>${rows}</tbody></table>
       </div>`;
 
-    if (t.champion) {
-      html = `<div class="card winner"><div class="pname">Champion</div><div class="big">${t.champion}</div></div>` + html;
-    }
-
     c.innerHTML = html;
     return;
   }
@@ -674,7 +1594,7 @@ CONTROL_HTML = """
 <div class="wrap">
   <div class="card">
     <div class="title">Quick Links</div>
-    <div class="muted">Display: <a href="/display" target="_blank">/display</a></div>
+    <div class="muted">Display: <a href="display" target="_blank">/display</a></div>
     <div class="pill" id="turnPill">Turn: —</div>
   </div>
 
@@ -722,7 +1642,7 @@ CONTROL_HTML = """
 
   <div class="card" id="champCard" style="display:none;">
     <div class="title">2C) Championships</div>
-    <div class="muted">One player per line (20 is fine). App will shuffle + pair matches.</div>
+    <div class="muted">One player per line (hundreds are fine). App will shuffle (or seed) + pair matches and spread them over the boards.</div>
     <textarea id="tourPlayers" placeholder="Player 1\\nPlayer 2\\n..."></textarea>
     <div class="spacer"></div>
     <div class="row">
@@ -731,7 +1651,21 @@ CONTROL_HTML = """
       <button class="ok" onclick="startGame()">Start Championships</button>
     </div>
     <div class="spacer"></div>
-    <button onclick="nextMatch()">Next Match</button>
+    <div class="row">
+      <select id="bracket">
+        <option value="single">Single elimination</option>
+        <option value="double">Double elimination</option>
+        <option value="round_robin">Round robin (league)</option>
+        <option value="swiss">Swiss (league)</option>
+      </select>
+      <input id="rounds" type="number" value="0" min="0" max="50" title="Swiss rounds (0 = auto)"/>
+      <label class="pill"><input id="seeded" type="checkbox" /> Seeded (list order = seeding)</label>
+    </div>
+    <div class="spacer"></div>
+    <div class="row">
+      <input id="boards" type="number" value="1" min="1" max="16"/>
+      <button onclick="saveBoards()">Save Boards</button>
+    </div>
   </div>
 
   <div class="card">
@@ -767,15 +1701,34 @@ CONTROL_HTML = """
 </div>
 
 <script>
+const BASE = location.pathname.replace(/[/](display|control)?$/, "");   // "" or "/r/<room>"
+let board = 0;   // championship board this controller is scoring
+let version = 0; // state version this controller last showed
+let notice = "";  // shown once with the next refresh
+
+// every action carries an id, so retrying after a dropped response can't apply it twice,
+// and the version it was decided on, so it can't land on a turn this phone never saw
 async function post(path, data) {
-  const r = await fetch(path, {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(data||{})});
-  return await r.json();
+  const body = JSON.stringify(Object.assign({id: Date.now().toString(36) + Math.random().toString(36).slice(2), version}, data));
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const r = await fetch(BASE + path, {method:'POST', headers:{'Content-Type':'application/json'}, body});
+      const out = await r.json();
+      if (r.status === 409) notice = "⚠ Not sent: another controller moved first";
+      return out;
+    } catch (e) {
+      if (attempt >= 3) throw e;
+      await new Promise(ok => setTimeout(ok, 300 * (attempt + 1)));
+    }
+  }
 }
 
 async function refresh() {
-  const s = await (await fetch('/state')).json();
+  const s = await (await fetch(BASE + '/state?view=control')).json();
+  version = s.version;
   document.getElementById('status').textContent = JSON.stringify(s, null, 2);
-  document.getElementById('turnPill').textContent = s.turn_label;
+  document.getElementById('turnPill').textContent = (notice ? notice + " • " : "") + s.turn_label;
+  notice = "";
 
   document.getElementById('modeSel').value = s.mode;
   document.getElementById('ffaCard').style.display = (s.mode === "ffa") ? "" : "none";
@@ -799,8 +1752,17 @@ async function refresh() {
       c.innerHTML = `<div class="muted">Press “Start Championships”.</div>`;
       return;
     }
+    const t = s.tournament;
+    const opts = t.boards.map((b,i)=>{
+      const m = b ? b.m : null;
+      return `<option value="${i}" ${i===board ? "selected" : ""}>Board ${i+1}: ${m ? (m.p1 + " vs " + m.p2 + (m.winner ? " ✅" : "")) : "idle"}</option>`;
+    }).join("");
     c.innerHTML = `
-      <div class="muted">Enter turn total (0–180). Alternates between the two players.</div>
+      <div class="muted">Pick a board, then enter turn totals (0–180). Alternates between the two players.</div>
+      <div class="row">
+        <select id="boardSel" onchange="board=parseInt(this.value)">${opts}</select>
+      </div>
+      <div class="spacer"></div>
       <div class="row">
         <input id="vm" type="number" min="0" max="180" placeholder="e.g. 60" />
         <button class="ok" onclick="matchAdd()">Submit Turn</button>
@@ -933,11 +1895,21 @@ async function saveMatch() {
   await refresh();
 }
 
+async function saveBoards() {
+  const boards = parseInt(document.getElementById('boards').value || "1");
+  await post('/action', {type:'set_boards', boards});
+  await refresh();
+}
+
 async function startGame() {
   const mode = document.getElementById('modeSel').value;
   if (mode === "championship") {
     const players = (document.getElementById('tourPlayers').value || "")
       .split("\\n").map(x=>x.trim()).filter(Boolean);
+    const bracket = document.getElementById('bracket').value;
+    const seeded = document.getElementById('seeded').checked;
+    const rounds = parseInt(document.getElementById('rounds').value || "0");
+    await post('/action', {type:'set_bracket', bracket, seeded, rounds});
     await post('/action', {type:'set_tournament_players', players});
     await post('/action', {type:'start_game', game:'match'});
     await refresh();
@@ -977,11 +1949,11 @@ async function crQ(number, hits) { await post('/action', {type:'cricket_hit', nu
 
 async function matchAdd() {
   const v = parseInt(document.getElementById('vm').value || "0");
-  await post('/action', {type:'match_add', score:v});
+  await post('/action', {type:'match_add', score:v, board});
   await refresh();
 }
-async function matchQuick(v) { await post('/action', {type:'match_add', score:v}); await refresh(); }
-async function nextMatch() { await post('/action', {type:'next_match'}); await refresh(); }
+async function matchQuick(v) { await post('/action', {type:'match_add', score:v, board}); await refresh(); }
+async function nextMatch() { await post('/action', {type:'next_match', board}); await refresh(); }
 
 setInterval(refresh, 900);
 refresh();
@@ -990,6 +1962,673 @@ refresh();
 </html>
 """
 
+# ---------------------------
+# Static assets
+# The pages' <style> and <script> blocks are split out at import into
+# files named after their content hash and served as immutable; the HTML
+# shells left behind only change on deploy. Every body is compressed once
+# here, never per request.
+# ---------------------------
+ASSET_RE = re.compile(r"<style>\n(.*?)</style>|<script>\n(.*?)</script>", re.S)
+ASSETS = {}                 # file name -> StaticBody
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+class StaticBody:
+    __slots__ = ("raw", "gzip", "br", "etag", "mimetype")
+    def __init__(self, data, mimetype):
+        self.raw = data
+        self.gzip = gzip.compress(data, 9, mtime=0)
+        self.br = brotli.compress(data, quality=11) if brotli else None
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        self.mimetype = mimetype
+
+def split_assets(page, html):
+    def extract(m):
+        css = m.group(1) is not None
+        data = (m.group(1) if css else m.group(2)).encode()
+        name = f"{page}.{hashlib.sha256(data).hexdigest()[:12]}.{'css' if css else 'js'}"
+        if css:
+            ASSETS[name] = StaticBody(data, "text/css; charset=utf-8")
+            return f'<link rel="stylesheet" href="/assets/{name}">'
+        ASSETS[name] = StaticBody(data, "application/javascript; charset=utf-8")
+        return f'<script src="/assets/{name}"></script>'
+    return StaticBody(ASSET_RE.sub(extract, html).encode(), "text/html; charset=utf-8")
+
+DISPLAY_PAGE = split_assets("display", DISPLAY_HTML)
+CONTROL_PAGE = split_assets("control", CONTROL_HTML)
+
+def send_static(body, cache_control):
+    accept = request.accept_encodings
+    if body.br is not None and accept["br"]:
+        data, coding = body.br, "br"
+    elif accept["gzip"]:
+        data, coding = body.gzip, "gzip"
+    else:
+        data, coding = body.raw, None
+    resp = app.response_class(data, mimetype=body.mimetype)
+    if coding:
+        resp.headers["Content-Encoding"] = coding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = cache_control
+    resp.set_etag(f"{body.etag}-{coding}" if coding else body.etag)
+    return resp.make_conditional(request)
+
+# ---------------------------
+# Rooms
+# Each room is an independent party: its own state, bracket RNG, action
+# log and lock. Requests under /r/<room>/ make that room current for their
+# thread and hold its lock until the request is done; the plain routes are
+# room "". STATE, RNG and ROOM follow the thread's current room, so two
+# rooms never wait on each other, not even while one is being restored.
+# ---------------------------
+ROOM_RE = re.compile(r"[A-Za-z0-9_-]{1,40}$")
+
+ACTION_IDS_MAX = int(os.environ.get("ACTION_IDS_MAX", "2048"))      # per room
+ACTION_IDS_TTL = float(os.environ.get("ACTION_IDS_TTL", "900"))     # seconds
+
+class ActionIds:
+    # recent client action ids -> the response they got, so a retried or
+    # double-tapped action is answered again instead of applied twice.
+    # Entries all live ACTION_IDS_TTL, so insertion order is expiry order
+    # and the oldest is always at the front.
+    __slots__ = ("entries",)
+
+    def __init__(self):
+        self.entries = OrderedDict()    # id -> (expires, body, status)
+
+    def get(self, aid, now):
+        self.expire(now)
+        hit = self.entries.get(aid)
+        return hit and hit[1:]
+
+    def put(self, aid, body, status, now):
+        self.entries[aid] = (now + ACTION_IDS_TTL, body, status)
+        if len(self.entries) > ACTION_IDS_MAX:
+            self.entries.popitem(last=False)
+
+    def expire(self, now):
+        entries = self.entries
+        while entries and next(iter(entries.values()))[0] <= now:
+            entries.popitem(last=False)
+
+class Room:
+    __slots__ = ("id", "state", "rng", "lock", "seq", "snap_seq", "ids", "pending")
+
+    def __init__(self, rid):
+        self.id = rid
+        self.state = PartyState()
+        self.rng = random.Random()
+        self.lock = threading.RLock()   # held for every request in the room and by its snapshots
+        self.seq = 0                # last action applied
+        self.snap_seq = 0           # last action covered by a snapshot
+        self.ids = ActionIds()
+        self.pending = {}           # board -> darts of the turn in progress, from /darts
+
+ROOMS = {"": Room("")}
+ROOMS_LOCK = threading.Lock()   # only for looking rooms up and adding them
+# threads outside a request (scripts, benchmarks, the log writer) are in room ""
+CURRENT_ROOM = contextvars.ContextVar("room", default=ROOMS[""])
+ROOM = room_part(CURRENT_ROOM.get)
+
+def enter_room(rid):
+    # make rid's room this thread's and take its lock; a room new to this
+    # process is restored from the log under its own lock, so only requests
+    # for that room wait for it
+    with ROOMS_LOCK:
+        room = ROOMS.get(rid)
+        new = room is None
+        if new:
+            room = ROOMS[rid] = Room(rid)
+            room.lock.acquire()
+    if not new:
+        room.lock.acquire()
+    CURRENT_ROOM.set(room)
+    if new and SESSION_LOG is not None:
+        try:
+            SESSION_LOG.restore(room)
+        except BaseException:
+            with ROOMS_LOCK:
+                del ROOMS[rid]
+            room.lock.release()
+            raise
+    return room
+
+@contextmanager
+def in_room(rid):
+    room = enter_room(rid)
+    try:
+        yield room
+    finally:
+        room.lock.release()
+
+def room_shard(rid, workers):
+    # crc32, not hash(): every process has to agree on the owner
+    return zlib.crc32(rid.encode()) % workers
+
+# ---------------------------
+# Persistence
+# Accepted actions are appended to party_actions in APP_DB and each room's
+# state is pickled into party_snapshots every PARTY_SNAPSHOT_EVERY actions.
+# /action only puts the payload on a queue; a writer thread batches the
+# inserts. A room is restored from its newest snapshot plus the actions
+# after it the first time it is used.
+# ---------------------------
+PARTY_PERSIST = os.environ.get("PARTY_PERSIST", "1") == "1"
+PARTY_SNAPSHOT_EVERY = int(os.environ.get("PARTY_SNAPSHOT_EVERY", "200"))
+PARTY_FLUSH_MS = int(os.environ.get("PARTY_FLUSH_MS", "50"))    # most actions a crash can lose
+PARTY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS party_snapshots (
+  room TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  created_at REAL NOT NULL,
+  state BLOB NOT NULL,
+  PRIMARY KEY (room, seq)
+);
+CREATE TABLE IF NOT EXISTS party_actions (
+  room TEXT NOT NULL,
+  seq INTEGER NOT NULL,
+  created_at REAL NOT NULL,
+  payload TEXT NOT NULL,
+  PRIMARY KEY (room, seq)
+);
+"""
+class SessionLog:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)   # shard workers share the file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(party_actions)")]
+        if cols and "room" not in cols:
+            # single-session tables from before rooms: they become room ""
+            with conn:
+                for table in ("party_snapshots", "party_actions"):
+                    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                conn.executescript(PARTY_SCHEMA)
+                conn.execute("INSERT INTO party_snapshots SELECT '', seq, created_at, state FROM party_snapshots_old")
+                conn.execute("INSERT INTO party_actions SELECT '', seq, created_at, payload FROM party_actions_old")
+                for table in ("party_snapshots", "party_actions"):
+                    conn.execute(f"DROP TABLE {table}_old")
+        conn.executescript(PARTY_SCHEMA)
+        return conn
+
+    def restore(self, room):
+        # room must be the current one, its lock held: the tail is replayed through apply_action
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT seq, state FROM party_snapshots WHERE room = ? ORDER BY seq DESC LIMIT 1",
+                               (room.id,)).fetchone()
+            if row:
+                saved = StateUnpickler(io.BytesIO(row[1])).load()
+                state, rng_state = saved[:2]
+                if len(saved) > 2:
+                    room.ids.entries = saved[2]
+                room.rng.setstate(rng_state)
+                room.state = state
+                room.seq = room.snap_seq = row[0]
+            tail = conn.execute("SELECT seq, payload FROM party_actions WHERE room = ? AND seq > ? ORDER BY seq",
+                                (room.id, room.seq)).fetchall()
+        finally:
+            conn.close()
+        now = time.time()
+        with app.app_context():
+            for seq, payload in tail:
+                payload = json.loads(payload)
+                resp = run_action(payload)
+                room.seq = seq
+                if payload.get("id"):
+                    room.ids.put(payload["id"], resp.get_data(), 200, now)
+        return len(tail)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="party-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, room, payload):
+        # called with the room's lock held, right after the action was applied; room is
+        # the Room itself, not ROOM, since the writer thread reads it
+        room.seq += 1
+        self.queue.put((room, room.seq, time.time(), payload))
+        if room.seq - room.snap_seq >= PARTY_SNAPSHOT_EVERY:
+            room.snap_seq = room.seq
+            self.queue.put((room, room.seq, None, None))
+
+    def run(self):
+        conn = self.connect()
+        while True:
+            batch = [self.queue.get()]
+            time.sleep(PARTY_FLUSH_MS / 1000)   # let a burst of actions share one transaction
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(conn, batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def write(self, conn, batch):
+        rows = [(room.id, seq, ts, json.dumps(payload)) for room, seq, ts, payload in batch if payload is not None]
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO party_actions(room, seq, created_at, payload) VALUES (?,?,?,?)",
+                             rows)
+        for room, seq, ts, payload in batch:
+            if payload is None:
+                self.snapshot(conn, room)
+
+    def snapshot(self, conn, room):
+        with room.lock:
+            seq = room.seq      # may be past the marker by now; later rows <= seq are ignored on restore
+            blob = pickle.dumps((room.state, room.rng.getstate(), room.ids.entries), pickle.HIGHEST_PROTOCOL)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO party_snapshots(room, seq, created_at, state) VALUES (?,?,?,?)",
+                         (room.id, seq, time.time(), blob))
+            conn.execute("DELETE FROM party_actions WHERE room = ? AND seq <= ?", (room.id, seq))
+            conn.execute("DELETE FROM party_snapshots WHERE room = ? AND seq < ?", (room.id, seq))
+
+    def flush(self):
+        self.queue.join()
+
+class StateUnpickler(pickle.Unpickler):
+    # snapshots name their classes by module, which is __main__ when run as a
+    # script and darts_party when imported; either way they are ours
+    def find_class(self, module, name):
+        if module in ("__main__", "darts_party"):
+            return globals()[name]
+        return super().find_class(module, name)
+
+SESSION_LOG = None
+
+def open_session_log(path=APP_DB, restore=True):
+    # restore the current room, then log from here on; call once per process before serving
+    global SESSION_LOG
+    log = SessionLog(path)
+    if restore:
+        t0 = time.perf_counter()
+        with in_room("") as room:
+            replayed = log.restore(room)
+        print(f"restored party session #{room.seq} ({replayed} replayed) in "
+              f"{(time.perf_counter() - t0) * 1000:.0f} ms")
+    log.start()
+    SESSION_LOG = log
+
+# ---------------------------
+# Dart events
+# Electronic boards report single darts (segment, multiplier) rather than
+# turn totals. Every legal dart is in DART_TABLE, so checking one is a
+# single lookup. A turn is up to three darts and applied as one "darts"
+# (ffa/teams) or "match_darts" (championship) action; x01 turns end early
+# on a checkout or bust.
+# ---------------------------
+DART_TABLE = {(0, 0): (0, False, None, 0), (0, 1): (0, False, None, 0)}     # misses
+# (segment, multiplier) -> (points, double, cricket index, hits)
+for seg in list(range(1, 21)) + [25]:
+    for mult in (1, 2) if seg == 25 else (1, 2, 3):
+        DART_TABLE[seg, mult] = (seg * mult, mult == 2, CRICKET_INDEX.get("BULL" if seg == 25 else str(seg)), mult)
+
+def as_darts(v):
+    if not isinstance(v, list) or not 1 <= len(v) <= 3:
+        raise ValueError
+    return [DART_TABLE[tuple(x)] for x in v]     # KeyError for anything not on the board
+
+def x01_turn(darts, remaining):
+    # total and finishing dart of a turn, stopping at the dart that checks out or busts
+    total = 0
+    for points, double, _, _ in darts:
+        total += points
+        if remaining - total <= 1:
+            break
+    return total, double
+
+def darts_turn(darts):
+    state = current_state()
+    if state.data.winner is not None:
+        return jsonify({"ok": False, "error": "Game is over"}), 400
+    if state.game == "cricket":
+        cricket_turn([(idx, hits) for _, _, idx, hits in darts if idx is not None])
+    else:
+        total, double = x01_turn(darts, state.data.scores[current_key()])
+        handle_501_add(total, double)
+
+def match_darts(darts, board):
+    state = current_state()
+    b = get_board(board)
+    if b is None:
+        return jsonify({"ok": False, "error": "No match on that board"}), 400
+    if b.data.winner is not None or state.tournament.champion is not None:
+        return jsonify({"ok": False, "error": "Match is over"}), 400
+    total, double = x01_turn(darts, b.data.scores[b.data.turn])
+    match_add(total, board, double)
+
+def dart_turn_over(board, darts):
+    # an x01 turn is over before its third dart once it has checked out or bust
+    state = current_state()
+    if state.game == "match":
+        b = get_board(board)
+        if b is None:
+            return False
+        remaining = b.data.scores[b.data.turn]
+    elif state.game == "501":
+        remaining = state.data.scores[current_key()]
+    else:
+        return False
+    return remaining - sum(DART_TABLE[x][0] for x in darts) <= 1
+
+# ---------------------------
+# Game engines and actions
+# Every /action type is an Action in ACTIONS: its handler, a field schema
+# (name, kind, default) checked before the handler runs, and the games and
+# modes it is valid in. A game is an Engine: the modes it runs in, how its
+# data is built (the data class is its state layout and display payload)
+# and its scoring actions. Dispatch is one dict lookup however many games
+# are registered.
+# ---------------------------
+class Action:
+    __slots__ = ("name", "handler", "fields", "games", "modes", "error", "scope")
+
+    def __init__(self, name, handler, fields=(), games=None, modes=None,
+                 error="Action not valid for current mode/game", scope=None):
+        self.name = name
+        self.handler = handler      # called with the field values in order; returns None or an error response
+        self.fields = fields        # ((name, kind, default), ...)
+        self.games = games          # None: any game
+        self.modes = modes          # None: any mode
+        self.error = error          # reply when the mode is wrong
+        self.scope = scope          # "turn" | "board" | None, see is_stale
+
+class Engine:
+    __slots__ = ("name", "modes", "make", "actions")
+
+    def __init__(self, name, modes, make, actions):
+        self.name = name
+        self.modes = modes
+        self.make = make            # (keys, team) -> GameData subclass; None: the mode builds it
+        self.actions = actions
+
+def as_int(v):
+    # "12.5" counts as 12, the same as 12.5: clients send numbers as either
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError
+    if isinstance(v, str):
+        try:
+            return int(v)
+        except ValueError:
+            v = float(v)
+    try:
+        return int(v)
+    except OverflowError:
+        raise ValueError(v) from None
+
+BOOL_STRINGS = {"true": True, "1": True, "false": False, "0": False}
+
+def as_bool(v):
+    # JSON booleans, 0/1, or those spelled as strings; bool("false") would be True
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, int) and v in (0, 1):
+        return v == 1
+    if isinstance(v, str) and v.strip().lower() in BOOL_STRINGS:
+        return BOOL_STRINGS[v.strip().lower()]
+    raise ValueError
+
+def as_str(v):
+    if not isinstance(v, (str, int)):
+        raise ValueError
+    return str(v)
+
+def as_names(v):
+    # "BYE" is the name of the bracket's empty slot (pid 0), not a player's
+    if not isinstance(v, list):
+        raise ValueError
+    names = [x.strip() for x in v if isinstance(x, str) and x.strip()]
+    if "BYE" in names:
+        raise ValueError("BYE")
+    return names
+
+REQUIRED = object()     # field default for fields that have none
+
+FIELD_KINDS = {"int": as_int, "str": as_str, "bool": as_bool, "names": as_names, "darts": as_darts}
+
+ACTIONS = {}
+GAMES = {}
+
+def register_action(action):
+    action.fields = tuple((name, FIELD_KINDS[kind], default) for name, kind, default in action.fields)
+    ACTIONS[action.name] = action
+
+def register_game(engine):
+    GAMES[engine.name] = engine
+    for action in engine.actions:
+        action.games = (engine.name,)
+        action.modes = engine.modes
+        register_action(action)
+
+def on_action(name, *fields, **opts):
+    def wrap(fn):
+        register_action(Action(name, fn, fields, **opts))
+        return fn
+    return wrap
+
+OK_JSON = b'{"ok":true}\n'     # what jsonify({"ok": True}) writes, without the encoder
+
+def action_ok():
+    return app.response_class(OK_JSON, mimetype="application/json")
+
+def apply_action(payload):
+    state = current_state()
+    act = ACTIONS.get(payload.get("type"))
+    if act is None or (act.games is not None and state.game not in act.games):
+        return jsonify({"ok": False, "error": "Action not valid for current mode/game"}), 400
+    if act.modes is not None and state.mode not in act.modes:
+        return jsonify({"ok": False, "error": act.error}), 400
+    args = []
+    for name, kind, default in act.fields:
+        v = payload.get(name)
+        try:
+            if v is None:
+                if default is REQUIRED:
+                    raise ValueError
+                args.append(default)
+            else:
+                args.append(kind(v))
+        except (TypeError, ValueError, KeyError):
+            return jsonify({"ok": False, "error": f"Invalid {name}"}), 400
+    return act.handler(*args) or action_ok()
+
+register_game(Engine("501", ("ffa", "teams"),
+                     lambda keys, team: X01Data(keys, STATE.settings.x01_start, team),
+                     [Action("501_add", handle_501_add, [("score", "int", 0)], scope="turn")]))
+register_game(Engine("cricket", ("ffa", "teams"), CricketData,
+                     [Action("cricket_hit", cricket_hit, [("number", "str", "20"), ("hits", "int", 1)], scope="turn")]))
+register_game(Engine("atc", ("ffa", "teams"), AtcData,
+                     [Action("atc_hit", atc_hit, [("success", "bool", False)], scope="turn")]))
+register_game(Engine("leaderboard", ("ffa", "teams"), LeaderboardData,
+                     [Action("lb_add", leaderboard_add, [("points", "int", 0)], scope="turn")]))
+# if a match has a winner, "Next Match" frees its board
+register_game(Engine("match", ("championship",), None,
+                     [Action("match_add", match_add, [("score", "int", 0), ("board", "int", 0)], scope="board"),
+                      Action("match_darts", match_darts, [("darts", "darts", REQUIRED), ("board", "int", 0)],
+                             scope="board")]))
+# a turn of single darts, from an electronic board (see /darts)
+register_action(Action("darts", darts_turn, [("darts", "darts", REQUIRED)], games=("501", "cricket"),
+                       modes=("ffa", "teams"), scope="turn"))
+
+@on_action("reset")
+def act_reset():
+    reset_state()
+    ROOM.pending.clear()
+
+@on_action("set_mode", ("mode", "str", "ffa"))
+def act_set_mode(mode):
+    if mode not in ["ffa", "teams", "championship"]:
+        return jsonify({"ok": False, "error": "Unknown mode"}), 400
+    STATE.mode = mode
+    STATE.started = False
+    STATE.game = None
+    STATE.data = GameData()
+
+@on_action("set_players", ("players", "names", []))
+def act_set_players(players):
+    if not players:
+        players = ["Player 1", "Player 2"]
+    STATE.players = STATE.names.intern_all(players)
+    if STATE.started and STATE.mode == "ffa" and STATE.game in GAMES:
+        init_game(STATE.game)
+
+@on_action("set_teams", ("A", "names", []), ("B", "names", []))
+def act_set_teams(A, B):
+    if not A: A = [f"A{i+1}" for i in range(10)]
+    if not B: B = [f"B{i+1}" for i in range(10)]
+    STATE.teams.A = STATE.names.intern_all(A)
+    STATE.teams.B = STATE.names.intern_all(B)
+    STATE.teams.team_current = 0
+    STATE.teams.team_turn = "A"
+    if STATE.started and STATE.mode == "teams" and STATE.game in GAMES:
+        init_game(STATE.game)
+
+@on_action("set_tournament_players", ("players", "names", []))
+def act_set_tournament_players(players):
+    if len(players) < 2:
+        players = [f"P{i+1}" for i in range(8)]
+    STATE.tournament = Tournament(STATE.names.intern_all(players))
+
+@on_action("set_match_start", ("start", "int", 301))
+def act_set_match_start(start):
+    STATE.settings.match_start = max(101, min(501, start))
+
+@on_action("set_bracket", ("bracket", "str", "single"), ("seeded", "bool", False), ("rounds", "int", 0))
+def act_set_bracket(bracket, seeded, rounds):
+    if bracket not in BRACKETS:
+        return jsonify({"ok": False, "error": "Unknown bracket"}), 400
+    STATE.settings.bracket = bracket
+    STATE.settings.seeded = seeded
+    STATE.settings.swiss_rounds = max(0, min(50, rounds))
+
+@on_action("set_boards", ("boards", "int", 1))
+def act_set_boards(boards):
+    boards = max(1, min(16, boards))
+    STATE.settings.boards = boards
+    resize_boards(boards)
+
+@on_action("set_501_settings", ("start", "int", 501), ("doubleOut", "bool", False))
+def act_set_501_settings(start, double_out):
+    STATE.settings.x01_start = max(101, min(X01_START_MAX, start))
+    STATE.settings.double_out = double_out
+    if STATE.started and STATE.game == "501":
+        init_game("501")
+
+@on_action("start_game", ("game", "str", ""))
+def act_start_game(game):
+    ROOM.pending.clear()
+    if STATE.mode == "championship":
+        init_game("match")
+        return
+    engine = GAMES.get(game)
+    if engine is None or STATE.mode not in engine.modes:
+        return jsonify({"ok": False, "error": "Unknown game"}), 400
+    init_game(game)
+
+@on_action("next", modes=("ffa", "teams"), error="Not applicable", scope="turn")
+def act_next():
+    advance_turn()
+
+@on_action("next_match", ("board", "int", 0), modes=("championship",), error="Not in championship mode",
+           scope="board")
+def act_next_match(board):
+    resp = release_board(board)
+    if resp is None:
+        ROOM.pending.pop(board, None)
+    return resp
+
+# ---------------------------
+# State views
+# /state?fields=turn_label,data.scores returns just those fields (nested
+# paths keep their nesting; a path the state doesn't have right now is a
+# 400, like an unknown field); /state?view=control a named field list.
+# Each distinct selection is written once per room and state version and
+# the bytes are shared by every client polling it.
+# ---------------------------
+STATE_FIELDS = {
+    "mode": lambda js: js_str(STATE.mode),
+    "game": lambda js: js_val(STATE.game),
+    "players": lambda js: js_list(STATE.players, js),
+    "current": lambda js: "%d" % STATE.current,
+    "started": lambda js: js_val(STATE.started),
+    "settings": lambda js: STATE.settings.to_json(),
+    "teams": lambda js: STATE.teams.to_json(js),
+    "tournament": lambda js: STATE.tournament.to_json(js),
+    "data": lambda js: STATE.data.to_json(js),
+    "turn_label": lambda js: js_str(current_player_label()),
+    "version": lambda js: "%d" % STATE.version,
+}
+STATE_VIEWS = {
+    "display": "mode,game,players,current,started,settings,teams,tournament,data,turn_label",
+    "control": "mode,game,started,version,turn_label,tournament.champion,tournament.boards",
+    "overlay": "mode,game,started,version,turn_label,data",
+}
+STATE_CACHE_MAX = 256
+STATE_CACHE = OrderedDict()     # (room, version, selection) -> bytes
+
+def parse_fields(spec):
+    # "a,b.c,b.d" -> {"a": None, "b": {"c": None, "d": None}}; None keeps the whole value
+    tree = {}
+    for path in spec.split(","):
+        keys = path.strip().split(".")
+        if keys[0] not in STATE_FIELDS or not all(keys):
+            return None
+        node = tree
+        for k in keys[:-1]:
+            if k in node and node[k] is None:
+                break
+            node = node.setdefault(k, {})
+        else:
+            node[keys[-1]] = None
+    return tree
+
+def pick(value, tree):
+    # KeyError for a path that isn't there
+    if not isinstance(value, dict):
+        raise KeyError(tree)
+    return {k: value[k] if sub is None else pick(value[k], sub) for k, sub in tree.items()}
+
+def project_state(tree):
+    js = STATE.names.json
+    parts = []
+    for key, sub in tree.items():
+        frag = STATE_FIELDS[key](js)
+        if sub is not None:
+            try:
+                frag = json.dumps(pick(json.loads(frag), sub), separators=(",", ":"))
+            except KeyError:
+                return None
+        parts.append("%s:%s" % (js_str(key), frag))
+    return "{%s}" % ",".join(parts)
+
+def state_payload(spec):
+    key = (ROOM.id, STATE.version, spec)
+    with SHARED_LOCK:
+        body = STATE_CACHE.get(key)
+        if body is not None:
+            STATE_CACHE.move_to_end(key)
+            return body
+    if spec:
+        tree = parse_fields(spec)
+        body = None if tree is None else project_state(tree)
+        if body is None:
+            return None
+        body = body.encode()
+    else:
+        body = STATE.to_json().encode()
+    with SHARED_LOCK:
+        STATE_CACHE[key] = body
+        if len(STATE_CACHE) > STATE_CACHE_MAX:
+            STATE_CACHE.popitem(last=False)
+    return body
+
 # ---------------------------
 # Routes
 # ---------------------------
@@ -999,142 +2638,352 @@ def home():
 
 @app.get("/display")
 def display():
-    return render_template_string(DISPLAY_HTML)
+    # shells revalidate (304 when unchanged); the assets they name never do
+    return send_static(DISPLAY_PAGE, "no-cache")
 
 @app.get("/control")
 def control():
-    return render_template_string(CONTROL_HTML)
+    return send_static(CONTROL_PAGE, "no-cache")
+
+@app.get("/assets/<name>")
+def asset(name):
+    body = ASSETS.get(name)
+    if body is None:
+        abort(404)
+    return send_static(body, IMMUTABLE)
 
 @app.get("/state")
 def state():
+    view = request.args.get("view")
+    if view is not None and view not in STATE_VIEWS:
+        return jsonify({"ok": False, "error": "Unknown view"}), 400
     ensure_players()
-    return jsonify({
-        "mode": STATE["mode"],
-        "game": STATE["game"],
-        "players": STATE["players"],
-        "current": STATE["current"],
-        "started": STATE["started"],
-        "settings": STATE["settings"],
-        "teams": STATE["teams"],
-        "tournament": STATE["tournament"],
-        "data": STATE["data"],
-        "turn_label": current_player_label()
-    })
+    body = state_payload(STATE_VIEWS[view] if view else request.args.get("fields", ""))
+    if body is None:
+        return jsonify({"ok": False, "error": "Unknown field"}), 400
+    return app.response_class(body, mimetype="application/json")
+
+@app.get("/bracket")
+def bracket():
+    t = STATE.tournament
+    i = safe_int(request.args.get("stage"), t.stage)
+    if not 0 <= i < len(t.stages):
+        return jsonify({"ok": False, "error": "No such stage"}), 404
+    return app.response_class(t.view_json(STATE.names.json, i), mimetype="application/json")
+
+@app.get("/checkout")
+def checkout():
+    score = safe_int(request.args.get("score"), -1)
+    double_out = request.args.get("double_out", "1" if STATE.settings.double_out else "0") == "1"
+    limit = max(1, min(CHECKOUT_KEEP, safe_int(request.args.get("limit"), 3)))
+    routes, count = checkout_routes(score, double_out, limit)
+    return jsonify({"score": score, "double_out": double_out, "routes": routes, "count": count})
+
+@app.get("/checkout/table")
+def checkout_table():
+    # best route for every finishable score; the display loads this once per out-rule
+    double_out = request.args.get("double_out", "1" if STATE.settings.double_out else "0") == "1"
+    return app.response_class(CHECKOUT_BEST_JSON["double" if double_out else "straight"], mimetype="application/json")
+
+@app.get("/winprob")
+def winprob():
+    if np is None:
+        return jsonify({"ok": False, "error": "numpy is not installed"}), 503
+    t0 = time.perf_counter()
+    probs, cached = win_probabilities(request.args.get("board"))
+    if probs is None:
+        return jsonify({"ok": False, "error": "No x01 game in progress"}), 404
+    return jsonify({"ok": True, "probs": probs, "trials": WINPROB_TRIALS, "cached": cached,
+                    "ms": round((time.perf_counter() - t0) * 1000, 2)})
+
+@app.get("/standings")
+def standings_route():
+    t = STATE.tournament
+    offset = max(0, safe_int(request.args.get("offset"), 0))
+    limit = max(1, min(500, safe_int(request.args.get("limit"), 50)))
+    rows = standings(t)[offset:offset + limit]
+    js = STATE.names.json
+    return app.response_class(
+        '{"format":%s,"total":%d,"offset":%d,"rows":[%s]}'
+        % (js_str(t.format), len(t.table), offset,
+           ",".join([r.to_json(js, offset + k + 1, buchholz(t, r)) for k, r in enumerate(rows)])),
+        mimetype="application/json")
+
+@app.get("/leaderboard")
+def leaderboard_route():
+    d = STATE.data
+    if not isinstance(d, LeaderboardData) or d.ranked is None:
+        return jsonify({"ok": False, "error": "No FFA leaderboard game"}), 404
+    offset = max(0, safe_int(request.args.get("offset"), 0))
+    limit = max(1, min(500, safe_int(request.args.get("limit"), 50)))
+    js = STATE.names.json
+    rows = ['{"rank":%d,"player":%s,"points":%d}' % (offset + k + 1, js[pid], -neg)
+            for k, (neg, _, pid) in enumerate(d.ranked.window(offset, limit))]
+    # where one player stands, e.g. whoever is throwing, even off the visible page
+    me = "null"
+    name = request.args.get("player")
+    pid = STATE.names.ids.get(name) if name else None
+    if pid in d.order:
+        me = '{"rank":%d,"player":%s,"points":%d}' % (
+            d.ranked.rank((-d.points[pid], d.order[pid], pid)) + 1, js[pid], d.points[pid])
+    return app.response_class('{"total":%d,"offset":%d,"rows":[%s],"player":%s}'
+                              % (len(d.ranked), offset, ",".join(rows), me),
+                              mimetype="application/json")
+
+# Optimistic concurrency: an action may carry the state "version" its
+# controller last saw. Turn actions are refused if anything that could
+# change whose turn it is happened since; board actions only if that board
+# (or the championship around it) changed. Anything else just applies.
+TURN_ACTIONS = {a.name for a in ACTIONS.values() if a.scope == "turn"}
+BOARD_ACTIONS = {a.name for a in ACTIONS.values() if a.scope == "board"}
+
+def is_stale(payload):
+    state = current_state()
+    seen = payload.get("version")
+    if not isinstance(seen, int):
+        return False        # controllers that don't send versions get the old behaviour
+    t = payload.get("type")
+    if t in TURN_ACTIONS:
+        return seen < state.turn_version
+    if t in BOARD_ACTIONS:
+        b = get_board(payload.get("board", 0))
+        return seen < state.turn_version or (b is not None and seen < b.version)
+    return False
+
+def run_action(payload):
+    # a refused action leaves the version where it was: only applied ones are
+    # logged, so a room restored from the log has to end on the same version
+    state = current_state()
+    state.version += 1
+    resp = apply_action(payload)
+    if isinstance(resp, tuple):
+        state.version -= 1
+    else:
+        if payload.get("type") in BOARD_ACTIONS:
+            b = get_board(payload.get("board", 0))
+            if b is not None:
+                b.version = state.version
+        else:
+            state.turn_version = state.version
+    return resp
 
 @app.post("/action")
 def action():
     payload = request.get_json(force=True, silent=True) or {}
-    t = payload.get("type")
+    aid = payload.get("id")
+    aid = aid if isinstance(aid, str) and aid else None
+    room = CURRENT_ROOM.get()
+    with room.lock:
+        now = time.time()
+        seen = aid and room.ids.get(aid, now)
+        if seen:
+            resp = app.response_class(seen[0], status=seen[1], mimetype="application/json")
+            resp.headers["X-Action-Replayed"] = "1"
+        else:
+            if is_stale(payload):
+                resp = jsonify({"ok": False, "error": "Someone else moved first; refresh and try again",
+                                "version": STATE.version}), 409
+            else:
+                resp = run_action(payload)
+                if SESSION_LOG is not None and not isinstance(resp, tuple):
+                    SESSION_LOG.record(room, payload)
+            if aid:
+                r, status = resp if isinstance(resp, tuple) else (resp, resp.status_code)
+                room.ids.put(aid, r.get_data(), status, now)
+        (resp[0] if isinstance(resp, tuple) else resp).headers["X-State-Version"] = str(STATE.version)
+    return resp
+
+# Dart feeds: NDJSON, one event per line, normally a chunked body kept open
+# while the board is in play:
+#   {"board": 0, "segment": 20, "multiplier": 3}    a dart (segment 0: a miss, 25: bull)
+#   {"board": 0, "end": true}                       darts pulled before the third
+# Whatever has arrived when the stream is read is applied as one batch
+# under the room's lock; a turn still in progress carries over to the
+# next batch (and the next stream from that board).
+DARTS_READ = 65536
+DARTS_BAD_LINES = 20        # line numbers of rejected events echoed back
+
+def feed_darts(events):
+    # group (board, dart or None) events into turns and apply them; called with the room's lock held
+    state = current_state()
+    room = CURRENT_ROOM.get()
+    pending = room.pending
+    turns = dropped = 0
+    for board, dart in events:
+        darts = pending.setdefault(board, [])
+        if dart is not None:
+            darts.append(dart)
+            if len(darts) < 3 and not dart_turn_over(board, darts):
+                continue
+        del pending[board]
+        if not darts:
+            continue
+        if state.mode == "championship":
+            payload = {"type": "match_darts", "board": board, "darts": darts}
+        else:
+            payload = {"type": "darts", "darts": darts}
+        if isinstance(run_action(payload), tuple):
+            dropped += len(darts)       # no game for them (not started, already won, board idle ...)
+        else:
+            turns += 1
+            if SESSION_LOG is not None:
+                SESSION_LOG.record(room, payload)
+    return turns, dropped
+
+@app.post("/darts")
+def darts_stream():
+    rid = g.room_id
+    stream = request.stream
+    tail = b""
+    lineno = darts = turns = dropped = rejected = 0
+    bad = []
+    while True:
+        chunk = stream.read(DARTS_READ)
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop() if chunk else b""
+        events = []
+        for line in lines:
+            lineno += 1
+            if not line.strip():
+                continue
+            try:
+                e = json.loads(line)
+                board = e.get("board", 0)
+                if not isinstance(board, int) or board < 0:
+                    raise ValueError
+                if e.get("end"):
+                    events.append((board, None))
+                    continue
+                dart = (e.get("segment"), e.get("multiplier", 1))
+                if dart not in DART_TABLE:
+                    raise ValueError
+                events.append((board, dart))
+                darts += 1
+            except (ValueError, TypeError, AttributeError):
+                rejected += 1
+                if len(bad) < DARTS_BAD_LINES:
+                    bad.append(lineno)
+        if events:
+            with in_room(rid):
+                t, d = feed_darts(events)
+            turns += t
+            dropped += d
+        if not chunk:
+            break
+    return jsonify({"ok": True, "darts": darts, "turns": turns, "dropped": dropped,
+                    "rejected": rejected, "bad_lines": bad})
+
+# every route above also answers under /r/<room>/
+for rule in list(app.url_map.iter_rules()):
+    if rule.endpoint not in ("static", "asset"):
+        app.add_url_rule("/r/<room>" + rule.rule, "room_" + rule.endpoint,
+                         app.view_functions[rule.endpoint], methods=rule.methods)
+
+# no room lock for the whole request: pages and assets don't touch state,
+# /darts takes the lock per batch while its stream stays open
+STATELESS = {"display", "room_display", "control", "room_control", "asset", "darts_stream", "room_darts_stream"}
+
+@app.url_value_preprocessor
+def pick_room(endpoint, values):
+    rid = values.pop("room", "") if values else ""
+    if rid and not ROOM_RE.match(rid):
+        abort(404)
+    g.room_id = rid
+    if endpoint in STATELESS:
+        return
+    if request.method == "POST":
+        request.get_json(force=True, silent=True)   # read and parse the body before taking the lock
+    g.room = enter_room(rid)
 
-    if t == "reset":
-        reset_state()
-        return jsonify({"ok": True})
-
-    if t == "set_mode":
-        mode = payload.get("mode", "ffa")
-        if mode not in ["ffa", "teams", "championship"]:
-            return jsonify({"ok": False, "error": "Unknown mode"}), 400
-        STATE["mode"] = mode
-        STATE["started"] = False
-        STATE["game"] = None
-        STATE["data"] = {}
-        return jsonify({"ok": True})
-
-    if t == "set_players":
-        players = payload.get("players") or []
-        players = [p.strip() for p in players if isinstance(p, str) and p.strip()]
-        if not players:
-            players = ["Player 1", "Player 2"]
-        STATE["players"] = players
-        if STATE["started"] and STATE["mode"] == "ffa" and STATE["game"] in ["501","cricket","atc","leaderboard"]:
-            init_game(STATE["game"])
-        return jsonify({"ok": True})
-
-    if t == "set_teams":
-        A = payload.get("A") or []
-        B = payload.get("B") or []
-        A = [x.strip() for x in A if isinstance(x, str) and x.strip()]
-        B = [x.strip() for x in B if isinstance(x, str) and x.strip()]
-        if not A: A = [f"A{i+1}" for i in range(10)]
-        if not B: B = [f"B{i+1}" for i in range(10)]
-        STATE["teams"]["A"] = A
-        STATE["teams"]["B"] = B
-        STATE["teams"]["team_current"] = 0
-        STATE["teams"]["team_turn"] = "A"
-        if STATE["started"] and STATE["mode"] == "teams" and STATE["game"] in ["501","cricket","atc","leaderboard"]:
-            init_game(STATE["game"])
-        return jsonify({"ok": True})
-
-    if t == "set_tournament_players":
-        players = payload.get("players") or []
-        players = [p.strip() for p in players if isinstance(p, str) and p.strip()]
-        if len(players) < 2:
-            players = [f"P{i+1}" for i in range(8)]
-        STATE["tournament"] = {"players": players, "round": 1, "matches": [], "current_match": 0, "champion": None}
-        return jsonify({"ok": True})
-
-    if t == "set_match_start":
-        start = safe_int(payload.get("start"), 301)
-        start = max(101, min(501, start))
-        STATE["settings"]["match_start"] = start
-        return jsonify({"ok": True})
-
-    if t == "set_501_settings":
-        start = safe_int(payload.get("start"), 501)
-        start = max(101, min(1001, start))
-        doubleOut = bool(payload.get("doubleOut"))
-        STATE["settings"]["501_start"] = start
-        STATE["settings"]["501_double_out"] = doubleOut
-        if STATE["started"] and STATE["game"] == "501":
-            init_game("501")
-        return jsonify({"ok": True})
-
-    if t == "start_game":
-        game = payload.get("game")
-        if STATE["mode"] == "championship":
-            init_game("match")
-            return jsonify({"ok": True})
-
-        if game not in ["501", "cricket", "atc", "leaderboard"]:
-            return jsonify({"ok": False, "error": "Unknown game"}), 400
-        init_game(game)
-        return jsonify({"ok": True})
-
-    if t == "next":
-        if STATE["mode"] in ["ffa", "teams"]:
-            advance_turn()
-            return jsonify({"ok": True})
-        return jsonify({"ok": False, "error": "Not applicable"}), 400
-
-    if t == "next_match":
-        if STATE["mode"] == "championship":
-            advance_match()
-            return jsonify({"ok": True})
-        return jsonify({"ok": False, "error": "Not in championship mode"}), 400
-
-    # Scoring actions
-    if t == "501_add" and STATE["game"] == "501":
-        handle_501_add(payload.get("score", 0))
-        return jsonify({"ok": True})
-
-    if t == "cricket_hit" and STATE["game"] == "cricket":
-        cricket_hit(payload.get("number", "20"), payload.get("hits", 1))
-        return jsonify({"ok": True})
-
-    if t == "atc_hit" and STATE["game"] == "atc":
-        atc_hit(bool(payload.get("success")))
-        return jsonify({"ok": True})
-
-    if t == "lb_add" and STATE["game"] == "leaderboard":
-        leaderboard_add(payload.get("points", 0))
-        return jsonify({"ok": True})
-
-    if t == "match_add" and STATE["mode"] == "championship" and STATE["game"] == "match":
-        match_add(payload.get("score", 0))
-        # if match winner set, you can press "Next Match"
-        return jsonify({"ok": True})
-
-    return jsonify({"ok": False, "error": "Action not valid for current mode/game"}), 400
+@app.teardown_request
+def release_room(exc):
+    room = g.pop("room", None)
+    if room is not None:
+        room.lock.release()
+
+# ---------------------------
+# Sharded serving
+# PARTY_WORKERS > 0 starts that many worker processes on
+# the ports after PORT and a front router on PORT that reads the request,
+# picks the worker owning the room from the path and relays the bytes.
+# Every connection carries one request and gets routed afresh. Rooms
+# never move, so workers share nothing but the log database.
+# ---------------------------
+PARTY_WORKERS = int(os.environ.get("PARTY_WORKERS", "0"))
+PORT = int(os.environ.get("PORT", "5000"))
+ROOM_PATH_RE = re.compile(rb"[A-Z]+ /r/([^/?# ]+)")
+
+CONTENT_LENGTH_RE = re.compile(rb"\r\ncontent-length:\s*(\d+)", re.I)
+CONNECTION_RE = re.compile(rb"\r\nconnection:[^\r]*", re.I)
+CHUNKED_RE = re.compile(rb"\r\ntransfer-encoding:[^\r]*chunked", re.I)
+
+async def relay_chunked(reader, upstream):
+    # a streamed body (a /darts feed) is passed on chunk by chunk as it arrives
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        upstream.write(line)
+        size = int(line.split(b";")[0], 16)
+        if size == 0:
+            while line != b"\r\n":    # trailers, up to the blank line
+                line = await reader.readuntil(b"\r\n")
+                upstream.write(line)
+            return
+        upstream.write(await reader.readexactly(size + 2))
+        await upstream.drain()
+
+async def route_connection(reader, writer, ports):
+    upstream = None
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+        m = CONTENT_LENGTH_RE.search(head)
+        body = await reader.readexactly(int(m.group(1))) if m else b""
+        m = ROOM_PATH_RE.match(head)
+        port = ports[room_shard(m.group(1).decode("latin-1") if m else "", len(ports))]
+        up_reader, upstream = await asyncio.open_connection("127.0.0.1", port)
+        # one request per connection, so the worker (and the client) close after the response
+        upstream.write(CONNECTION_RE.sub(b"", head)[:-2] + b"Connection: close\r\n\r\n" + body)
+        if CHUNKED_RE.search(head):
+            await relay_chunked(reader, upstream)
+        upstream.write_eof()
+        while True:
+            data = await up_reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        pass
+    finally:
+        for w in (upstream, writer):
+            if w is not None:
+                w.close()
+
+async def serve_router(host, port, ports):
+    server = await asyncio.start_server(lambda r, w: route_connection(r, w, ports), host, port)
+    async with server:
+        await server.serve_forever()
+
+def serve_worker(shard, workers, port):
+    if PARTY_PERSIST:
+        open_session_log(restore=room_shard("", workers) == shard)
+    app.run(host="127.0.0.1", port=port, debug=False)
+
+def serve_sharded(workers, host="0.0.0.0", port=PORT):
+    ports = [port + 1 + shard for shard in range(workers)]
+    procs = [multiprocessing.Process(target=serve_worker, args=(shard, workers, p), daemon=True)
+             for shard, p in enumerate(ports)]
+    for proc in procs:
+        proc.start()
+    try:
+        asyncio.run(serve_router(host, port, ports))
+    finally:
+        for proc in procs:
+            proc.terminate()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    if PARTY_WORKERS > 0:
+        serve_sharded(PARTY_WORKERS)
+    else:
+        if PARTY_PERSIST:
+            open_session_log()
+        app.run(host="0.0.0.0", port=PORT, debug=False)
@@ -0,0 +1,112 @@
+"""Scoring latency while darts_hub backs itself up.
+
+Seeds a hub database with hub_seed, then plays 101 games through the test
+client flat out (/start_501_ffa, three /turn_501 posts and a /finish each)
+and reports /turn_501 and /finish latency for each phase (backup jobs are
+split into the copy and its integrity check):
+
+* idle: nothing else running, for idle_seconds;
+* backup: a "backup" job with the default BACKUP_PAGES and BACKUP_SLEEP;
+* one step: a backup job copying everything in one step, no pauses;
+* file copy: shutil.copyfile of the database file, the old way.
+
+Each backup phase lasts as long as its copy does, check included.
+
+    python hub_backup_bench.py [games] [idle_seconds] [seed]
+"""
+import os, shutil, statistics, sys, tempfile, threading, time
+
+import hub_seed
+
+ROUTES = ("turn_501", "finish")
+
+def play(c, running, lat):
+    # lat[route] gets (start, seconds) per request
+    games = 0
+    while running():
+        c.post("/start_501_ffa", data={"player_id": ["1", "2"], "start_points": "101"}).close()
+        for route, data in [("turn_501", {"turn_points": str(p)}) for p in (60, 60, 41)] + [("finish", None)]:
+            t0 = time.perf_counter()
+            c.post("/" + route, data=data).close()
+            lat[route].append((t0, time.perf_counter() - t0))
+        games += 1
+    return games
+
+def job_running(c, job_id):
+    return lambda: c.get(f"/jobs/{job_id}").json["status"] in ("queued", "running")
+
+def phase(c, name, start):
+    # one result row, or two when note() says where the copy ended and the check began
+    lat = {r: [] for r in ROUTES}
+    t0 = time.perf_counter()
+    running, note = start()
+    games = play(c, running, lat)
+    secs = time.perf_counter() - t0
+    text, split = note()
+    if split is None:
+        return [(name, secs, games, {r: [dt for _, dt in v] for r, v in lat.items()}, text)]
+    cut = t0 + split
+    return [(name + " copy", split, None, {r: [dt for t, dt in v if t < cut] for r, v in lat.items()}, ""),
+            (name + " check", secs - split, games, {r: [dt for t, dt in v if t >= cut] for r, v in lat.items()}, text)]
+
+def ms(values, q):
+    return sorted(values)[min(len(values) - 1, int(q * len(values)))] * 1000
+
+def main(argv):
+    games = int(argv[1]) if len(argv) > 1 else 200000
+    idle = float(argv[2]) if len(argv) > 2 else 10.0
+    seed = int(argv[3]) if len(argv) > 3 else 0
+    tmp = tempfile.mkdtemp(prefix="hub_backup_bench_")
+    os.environ["DB_PATH"] = os.path.join(tmp, "darts.db")
+    os.environ["BACKUP_DIR"] = os.path.join(tmp, "backups")
+    os.environ["BACKUP_EVERY"] = "0"            # only the backups this run asks for
+    os.environ["ADMIN_TOKEN"] = "bench"
+
+    import darts_hub as hub
+    hub_seed.generate(hub, games, seed, log=lambda line: print("  " + line))
+    c = hub.app.test_client()
+    c.environ_base["HTTP_X_ADMIN_TOKEN"] = hub.ADMIN_TOKEN
+    c.get("/jobs").close()                       # starts the job workers
+
+    def idle_phase():
+        until = time.perf_counter() + idle
+        return (lambda: time.perf_counter() < until), (lambda: ("", None))
+
+    def backup_phase(params):
+        def start():
+            job_id = c.post("/jobs", json={"kind": "backup", "params": params}).json["id"]
+            def note():
+                r = c.get(f"/jobs/{job_id}").json
+                if r["status"] != "done":
+                    return f"job {r['status']}: {r['error']}", None
+                res = r["result"]
+                return (f"{res['bytes'] / 1e6:.0f} MB copied in {res['copy_seconds']}s, "
+                        f"{res['total_seconds']}s with the check"), res["copy_seconds"]
+            return job_running(c, job_id), note
+        return start
+
+    def copy_phase():
+        t = threading.Thread(target=shutil.copyfile, args=(hub.APP_DB, os.path.join(tmp, "copy.db")))
+        t.start()
+        return t.is_alive, lambda: (f"{os.path.getsize(hub.APP_DB) / 1e6:.0f} MB file", None)
+
+    results = (phase(c, "idle", idle_phase)
+               + phase(c, "backup", backup_phase({}))
+               + phase(c, "one step", backup_phase({"pages": -1, "pause": 0}))
+               + phase(c, "file copy", copy_phase)
+               + phase(c, "idle again", idle_phase))
+
+    print(f"\n{'phase':<15} {'secs':>6} {'games':>6}  {'route':<9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>8}")
+    for name, secs, played, lat, note in results:
+        head = f"{name:<15} {secs:>6.1f} {'' if played is None else played:>6}"
+        for route in ROUTES:
+            v = lat[route] or [0.0]
+            print(f"{head:<29}  {route:<9} {statistics.median(v) * 1000:>7.2f} {ms(v, 0.95):>7.2f} "
+                  f"{ms(v, 0.99):>7.2f} {max(v) * 1000:>8.2f}")
+            head = ""
+        if note:
+            print(f"{'':<15} {note}")
+    shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,242 @@
+"""Query-plan check for every SQL statement darts_hub issues.
+
+Builds a large synthetic hub database with hub_seed, drives every page, form, stats
+endpoint and background job through the test client with statement
+tracing on, then runs EXPLAIN QUERY PLAN on each distinct statement and
+times it. Any statement that scans a table of LARGE rows or more (a plain
+table scan, a whole-index scan, or an automatic index SQLite builds because
+a real one is missing) fails the run, unless ALLOWED says why that one is
+meant to.
+
+    python hub_plans.py [games] [seed] [--keep]
+
+The database is built in a temporary directory (--keep leaves it there).
+Exits 1 when a statement scans a large table. PLANS_LARGE lowers LARGE for
+a quick run on a small database (the test suite runs 2,000 games).
+"""
+import os, re, sqlite3, statistics, sys, tempfile, threading, time
+
+import hub_seed
+
+LARGE = int(os.environ.get("PLANS_LARGE", "10000"))    # rows; scanning a table this big on a request is a bug
+REPEAT = 5              # timed runs per statement (median reported)
+
+# statements that read a whole large table on purpose
+ALLOWED = [
+    (r"^SELECT COUNT\(\*\) FROM (games|game_players)\b", "job progress total, once per job"),
+    (r"^(INSERT (OR REPLACE )?INTO (arch\.|archive_players\b)|SELECT (COUNT\(\*\)|id) FROM arch\.)",
+     "copies, counts or sums up a whole season as it's archived, once"),
+]
+
+# what a temp table holds by the time the statements on it run; otherwise a copy of the main table it rebuilds
+TEMP_FILL = {"rebuild_done": "SELECT id FROM games WHERE ended_at IS NOT NULL",
+             "rebuild_open": "SELECT id FROM games WHERE ended_at IS NULL"}
+
+SKIP = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "CREATE", "ANALYZE", "VACUUM", "ATTACH", "DETACH")
+KEYWORDS = {"WHERE", "JOIN", "LEFT", "ON", "GROUP", "ORDER", "LIMIT", "SET", "VALUES", "SELECT", "AS", "UNION", "USING"}
+
+# ---------------------------
+# Synthetic database
+# ---------------------------
+def build(hub, games, seed):
+    made = hub_seed.generate(hub, games, seed, log=lambda line: print("  " + line))
+    conn = sqlite3.connect(hub.APP_DB)
+    conn.execute("DELETE FROM hub_meta WHERE key='rollups'")     # the hub's first request queues the rollup build
+    conn.commit()
+    conn.close()
+    return made["players"], made["teams"]
+
+# ---------------------------
+# Tracing and driving the hub
+# ---------------------------
+SEEN = {}               # normalized statement -> (first sample, step that issued it)
+STEP = ["setup"]
+TRACE_LOCK = threading.Lock()
+
+def normalize(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\?(?:\s*,\s*\?)+\)", "(?)", sql)
+    return " ".join(sql.split())
+
+def record(sql):
+    key = normalize(sql)
+    with TRACE_LOCK:
+        if key not in SEEN:
+            SEEN[key] = (sql, STEP[0])
+
+def traced_connect(connect):
+    def wrapper(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(record)
+        return conn
+    return wrapper
+
+def wait_job(client, job_id):
+    while client.get(f"/jobs/{job_id}").json["status"] in ("queued", "running"):
+        time.sleep(0.02)
+
+def drive(hub, n_players, n_teams):
+    c = hub.app.test_client()
+    c.environ_base["HTTP_X_ADMIN_TOKEN"] = hub.ADMIN_TOKEN
+    pid, tid = n_players // 2, n_teams // 2
+
+    def step(name, method, path, **kw):
+        STEP[0] = name
+        r = getattr(c, method)(path, **kw)
+        r.close()
+        return r
+
+    # the first request starts the job workers, which build the rollups init_db queued
+    step("rollups", "get", "/jobs")
+    wait_job(c, 1)
+    for path in ("/", "/players", f"/player/{pid}", "/teams", f"/team/{tid}", "/history", "/control", "/display",
+                 "/leaderboard", "/leaderboard?season=2023", "/leaderboard?month=2024-02",
+                 "/stats/players?from=2022-03-17&to=2024-08-09", "/stats/teams?week=2023-W07",
+                 f"/stats/player/{pid}?bucket=week&from=2021-01-01", f"/stats/team/{tid}?bucket=month",
+                 "/cache/stats", "/jobs", "/admin/profile"):
+        step(path, "get", path)
+    step("players_add", "post", "/players/add", data={"name": "Newcomer"})
+    step("teams_add", "post", "/teams/add", data={"name": "New Team"})
+    step("team_members_save", "post", f"/team/{n_teams + 1}/members", data={"player_id": ["1", "2"]})
+    step("start_501_ffa", "post", "/start_501_ffa", data={"player_id": ["1", "2", "3"], "start_points": "101"})
+    step("turn_501", "post", "/turn_501", data={"turn_points": "60"})
+    step("next_turn", "post", "/next_turn")
+    step("turn_501", "post", "/turn_501", data={"turn_points": "101"})
+    step("finish", "post", "/finish")
+    step("start_501_teams", "post", "/start_501_teams", data={"team_a_id": "1", "team_b_id": "2", "start_points": "101"})
+    step("turn_501", "post", "/turn_501", data={"turn_points": "101"})
+    step("finish", "post", "/finish")
+    step("start_501_ffa", "post", "/start_501_ffa", data={"player_id": ["4", "5"], "start_points": "101"})
+    step("reset_active", "post", "/reset_active")
+    for kind in ("export_games", "db_maintenance"):
+        job_id = step(kind, "post", "/jobs", json={"kind": kind}).json["id"]
+        wait_job(c, job_id)
+        step(kind, "get", f"/jobs/{job_id}/download" if kind == "export_games" else f"/jobs/{job_id}")
+    job_id = step("jobs_cancel", "post", "/jobs", json={"kind": "db_maintenance", "priority": -1}).json["id"]
+    step("jobs_cancel", "post", f"/jobs/{job_id}/cancel")
+    # the first two seasons go to archive files; then the pages that read them
+    first = int(hub.q_one("SELECT MIN(started_at) AS m FROM games")["m"][:4])
+    job_id = step("archive_seasons", "post", "/jobs", json={"kind": "archive_seasons", "params": {"before": first + 2}}).json["id"]
+    wait_job(c, job_id)
+    gone = hub.q_one("""SELECT player_id FROM archive_players a
+                        WHERE NOT EXISTS (SELECT 1 FROM game_players gp WHERE gp.player_id = a.player_id)
+                        ORDER BY season DESC LIMIT 1""")
+    for path in ("/players", f"/player/{pid}", f"/player/{gone['player_id'] if gone else pid}",
+                 "/history", f"/history?season={first}", "/leaderboard?season=" + str(first)):
+        step(path, "get", path)
+    job_id = step("export_games", "post", "/jobs", json={"kind": "export_games"}).json["id"]
+    wait_job(c, job_id)
+    job_id = step("rebuild_rollups", "post", "/jobs", json={"kind": "rebuild_rollups"}).json["id"]
+    wait_job(c, job_id)
+    STEP[0] = "done"
+
+# ---------------------------
+# Plans and timings
+# ---------------------------
+def aliases(sql):
+    out = {}
+    for table, alias in re.findall(r"\b(?:FROM|JOIN|INTO|UPDATE)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.I):
+        if table.upper() in KEYWORDS:
+            continue        # "DO UPDATE SET games = ..." isn't a table
+        out[table] = table
+        if alias and alias.upper() not in KEYWORDS:
+            out[alias] = table
+    return out
+
+def analyze(hub, path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    sizes = {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+             for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")}
+    # statements on an archive ("arch.") are explained against the last one archived, read-write for the replays
+    last = conn.execute("SELECT file FROM archives ORDER BY season DESC LIMIT 1").fetchone()
+    if last:
+        conn.execute("ATTACH DATABASE ? AS arch", (os.path.join(hub.ARCHIVE_DIR, last[0]),))
+        for table in ("games", "game_players"):
+            sizes[table] = max(sizes[table], conn.execute(f"SELECT COUNT(*) FROM arch.{table}").fetchone()[0])
+    with TRACE_LOCK:
+        seen = list(SEEN.items())
+    # temp tables (the rollup rebuild's) are made again here and filled the way the job fills them
+    for key, (sql, step) in seen:
+        if re.match(r"CREATE TEMP ", key, re.I):
+            conn.execute(sql)
+    for (name,) in conn.execute("SELECT name FROM temp.sqlite_master WHERE type='table'").fetchall():
+        fill = TEMP_FILL.get(name) or f"SELECT * FROM main.{name.replace('rebuild_', '', 1)}"
+        conn.execute(f"INSERT INTO temp.{name} {fill}")
+        sizes[name] = conn.execute(f"SELECT COUNT(*) FROM temp.{name}").fetchone()[0]
+    results = []
+    for key, (sql, step) in seen:
+        if key.split(" ", 1)[0].upper() in SKIP or key.startswith("--"):
+            continue
+        try:
+            plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        except sqlite3.Error as e:
+            results.append((0.0, step, key, [f"could not explain: {e}"], []))
+            continue
+        names = aliases(sql)
+        scans = []
+        for line in plan:
+            m = re.match(r"SCAN (\w+)", line) or re.match(r"SEARCH (\w+) USING AUTOMATIC", line)
+            table = names.get(m.group(1)) if m else None
+            # walking an index in order is fine when a LIMIT stops it early
+            if " INDEX " in line and "AUTOMATIC" not in line and re.search(r"\bLIMIT \?$", key):
+                continue
+            if table in sizes and sizes[table] >= LARGE:
+                scans.append(f"{line} ({sizes[table]:,} rows)")
+        allowed = next((why for pattern, why in ALLOWED if re.search(pattern, key)), None)
+        times = []
+        for _ in range(REPEAT):
+            conn.execute("SAVEPOINT plan")
+            t0 = time.perf_counter()
+            try:
+                conn.execute(sql).fetchall()
+            except sqlite3.IntegrityError:
+                pass        # replaying an insert of a row that's there now; still a fair timing
+            times.append(time.perf_counter() - t0)
+            conn.execute("ROLLBACK TO plan")
+            conn.execute("RELEASE plan")
+        problems = [] if allowed else scans
+        results.append((statistics.median(times) * 1000, step, key, problems, scans if allowed else []))
+    conn.close()
+    return sizes, results
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith("--")]
+    games = int(args[0]) if len(args) > 0 else 200000
+    seed = int(args[1]) if len(args) > 1 else 0
+    tmp = tempfile.mkdtemp(prefix="hub_plans_")
+    os.environ["DB_PATH"] = os.path.join(tmp, "hub.db")
+    os.environ["JOB_DIR"] = os.path.join(tmp, "exports")
+    os.environ["PAGE_CACHE_BYTES"] = "0"            # every page renders, so every query runs
+    os.environ["ADMIN_TOKEN"] = "plans"
+
+    import darts_hub as hub
+    t0 = time.perf_counter()
+    n_players, n_teams = build(hub, games, seed)
+    print(f"built {games:,} games in {time.perf_counter() - t0:.1f}s: {hub.APP_DB}")
+    connect = sqlite3.connect
+    sqlite3.connect = traced_connect(connect)
+    drive(hub, n_players, n_teams)
+    sqlite3.connect = connect           # job workers keep polling; they're covered already
+    sizes, results = analyze(hub, hub.APP_DB)
+
+    print("tables: " + ", ".join(f"{k} {v:,}" for k, v in sorted(sizes.items(), key=lambda kv: -kv[1])))
+    print(f"{len(results)} statements\n")
+    print(f"{'ms':>8}  {'step':<28} statement")
+    failed = 0
+    for ms, step, key, problems, allowed in sorted(results, key=lambda r: -r[0]):
+        mark = "FAIL" if problems else "ok  "
+        print(f"{ms:>8.2f}  {step[:28]:<28} {mark} {key[:110]}")
+        for p in problems:
+            print(f"{'':>40}{p}")
+        for p in allowed:
+            print(f"{'':>40}allowed: {p}")
+        failed += bool(problems)
+    print(f"\n{failed} statement(s) scan a table of {LARGE:,}+ rows")
+    if "--keep" not in argv:
+        import shutil
+        shutil.rmtree(tmp)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main(sys.argv)
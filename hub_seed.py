@@ -0,0 +1,263 @@
+"""Synthetic darts_hub database generator.
+
+Fills players, teams, team_members, games and game_players with years of
+plausible pub-league history, seeded so the same arguments always build
+the same database:
+
+* every player has a skill (a three-dart average, most between 30 and 60),
+  a join date, maybe a date they stop turning up, and a keenness that
+  decides how often they play;
+* teams of three to five form over the years from players who are around,
+  nobody on more than two;
+* games happen on league nights (two or three evenings a week, quieter in
+  summer, busier before Christmas), back to back on as many boards as the
+  night needs, from about seven;
+* each side's darts are simulated from its average, so the better side
+  usually wins and everyone else is left on a believable score. A few
+  games are abandoned (no end, no scores), like a /reset_active.
+
+The hub has no turn-level tables, so nothing is written below
+game_players.
+
+    python hub_seed.py <db_path> [games] [seed] [--years=N] [--start=YYYY-MM-DD] [--players=N]
+
+The schema comes from darts_hub.init_db. Rows go in with executemany in a
+single transaction with syncing off, the secondary indexes are built after
+the load, and the stats rollups last.
+"""
+import bisect, datetime, gc, itertools, math, os, random, sqlite3, sys, time
+
+import numpy as np
+
+BATCH = 100000          # game_players rows generated before each insert
+FIRST = ["Alex", "Sam", "Chris", "Jo", "Pat", "Lee", "Robin", "Jamie", "Max", "Kim", "Dave", "Sue", "Gary",
+         "Tina", "Phil", "Mandy", "Steve", "Karen", "Mick", "Lisa", "Rob", "Nat", "Tony", "Bev", "Dan",
+         "Ellie", "Gaz", "Jen", "Kev", "Lou", "Mo", "Nick", "Olly", "Pete", "Raj", "Sian", "Tom", "Vic"]
+LAST = ["Smith", "Jones", "Taylor", "Brown", "Wilson", "Evans", "Thomas", "Roberts", "Walker", "Wright",
+        "Hughes", "Green", "Hall", "Wood", "Clarke", "Khan", "Patel", "Turner", "Hill", "Moore", "Price",
+        "Bennett", "Cooper", "Ward", "Morris", "King", "Baker", "Harris", "Lewis", "Young", "Allen", "Kelly"]
+NIGHTS = {1: 1.0, 3: 1.2, 4: 0.8}                       # weekday -> share of games (Tue, Thu, Fri)
+MONTHS = [1.0, 1.0, 1.1, 1.0, 0.9, 0.7, 0.5, 0.5, 0.9, 1.1, 1.2, 1.4]
+STARTS = [501] * 17 + [301, 301, 701]
+PLAYERS_PER_GAME = [2] * 5 + [3] * 3 + [4] * 2
+TEAM_GAMES = 0.25
+ABANDONED = 0.005
+
+# ---------------------------
+# People
+# ---------------------------
+def make_players(rng, n, days):
+    names, seen = [], set()
+    players = []        # [id, skill, joined, left, keenness]
+    for pid in range(1, n + 1):
+        name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+        k = 2
+        while name in seen:
+            name = f"{name.rsplit(' #', 1)[0]} #{k}"
+            k += 1
+        seen.add(name)
+        names.append(name)
+        skill = min(95.0, max(15.0, rng.lognormvariate(math.log(42), 0.28)))
+        joined = 0 if rng.random() < 0.3 else rng.randrange(days)
+        left = days if rng.random() < 0.4 else min(days, joined + int(rng.expovariate(1 / 700)) + 30)
+        players.append([pid, skill, joined, left, rng.lognormvariate(0, 0.8)])
+    return names, players
+
+def make_teams(rng, n, players, days):
+    teams = []          # [id, formed, members]
+    seats = {p[0]: 0 for p in players}
+    for tid in range(1, n + 1):
+        formed = rng.randrange(int(days * 0.8))
+        around = [p[0] for p in players if p[2] <= formed < p[3] and seats[p[0]] < 2]
+        if len(around) < 3:
+            around = [p[0] for p in players if seats[p[0]] < 2] or [p[0] for p in players]
+        members = rng.sample(around, min(len(around), rng.randint(3, 5)))
+        for pid in members:
+            seats[pid] += 1
+        teams.append([tid, formed, members])
+    return teams
+
+# ---------------------------
+# Games
+# ---------------------------
+def finish_turns(avg, start, z, u):
+    # turns to get down to a finish at this average, then turns to hit the double
+    setup = max(1, round((start - 40) / avg * (1.0 + 0.12 * z)))
+    return setup + int(math.log(1.0 - u) / math.log(0.9 - min(0.6, avg / 150))) + 1
+
+def league_nights(rng, first_day, days, games):
+    nights = []
+    for d in range(days):
+        day = first_day + datetime.timedelta(days=d)
+        share = NIGHTS.get(day.weekday())
+        if share:
+            nights.append((d, day, share * MONTHS[day.month - 1] * rng.uniform(0.6, 1.4)))
+    total = sum(w for _, _, w in nights)
+    out, carry, given = [], 0.0, 0
+    for d, day, w in nights:
+        carry += games * w / total
+        count = int(carry)
+        carry -= count
+        given += count
+        out.append([d, day, count])
+    out[-1][2] += games - given          # float rounding
+    return [n for n in out if n[2]]
+
+def night_games(rng, d, day, count, players, teams):
+    around = [p for p in players if p[2] <= d < p[3]] or players
+    cum = list(itertools.accumulate(p[4] for p in around))
+    sides = [t for t in teams if t[1] <= d]
+    skill = {p[0]: p[1] for p in players}
+    boards = max(1, math.ceil(count / 12))
+    evening = datetime.datetime(day.year, day.month, day.day, 19, 0)
+    # the night's random numbers in two draws; the loop below just takes the next one
+    u = iter(rng.random(count * 24 + 64).tolist()).__next__
+    z = iter(rng.standard_normal(count * 8 + 16).tolist()).__next__
+    pick = lambda seq: seq[int(u() * len(seq))]
+    played = []         # (started, ended seconds after 19:00, mode, team ids, winner, [(pid, side, left, won)])
+    for b in range(boards):
+        clock = int(u() * 1800)
+        for _ in range(count // boards + (b < count % boards)):
+            start = pick(STARTS)
+            a = bb = None
+            if len(sides) >= 2 and u() < TEAM_GAMES:
+                a, bb = pick(sides), pick(sides)
+            if a is not bb and a and set(a[2]).isdisjoint(bb[2]):      # nobody plays for both sides
+                entrants = [("A", a), ("B", bb)]
+                averages = [sum(skill[m] for m in t[2]) / len(t[2]) for _, t in entrants]
+            else:
+                chosen = []
+                want = min(len(around), pick(PLAYERS_PER_GAME))
+                while len(chosen) < want:
+                    p = around[bisect.bisect(cum, u() * cum[-1])]
+                    if p not in chosen:
+                        chosen.append(p)
+                entrants = [(None, p) for p in chosen]
+                averages = [p[1] for p in chosen]
+            turns = [finish_turns(avg, start, z(), u()) for avg in averages]
+            win = min(range(len(turns)), key=lambda i: (turns[i], i))      # ties: who threw first
+            abandoned = u() < ABANDONED
+            seats = []
+            for i, (side, who) in enumerate(entrants):
+                if abandoned:
+                    left = None
+                elif i == win:
+                    left = 0
+                else:
+                    left = int(start - averages[i] * turns[win] * (1.0 + 0.1 * z()))
+                    left = left if left >= 2 else 2 + int(u() * 39)     # was on a finish
+                for pid in (who[2] if side else [who[0]]):
+                    seats.append((pid, side, left, int(i == win and not abandoned)))
+            length = 60 + turns[win] * len(entrants) * (30 + int(u() * 16))
+            played.append((clock, None if abandoned else clock + length,
+                           "teams" if entrants[0][0] else "ffa",
+                           (entrants[0][1][0], entrants[1][1][0]) if entrants[0][0] else (None, None),
+                           None if abandoned else entrants[win], seats))
+            clock += length + 60 + int(u() * 240)
+    played.sort(key=lambda g: g[0])
+    stamp = lambda s: (evening + datetime.timedelta(seconds=s)).isoformat()
+    return [(stamp(start), stamp(end) if end is not None else None, mode, team_ids, winner, seats)
+            for start, end, mode, team_ids, winner, seats in played]
+
+# ---------------------------
+# Load
+# ---------------------------
+def generate(hub, games, seed=0, years=5, start="2021-01-01", players=None, log=print):
+    """Fill hub.APP_DB (empty, or not there yet) with `games` games; returns the row counts."""
+    rng = random.Random(seed)
+    first_day = datetime.date.fromisoformat(start)
+    days = int(years * 365.25)
+    n_players = players or max(20, games // 250)
+    n_teams = max(4, n_players // 8)
+
+    hub.init_db()
+    conn = sqlite3.connect(hub.APP_DB, isolation_level=None)
+    if conn.execute("SELECT (SELECT COUNT(*) FROM players) + (SELECT COUNT(*) FROM games)").fetchone()[0]:
+        raise SystemExit(f"{hub.APP_DB} already has players or games; seed a new file")
+    conn.execute("PRAGMA journal_mode=MEMORY").fetchone()
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-131072")
+    indexes = conn.execute("""SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL
+                              AND tbl_name IN ('games', 'game_players')""").fetchall()
+    for (name,) in indexes:
+        conn.execute(f"DROP INDEX {name}")          # init_db puts them back after the load
+
+    t0 = time.perf_counter()
+    names, people = make_players(rng, n_players, days)
+    squads = make_teams(rng, n_teams, people, days)
+    joined = lambda d: f"{first_day + datetime.timedelta(days=d)}T19:00:00"
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO players(id, name, created_at) VALUES(?,?,?)",
+                     [(p[0], names[p[0] - 1], joined(p[2])) for p in people])
+    conn.executemany("INSERT INTO teams(id, name, created_at) VALUES(?,?,?)",
+                     [(t[0], f"The {rng.choice(LAST)} {rng.choice(['Arrows', 'Flights', 'Doubles', 'Bulls', 'Oches'])} {t[0]}",
+                       joined(t[1])) for t in squads])
+    conn.executemany("INSERT INTO team_members(team_id, player_id) VALUES(?,?)",
+                     [(t[0], pid) for t in squads for pid in t[2]])
+
+    gid = 0
+    game_rows, seat_rows = [], []
+    counts = {"games": 0, "game_players": 0}
+    insert_time = 0.0
+
+    def flush():
+        nonlocal insert_time
+        t1 = time.perf_counter()
+        conn.executemany("""INSERT INTO games(id, game_type, mode, team_a_id, team_b_id, started_at, ended_at,
+                            winner_player_id, winner_team_id) VALUES(?, '501', ?, ?, ?, ?, ?, ?, ?)""", game_rows)
+        conn.executemany("INSERT INTO game_players(game_id, player_id, team_side, final_score, won) VALUES(?,?,?,?,?)",
+                         seat_rows)
+        insert_time += time.perf_counter() - t1
+        counts["games"] += len(game_rows)
+        counts["game_players"] += len(seat_rows)
+        game_rows.clear()
+        seat_rows.clear()
+
+    draws = np.random.default_rng(seed)
+    gc.disable()            # millions of row tuples and no cycles; collections only slow the load down
+    for d, day, count in league_nights(rng, first_day, days, games):
+        for started, ended, mode, (ta, tb), winner, seats in night_games(draws, d, day, count, people, squads):
+            gid += 1
+            wp = winner[1][0] if winner and not winner[0] else None
+            wt = winner[1][0] if winner and winner[0] else None
+            game_rows.append((gid, mode, ta, tb, started, ended, wp, wt))
+            seat_rows.extend((gid, pid, side, left, won) for pid, side, left, won in seats)
+        if len(seat_rows) >= BATCH:
+            flush()
+    flush()
+    gc.enable()
+    conn.execute("COMMIT")
+    load = time.perf_counter() - t0
+    rows = counts["games"] + counts["game_players"]
+    log(f"{counts['games']:,} games, {counts['game_players']:,} game_players, {n_players:,} players, "
+        f"{n_teams} teams: {load:.1f}s ({rows / load:,.0f} rows/s overall, "
+        f"{rows / max(insert_time, 1e-9):,.0f} rows/s in executemany)")
+
+    t0 = time.perf_counter()
+    conn.execute("PRAGMA journal_mode=WAL").fetchone()
+    conn.close()
+    hub.init_db()                                   # secondary indexes
+    log(f"indexes: {time.perf_counter() - t0:.1f}s")
+    t0 = time.perf_counter()
+    conn = hub.db()
+    hub.rollup_games(conn, "g.ended_at IS NOT NULL")
+    conn.execute("UPDATE hub_meta SET value = value + 1 WHERE key='data_version'")
+    conn.commit()
+    conn.close()
+    log(f"rollups: {time.perf_counter() - t0:.1f}s")
+    return {"players": n_players, "teams": n_teams, **counts}
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith("--")]
+    opts = dict(a[2:].split("=", 1) for a in argv[1:] if a.startswith("--") and "=" in a)
+    if not args:
+        print(__doc__)
+        sys.exit(2)
+    os.environ["DB_PATH"] = args[0]
+    import darts_hub as hub
+    generate(hub, int(args[1]) if len(args) > 1 else 100000, int(args[2]) if len(args) > 2 else 0,
+             years=float(opts.get("years", 5)), start=opts.get("start", "2021-01-01"),
+             players=int(opts["players"]) if "players" in opts else None)
+
+if __name__ == "__main__":
+    main(sys.argv)
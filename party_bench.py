@@ -0,0 +1,262 @@
+"""Headless throughput and fuzz harness for the darts_party rules engines.
+
+Drives handle_501_add, cricket_hit, atc_hit, leaderboard_add and match_add
+directly (no HTTP, no lock, no JSON) with random but valid actions for
+every mode, checks the game invariants as it goes and reports actions per
+second per engine. Games that finish are restarted; championships cycle
+through every bracket format.
+
+    python party_bench.py [actions_per_engine] [seed] [engine ...]
+
+engine is one of 501, cricket, atc, leaderboard (each run in ffa and teams)
+or match (championship). Exits 1 on the first broken invariant, naming the
+engine and seed so the run can be replayed.
+
+"dispatch" instead times 501_add through apply_action (the /action
+dispatcher, minus HTTP) against calling the engine directly, with the
+built-in games registered and again with EXTRA_GAMES more.
+"""
+import random, sys, time
+
+import darts_party as party
+
+CHECK_EVERY = 64            # actions between full invariant checks (not timed)
+FFA_PLAYERS = 4
+TEAM_SIZE = 3
+CHAMP_PLAYERS = 13          # uneven on purpose: byes in every format
+CHAMP_BOARDS = 3
+EXTRA_GAMES = 12            # stand-in games registered for the dispatch benchmark
+
+class Broken(Exception):
+    pass
+
+def expect(ok, what):
+    if not ok:
+        raise Broken(what)
+
+# ---------------------------
+# Setup and random actions
+# ---------------------------
+def start(mode, game, rng):
+    S = party.STATE
+    party.reset_state()
+    S.mode = mode
+    S.settings.double_out = rng.random() < 0.5
+    intern_all = S.names.intern_all
+    if mode == "ffa":
+        S.players = intern_all([f"P{i+1}" for i in range(FFA_PLAYERS)])
+    elif mode == "teams":
+        S.teams.A = intern_all([f"A{i+1}" for i in range(TEAM_SIZE)])
+        S.teams.B = intern_all([f"B{i+1}" for i in range(TEAM_SIZE - 1)])   # uneven rosters wrap
+    else:
+        S.settings.boards = CHAMP_BOARDS
+        S.settings.bracket = party.BRACKETS[rng.randrange(len(party.BRACKETS))]
+        S.settings.match_start = 101
+        S.tournament = party.Tournament(intern_all([f"P{i+1}" for i in range(CHAMP_PLAYERS)]))
+    party.init_game(game)
+
+def turn_score(rng):
+    # mostly a full turn, sometimes a low one so that games actually check out
+    return rng.randint(0, 180) if rng.random() < 0.7 else rng.randint(0, 40)
+
+def gen_501(rng):
+    return (turn_score(rng),)
+
+def gen_cricket(rng):
+    return (party.CRICKET_NUMS[rng.randrange(7)], rng.randint(0, 3))
+
+def gen_atc(rng):
+    return (rng.random() < 0.4,)
+
+def gen_leaderboard(rng):
+    return (rng.randint(0, 180),)
+
+def gen_match(rng):
+    return (turn_score(rng), rng.randrange(CHAMP_BOARDS))
+
+# ---------------------------
+# Invariants
+# ---------------------------
+def check_x01(d):
+    start = party.STATE.settings.x01_start
+    for k, v in d.scores.items():
+        expect(0 <= v <= start and v != 1, f"score {v} for {k}")
+    zeros = [k for k, v in d.scores.items() if v == 0]
+    expect(zeros == ([] if d.winner is None else [d.winner]), f"winner {d.winner}, zero scores {zeros}")
+
+def check_cricket(d):
+    for k, m in d.marks.items():
+        expect(all(0 <= x <= 3 for x in m), f"marks {m} for {k}")
+        expect(d.points[k] >= 0, f"points {d.points[k]} for {k}")
+    if d.winner is not None:
+        expect(min(d.marks[d.winner]) == 3, "winner has open numbers")
+        expect(d.points[d.winner] >= max(d.points.values()), "winner is behind on points")
+
+def check_atc(d):
+    for k, v in d.target.items():
+        expect(1 <= v <= 21, f"target {v} for {k}")
+    expect(d.winner is None or d.target[d.winner] == 21, "winner did not reach the bull")
+
+def check_leaderboard(d, added):
+    expect(sum(d.points.values()) == added, f"points {sum(d.points.values())} != added {added}")
+    expect(min(d.points.values()) >= 0, "negative points")
+    if d.ranked is not None:
+        want = sorted((-p, d.order[k], k) for k, p in d.points.items())
+        expect(d.ranked.window(0, len(want) + 1) == want, "ranked list out of order")
+        expect(all(d.ranked.rank(key) == i for i, key in enumerate(want)), "ranked list ranks wrong")
+
+def check_turn_order(actions):
+    S = party.STATE
+    if S.mode == "ffa":
+        expect(S.current == actions % len(S.players), f"current {S.current} after {actions} turns")
+    else:
+        turns = S.teams.team_current * 2 + (S.teams.team_turn == "B")
+        expect(turns == actions, f"teams at turn {turns} after {actions} turns")
+
+def check_bracket():
+    S = party.STATE
+    t = S.tournament
+    m_start = S.settings.match_start
+    for i, (name, lo, hi) in enumerate(t.stages):
+        open_ = sum(t.matches[j].winner is None for j in range(lo, hi))
+        expect(t.left[i] == open_, f"{name}: left {t.left[i]}, open {open_}")
+    for i, m in enumerate(t.matches):
+        if m.winner is not None:
+            expect(m.winner in (m.p1, m.p2, party.BYE), f"match {i} won by an outsider")
+    seated = []
+    for b in t.boards:
+        if b is None:
+            continue
+        m = t.matches[b.match]
+        seated += [m.p1, m.p2]
+        expect(b.data.winner == m.winner, f"board shows {b.data.winner}, match {m.winner}")
+        expect(b.data.turn in (m.p1, m.p2), "turn on a player outside the match")
+        for v in b.data.scores.values():
+            expect(0 <= v <= m_start and v != 1, f"board score {v}")
+    expect(len(seated) == len(set(seated)), "player on two boards")
+    expect(t.busy == set(seated), "busy set out of step with the boards")
+    if t.champion is not None:
+        expect(S.data.winner == t.champion, "champion not announced")
+        expect(not any(t.left), f"champion with matches left {t.left}")
+        expect(t.champion != party.BYE, "BYE won")
+
+# ---------------------------
+# Runs
+# ---------------------------
+def run_ffa(game, mode, engine, gen, check, n, rng):
+    S = party.STATE
+    args = [gen(rng) for _ in range(n)]
+    start(mode, game, rng)
+    done = games = turns = added = 0
+    elapsed = 0.0
+    while done < n:
+        batch = args[done:done + CHECK_EVERY]
+        t0 = time.perf_counter()
+        for k, a in enumerate(batch, 1):
+            engine(*a)
+            if S.data.winner is not None:
+                break
+        elapsed += time.perf_counter() - t0
+        if game == "leaderboard":
+            added += sum(a[0] for a in batch[:k])
+            check(S.data, added)
+        else:
+            check(S.data)
+        done += k
+        turns += k
+        check_turn_order(turns)
+        if S.data.winner is not None:
+            games += 1
+            turns = added = 0
+            start(mode, game, rng)
+    return elapsed, games
+
+def run_championship(n, rng):
+    S = party.STATE
+    args = [gen_match(rng) for _ in range(n)]
+    start("championship", "match", rng)
+    done = games = 0
+    elapsed = 0.0
+    while done < n:
+        batch = args[done:done + CHECK_EVERY]
+        t0 = time.perf_counter()
+        for score, b in batch:
+            board = S.tournament.boards[b]
+            if board is not None and board.data.winner is not None:
+                party.release_board(b)          # "Next Match" is part of the sequence
+            else:
+                party.match_add(score, b)
+        elapsed += time.perf_counter() - t0
+        check_bracket()
+        done += len(batch)
+        if S.tournament.champion is not None or not any(S.tournament.boards):
+            expect(S.tournament.champion is not None, "no boards in play and no champion")
+            games += 1
+            start("championship", "match", rng)
+    return elapsed, games
+
+def time_calls(call, items, rng):
+    S = party.STATE
+    start("ffa", "501", rng)
+    t0 = time.perf_counter()
+    for a in items:
+        call(a)
+        if S.data.winner is not None:
+            start("ffa", "501", rng)
+    return time.perf_counter() - t0
+
+def run_dispatch(n, seed):
+    rng = random.Random(seed)
+    scores = [turn_score(rng) for _ in range(n)]
+    payloads = [{"type": "501_add", "score": v} for v in scores]
+    print(f"{'games':>5} {'engine us':>10} {'/action us':>11} {'overhead us':>12}")
+    with party.app.test_request_context("/action", method="POST"):
+        party.enter_room("")
+        for extra in (0, EXTRA_GAMES):
+            for i in range(extra):
+                party.register_game(party.Engine(
+                    f"bench{i}", ("ffa", "teams"), party.GAMES["501"].make,
+                    [party.Action(f"bench{i}_add", party.handle_501_add, [("score", "int", 0)], scope="turn")]))
+            direct = time_calls(party.handle_501_add, scores, random.Random(seed))
+            routed = time_calls(party.apply_action, payloads, random.Random(seed))
+            print(f"{len(party.GAMES):>5} {direct / n * 1e6:>10.2f} {routed / n * 1e6:>11.2f} "
+                  f"{(routed - direct) / n * 1e6:>12.2f}")
+        t0 = time.perf_counter()
+        for _ in range(n):
+            party.action_ok()
+        print(f"of which building the {{\"ok\": true}} reply: {(time.perf_counter() - t0) / n * 1e6:.2f} us")
+
+ENGINES = {
+    "501": (party.handle_501_add, gen_501, check_x01),
+    "cricket": (party.cricket_hit, gen_cricket, check_cricket),
+    "atc": (party.atc_hit, gen_atc, check_atc),
+    "leaderboard": (party.leaderboard_add, gen_leaderboard, check_leaderboard),
+}
+
+def main(argv):
+    args = argv[1:]
+    n = int(args[0]) if len(args) > 0 else 200000
+    seed = int(args[1]) if len(args) > 1 else 0
+    engines = args[2:] or list(ENGINES) + ["match"]
+    if engines == ["dispatch"]:
+        run_dispatch(n, seed)
+        return
+    print(f"{n} actions per engine, seed {seed}")
+    print(f"{'engine':<12} {'mode':<13} {'games':>7} {'actions/s':>11} {'us/action':>10}")
+    for name in engines:
+        runs = [("championship", None)] if name == "match" else [("ffa", ENGINES[name]), ("teams", ENGINES[name])]
+        for mode, spec in runs:
+            rng = random.Random(f"{seed}:{name}:{mode}")
+            party.RNG.seed(seed)
+            try:
+                if spec is None:
+                    elapsed, games = run_championship(n, rng)
+                else:
+                    elapsed, games = run_ffa(name, mode, spec[0], spec[1], spec[2], n, rng)
+            except Broken as e:
+                print(f"{name} ({mode}), seed {seed}: invariant broken: {e}")
+                sys.exit(1)
+            print(f"{name:<12} {mode:<13} {games:>7} {n / elapsed:>11,.0f} {elapsed / n * 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,128 @@
+"""Parallel controller harness for darts_party.
+
+Starts the party app on a local port and lets several controller threads
+score the same game at once, the way a table of phones does: look at
+/state, think for a moment, send a turn. Afterwards every accepted turn is
+checked against the turn order the server actually applied.
+
+    python party_stress.py [controllers] [turns_each] [ffa|championship] [--no-versions]
+
+With versions (the default) no turn may be lost or land on the wrong
+player; --no-versions shows what happens without them.
+"""
+import http.client, json, logging, random, sys, threading, time
+
+from werkzeug.serving import make_server
+
+import darts_party as party
+
+def call(port, method, path, body=None):
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    c.request(method, path, body=json.dumps(body) if body is not None else None,
+              headers={"Content-Type": "application/json"} if body is not None else {})
+    r = c.getresponse()
+    out = json.loads(r.read() or b"null"), r.status, int(r.getheader("X-State-Version") or 0)
+    c.close()
+    return out
+
+def controller(port, turns, board, versions, seed, accepted, conflicts):
+    rng = random.Random(seed)
+    sent = 0
+    while sent < turns:
+        s, _, _ = call(port, "GET", "/state")
+        if s["mode"] == "championship":
+            b = s["tournament"]["boards"][board]
+            if b is None:
+                return
+            if b["m"]["winner"]:
+                call(port, "POST", "/action", {"type": "next_match", "board": board, "version": s["version"]})
+                continue
+            who = b["data"]["turn"]
+            action = {"type": "match_add", "score": 1, "board": board}
+        else:
+            who = s["players"][s["current"] % len(s["players"])]
+            action = {"type": "501_add", "score": 1}
+        if versions:
+            action["version"] = s["version"]
+        time.sleep(rng.random() * 0.004)    # reading the screen, tapping the button
+        _, status, version = call(port, "POST", "/action", action)
+        sent += 1
+        if status == 200:
+            accepted.append((version, board, who))
+        elif status == 409:
+            conflicts.append(version)
+
+def run(controllers, turns, mode, versions):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    party.reset_state()
+    server = make_server("127.0.0.1", 0, party.app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    if mode == "championship":
+        boards = max(1, controllers // 2)
+        call(port, "POST", "/action", {"type": "set_mode", "mode": "championship"})
+        call(port, "POST", "/action", {"type": "set_tournament_players",
+                                       "players": [f"P{i + 1}" for i in range(boards * 2)]})
+        call(port, "POST", "/action", {"type": "set_boards", "boards": boards})
+        call(port, "POST", "/action", {"type": "set_match_start", "start": 501})
+        call(port, "POST", "/action", {"type": "start_game", "game": "match"})
+        players = 2
+    else:
+        players = 3
+        call(port, "POST", "/action", {"type": "set_mode", "mode": "ffa"})
+        call(port, "POST", "/action", {"type": "set_players", "players": [f"P{i + 1}" for i in range(players)]})
+        call(port, "POST", "/action", {"type": "set_501_settings", "start": 1001, "doubleOut": False})
+        call(port, "POST", "/action", {"type": "start_game", "game": "501"})
+    start = party.STATE.version
+
+    accepted, conflicts = [], []
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=controller,
+                                args=(port, turns, i // 2 if mode == "championship" else 0, versions, i,
+                                      accepted, conflicts))
+               for i in range(controllers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    # whose turn each accepted action landed on, in the order it was applied
+    by_board = {}
+    for version, board, who in sorted(accepted):
+        by_board.setdefault(board, []).append(who)
+    if mode == "championship":
+        applied = sum(party.STATE.settings.match_start * 2 - sum(b.data.scores.values())
+                      for b in party.STATE.tournament.boards if b is not None)
+        names = party.STATE.names.names
+        expected = {}
+        for b, seq in by_board.items():
+            m = party.STATE.tournament.matches[party.STATE.tournament.boards[b].match]
+            expected[b] = [names[(m.p1, m.p2)[k % 2]] for k in range(len(seq))]
+    else:
+        applied = sum(1001 - v for v in party.STATE.data.scores.values())
+        names = [party.STATE.names.names[p] for p in party.STATE.players]
+        expected = {0: [names[k % players] for k in range(len(by_board.get(0, [])))]}
+    misdirected = sum(a != e for b, seq in by_board.items() for a, e in zip(seq, expected[b]))
+
+    print(f"{mode}, {controllers} controllers x {turns} turns, versions {'on' if versions else 'off'}")
+    print(f"  accepted {len(accepted)}  conflicts {len(conflicts)}  applied {applied}  "
+          f"lost {len(accepted) - applied}  wrong player {misdirected}")
+    print(f"  {(len(accepted) + len(conflicts)) / elapsed:.0f} actions/s, "
+          f"{party.STATE.version - start} versions")
+    return len(accepted) - applied, misdirected
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith("--")]
+    controllers = int(args[0]) if len(args) > 0 else 6
+    turns = int(args[1]) if len(args) > 1 else 50
+    mode = args[2] if len(args) > 2 else "ffa"
+    versions = "--no-versions" not in argv
+    lost, wrong = run(controllers, turns, mode, versions)
+    if versions and (lost or wrong):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
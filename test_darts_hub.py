@@ -0,0 +1,260 @@
+import datetime, os, re, shutil, sqlite3, subprocess, sys, tempfile, threading, time
+
+TMP = tempfile.mkdtemp(prefix="darts_hub_test_")
+os.environ["DB_PATH"] = os.path.join(TMP, "darts.db")
+os.environ["BACKUP_EVERY"] = "0"
+os.environ["ADMIN_TOKEN"] = "let-me-in"
+os.environ["JOB_WORKERS"] = "0"        # the tests claim and run jobs themselves
+
+import pytest
+
+import darts_hub as hub
+import hub_seed
+
+YEAR = datetime.date.today().year
+ADMIN = {"X-Admin-Token": "let-me-in"}
+
+@pytest.fixture(scope="module")
+def client():
+    # three seasons of games, the two closed ones archived
+    hub_seed.generate(hub, 600, seed=1, years=3, start=f"{YEAR - 2}-01-01", log=lambda line: None)
+    job = hub.run_job_here("archive_seasons", {"before": YEAR})
+    assert job["status"] == "done", job["error"]
+    yield hub.app.test_client()
+    shutil.rmtree(TMP, ignore_errors=True)
+
+def test_player_page_with_archived_seasons(client):
+    pid = hub.q_one("SELECT player_id FROM archive_players WHERE season=? LIMIT 1", (YEAR - 2,))["player_id"]
+    body = client.get(f"/player/{pid}").get_data(as_text=True)
+    assert f"Season {YEAR}<" in body
+    assert f"season={YEAR}\"" in body
+
+def test_not_found_is_never_not_modified(client):
+    pid = hub.q_one("SELECT MIN(id) AS id FROM players")["id"]
+    etag = client.get(f"/player/{pid}").headers["ETag"]
+    assert client.get(f"/player/{pid}", headers={"If-None-Match": etag}).status_code == 304
+    r = client.get("/player/999999", headers={"If-None-Match": etag})
+    assert r.status_code == 404
+    assert "ETag" not in r.headers
+
+def test_failed_save_keeps_the_game(client, monkeypatch):
+    client.post("/start_501_ffa", data={"player_id": ["1", "2"], "start_points": "101"})
+    client.post("/turn_501", data={"turn_points": "101"})
+    gid, winner = hub.STATE["active_game_id"], hub.STATE["winner"]
+
+    def broken(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(hub, "rollup_games", broken)
+    assert client.post("/finish").status_code == 500
+    client.get("/control")
+    assert hub.STATE["active_game_id"] == gid
+    assert hub.q_one("SELECT winner_player_id, ended_at FROM games WHERE id=?", (gid,))[:] == (None, None)
+
+    monkeypatch.undo()
+    client.post("/finish")
+    assert hub.STATE["active_game_id"] is None
+    assert hub.q_one("SELECT winner_player_id FROM games WHERE id=?", (gid,))[0] == winner
+
+def test_a_write_is_only_seen_once_it_commits(client):
+    before = hub.STATE
+    with hub.active_write() as (conn, st):
+        st["team_turn"] = "B"
+        other = threading.Thread(target=hub.ensure_active)    # another request coming in meanwhile
+        other.start()
+        other.join(0.2)
+        assert other.is_alive()
+        assert hub.STATE is before and before["team_turn"] != "B"
+    other.join(5)
+    assert hub.STATE is st
+
+def test_jobs_need_the_admin_token(client):
+    job = {"kind": "rebuild_rollups"}
+    assert client.post("/jobs", json=job).status_code == 401
+    assert client.post("/jobs", json=job, headers={"X-Admin-Token": "guess"}).status_code == 401
+    r = client.post("/jobs", json=job, headers={"Authorization": "Bearer let-me-in"})
+    assert r.status_code == 202
+    assert client.get(r.json["url"]).status_code == 401
+    assert client.get("/jobs").status_code == 401
+    assert client.get("/backups").status_code == 401
+    assert client.get("/cache/stats").status_code == 401
+    assert client.get("/cache/stats", headers={"X-Admin-Token": "let-me-in"}).status_code == 200
+    assert client.get(r.json["url"], headers={"X-Admin-Token": "let-me-in"}).json["kind"] == "rebuild_rollups"
+
+def test_a_stale_job_with_no_attempts_left_fails(client):
+    job_id = hub.exec_sql("""INSERT INTO jobs(kind, status, params, attempts, heartbeat, created_at)
+                             VALUES('export_games', 'running', '{}', ?, 0, ?)""", (hub.JOB_ATTEMPTS, hub.now_iso()))
+    hub.claim_job()
+    row = hub.q_one("SELECT status, error, finished_at FROM jobs WHERE id=?", (job_id,))
+    assert row["status"] == "failed" and row["error"] and row["finished_at"]
+
+def test_long_steps_keep_the_heartbeat_going(client, monkeypatch):
+    monkeypatch.setattr(hub, "JOB_BEAT", 0.05)
+    job_id = hub.exec_sql("""INSERT INTO jobs(kind, status, params, attempts, heartbeat, created_at)
+                             VALUES('db_maintenance', 'running', '{}', 1, ?, ?)""", (time.time(), hub.now_iso()))
+    sent = hub.q_one("SELECT heartbeat FROM jobs WHERE id=?", (job_id,))[0]
+    with hub.JobContext(job_id).beating():
+        time.sleep(0.3)
+    beat = hub.q_one("SELECT heartbeat FROM jobs WHERE id=?", (job_id,))[0]
+    hub.end_job(job_id, "done")
+    assert beat > sent + 0.1
+
+def test_profiling_needs_the_admin_token_and_restores_the_switch_interval(client):
+    admin = {"X-Admin-Token": "let-me-in"}
+    assert client.get("/admin/profile").status_code == 401
+    assert client.post("/admin/profile", json={"rate": 1}).status_code == 401
+    assert client.get("/admin/profile/players_page.collapsed").status_code == 401
+    switch = sys.getswitchinterval()
+    assert client.post("/admin/profile", json={"rate": 1, "mode": "sample"}, headers=admin).status_code == 200
+    for _ in range(20):
+        client.get("/players")
+    client.post("/admin/profile", json={"rate": 0}, headers=admin)
+    time.sleep(0.05)
+    assert sys.getswitchinterval() == switch
+    assert client.get("/admin/profile", headers=admin).json["routes"]["players_page"]["requests"] == 20
+
+def test_rebuild_rollups_matches_the_running_totals(client):
+    tables = [f"{kind}_{level}" for kind in ("player", "team") for level in ("daily", "monthly")]
+    before = {t: hub.q_all(f"SELECT * FROM {t} ORDER BY 1, 2") for t in tables}
+    job = hub.run_job_here("rebuild_rollups", {"chunk": 50})
+    assert job["status"] == "done", job["error"]
+    assert {t: hub.q_all(f"SELECT * FROM {t} ORDER BY 1, 2") for t in tables} == before
+
+def daily_totals(kind, lo, hi):
+    return {r[0]: (r[1], r[2]) for r in hub.q_all(
+        f"SELECT {kind}_id, SUM(games), SUM(wins) FROM {kind}_daily WHERE day BETWEEN ? AND ? GROUP BY 1", (lo, hi))}
+
+@pytest.mark.parametrize("query, lo, hi", [
+    ({"season": YEAR - 1}, f"{YEAR - 1}-01-01", f"{YEAR - 1}-12-31"),
+    ({"from": f"{YEAR - 2}-01-15", "to": f"{YEAR - 1}-03-10"}, f"{YEAR - 2}-01-15", f"{YEAR - 1}-03-10"),
+    ({"from": f"{YEAR - 1}-05-31", "to": f"{YEAR - 1}-06-01"}, f"{YEAR - 1}-05-31", f"{YEAR - 1}-06-01"),
+    ({"from": f"{YEAR - 1}-04-03", "to": f"{YEAR - 1}-04-20"}, f"{YEAR - 1}-04-03", f"{YEAR - 1}-04-20"),
+    ({"month": f"{YEAR - 1}-02"}, f"{YEAR - 1}-02-01", f"{YEAR - 1}-02-28" if (YEAR - 1) % 4 else f"{YEAR - 1}-02-29"),
+    ({"week": f"{YEAR - 1}-W10"}, datetime.date.fromisocalendar(YEAR - 1, 10, 1).isoformat(),
+     datetime.date.fromisocalendar(YEAR - 1, 10, 7).isoformat()),
+    ({"from": f"{YEAR - 1}-07-01"}, f"{YEAR - 1}-07-01", "2999-12-31"),
+])
+def test_stats_ranges_add_up_the_days_in_them(client, query, lo, hi):
+    # whole months come from the monthly rollup and the ends from the daily one
+    for kind in ("player", "team"):
+        r = client.get(f"/stats/{kind}s", query_string=query).json
+        assert (r["from"], r["to"]) == (lo, hi)
+        assert {x["id"]: (x["games"], x["wins"]) for x in r[kind + "s"]} == daily_totals(kind, lo, hi)
+
+def test_monthly_rollups_match_the_daily_ones(client):
+    for kind in ("player", "team"):
+        by_day = hub.q_all(f"SELECT substr(day, 1, 7), {kind}_id, SUM(games), SUM(wins) FROM {kind}_daily GROUP BY 1, 2")
+        assert [tuple(r) for r in by_day] == [tuple(r) for r in hub.q_all(f"SELECT * FROM {kind}_monthly ORDER BY 1, 2")]
+
+@pytest.mark.parametrize("query", [{"from": f"{YEAR}-03-01", "to": f"{YEAR}-02-01"}, {"month": "soon"},
+                                   {"week": f"{YEAR}-10"}, {"season": "next"}])
+def test_stats_refuse_ranges_they_cannot_read(client, query):
+    assert client.get("/stats/players", query_string=query).status_code == 400
+    assert client.get("/stats/player/1", query_string=query).status_code == 400
+
+def test_stats_series_buckets_a_season(client):
+    pid = hub.q_one("SELECT player_id FROM player_daily WHERE day LIKE ? GROUP BY 1 ORDER BY SUM(games) DESC",
+                    (f"{YEAR - 1}-%",))[0]
+    games, wins = daily_totals("player", f"{YEAR - 1}-01-01", f"{YEAR - 1}-12-31")[pid]
+    for bucket, label in (("day", r"\d{4}-\d\d-\d\d"), ("week", r"\d{4}-W\d\d"), ("month", r"\d{4}-\d\d"),
+                          ("season", str(YEAR - 1))):
+        series = client.get(f"/stats/player/{pid}?bucket={bucket}&season={YEAR - 1}").json["series"]
+        assert all(re.fullmatch(label, s["bucket"]) for s in series)
+        assert [s["bucket"] for s in series] == sorted(s["bucket"] for s in series)
+        assert (sum(s["games"] for s in series), sum(s["wins"] for s in series)) == (games, wins)
+    assert client.get(f"/stats/player/{pid}?bucket=hour").status_code == 400
+
+def test_archived_seasons_leave_the_live_tables(client):
+    archives = {r["season"]: r for r in hub.q_all("SELECT * FROM archives")}
+    assert sorted(archives) == [YEAR - 2, YEAR - 1]
+    assert hub.q_one("SELECT COUNT(*) FROM games WHERE started_at < ?", (f"{YEAR}-01-01",))[0] == 0
+    assert hub.q_one("SELECT value FROM hub_meta WHERE key='archived_before'")[0] == YEAR
+    for season, a in archives.items():
+        arch = sqlite3.connect(hub.archive_uri(a["file"]), uri=True)
+        assert arch.execute("SELECT COUNT(*), MIN(started_at) >= ?, MAX(started_at) < ? FROM games",
+                            (f"{season}-01-01", f"{season + 1}-01-01")).fetchone() == (a["games"], 1, 1)
+        assert arch.execute("SELECT COUNT(*) FROM game_players").fetchone()[0] == a["game_players"]
+        # the per-player totals kept for the season are the file's
+        seats = {r[0]: r[1:] for r in arch.execute("SELECT player_id, COUNT(*), SUM(won IS 1) FROM game_players GROUP BY 1")}
+        arch.close()
+        assert {r[0]: tuple(r[1:]) for r in hub.q_all(
+            "SELECT player_id, games, wins FROM archive_players WHERE season=?", (season,))} == seats
+    # nothing left to move, and a season still being played can't be
+    assert hub.run_job_here("archive_seasons", {"before": YEAR})["result"]["archived"] == []
+    job = hub.run_job_here("archive_seasons", {"before": YEAR + 1})
+    assert job["status"] == "failed" and "isn't over yet" in job["error"]
+
+def test_jobs_are_claimed_by_priority_then_age(client):
+    low = hub.submit_job("export_games", {}, priority=7)
+    first = hub.submit_job("export_games", {}, priority=9)
+    second = hub.submit_job("export_games", {}, priority=9)
+    try:
+        assert [hub.claim_job()["id"] for _ in range(3)] == [first, second, low]
+        row = hub.q_one("SELECT status, attempts, worker FROM jobs WHERE id=?", (first,))
+        assert (row["status"], row["attempts"]) == ("running", 1) and row["worker"]
+    finally:
+        for job_id in (low, first, second):
+            hub.end_job(job_id, "cancelled")
+
+def test_a_stale_job_goes_back_to_the_queue(client):
+    job_id = hub.exec_sql("""INSERT INTO jobs(kind, priority, status, params, attempts, heartbeat, created_at)
+                             VALUES('export_games', 99, 'running', '{}', 1, 0, ?)""", (hub.now_iso(),))
+    row = hub.claim_job()
+    hub.end_job(job_id, "cancelled")
+    assert row["id"] == job_id
+    assert hub.q_one("SELECT attempts FROM jobs WHERE id=?", (job_id,))[0] == 2
+
+def test_a_cancelled_job_is_never_claimed(client):
+    job_id = client.post("/jobs", json={"kind": "export_games", "priority": 50}, headers=ADMIN).json["id"]
+    assert client.post(f"/jobs/{job_id}/cancel", headers=ADMIN).json["status"] == "cancelled"
+    row = hub.claim_job()
+    if row is not None:
+        assert row["id"] != job_id
+        hub.end_job(row["id"], "cancelled")
+    assert client.post(f"/jobs/{job_id}/cancel", headers=ADMIN).json["status"] == "cancelled"
+
+def test_a_running_job_stops_at_its_next_progress_report(client, monkeypatch):
+    steps = []
+
+    def probe(ctx, fail=False):
+        if fail:
+            raise ValueError("no such table")
+        ctx.progress(0.25, "first step")
+        steps.append(client.post(f"/jobs/{ctx.id}/cancel", headers=ADMIN).json["status"])
+        ctx.progress(0.5, "second step")
+        steps.append("past the cancel")
+    monkeypatch.setitem(hub.JOB_KINDS, "probe", probe)
+    job = hub.run_job_here("probe", {})
+    assert job["status"] == "cancelled"
+    assert (job["progress"], job["message"]) == (0.5, "second step")
+    assert steps == ["running"]
+    job = hub.run_job_here("probe", {"fail": True})
+    assert (job["status"], job["error"]) == ("failed", "ValueError: no such table")
+
+def test_a_full_queue_refuses_new_jobs(client, monkeypatch):
+    queued = hub.q_one("SELECT COUNT(*) FROM jobs WHERE status='queued'")[0]
+    monkeypatch.setattr(hub, "JOB_QUEUE_MAX", queued + 1)
+    r = client.post("/jobs", json={"kind": "export_games"}, headers=ADMIN)
+    assert r.status_code == 202
+    assert client.post("/jobs", json={"kind": "export_games"}, headers=ADMIN).status_code == 429
+    client.post(r.json["url"] + "/cancel", headers=ADMIN)
+    assert client.post("/jobs", json={"kind": "nope"}, headers=ADMIN).status_code == 400
+
+def test_a_team_game_needs_two_separate_teams(client):
+    for name in ("Overlap A", "Overlap B"):
+        client.post("/teams/add", data={"name": name})
+        client.post("/teams/add", data={"name": name})     # a duplicate name mustn't leave the database locked
+    a, b = (hub.q_one("SELECT id FROM teams WHERE name=?", (name,))[0] for name in ("Overlap A", "Overlap B"))
+    client.post(f"/team/{a}/members", data={"player_id": ["1", "2"]})
+    client.post(f"/team/{b}/members", data={"player_id": ["2", "3"]})
+    games = hub.q_one("SELECT COUNT(*) FROM games")[0]
+    client.post("/start_501_teams", data={"team_a_id": a, "team_b_id": b, "start_points": "101"})
+    assert hub.q_one("SELECT COUNT(*) FROM games")[0] == games
+    assert hub.exec_sql("UPDATE hub_meta SET value=value WHERE key='archived_before'") is not None
+
+def test_no_request_scans_a_large_table():
+    # hub_plans on a small database, with "large" scaled down to match
+    env = {k: v for k, v in os.environ.items() if k not in ("DB_PATH", "JOB_WORKERS", "ADMIN_TOKEN")}
+    run = subprocess.run([sys.executable, "hub_plans.py", "2000", "0"], cwd=os.path.dirname(hub.__file__),
+                         env={**env, "PLANS_LARGE": "500"}, capture_output=True, text=True, timeout=300)
+    assert run.returncode == 0, run.stdout[-4000:] + run.stderr[-2000:]
+    assert "\n0 statement(s) scan a table of 500+ rows" in run.stdout
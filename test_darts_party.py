@@ -0,0 +1,278 @@
+import bisect, json, os, random, subprocess, sys, threading, time
+
+os.environ["PARTY_PERSIST"] = "0"
+
+import pytest
+
+import darts_party as party
+
+@pytest.fixture
+def client():
+    party.reset_state()
+    return party.app.test_client()
+
+def action(client, **payload):
+    return client.post("/action", json=payload)
+
+@pytest.mark.parametrize("sent, double_out", [(True, True), (False, False), ("true", True), ("false", False),
+                                              ("1", True), ("0", False), (1, True), (0, False)])
+def test_bool_fields(client, sent, double_out):
+    r = action(client, type="set_501_settings", start=501, doubleOut=sent)
+    assert r.status_code == 200
+    assert party.STATE.settings.double_out is double_out
+
+@pytest.mark.parametrize("sent", ["yes", "", 2, [], {}])
+def test_bool_fields_reject_anything_else(client, sent):
+    r = action(client, type="set_bracket", bracket="single", seeded=sent)
+    assert r.status_code == 400
+    assert r.json["error"] == "Invalid seeded"
+
+@pytest.mark.parametrize("sent, left", [(60, 441), ("60", 441), (60.5, 441), ("60.5", 441), (" 60 ", 441)])
+def test_int_fields_take_numeric_strings(client, sent, left):
+    action(client, type="set_players", players=["Ann", "Bob"])
+    action(client, type="start_game", game="501")
+    assert action(client, type="501_add", score=sent).status_code == 200
+    assert client.get("/state?fields=data.scores").json["data"]["scores"]["Ann"] == left
+
+@pytest.mark.parametrize("sent", ["sixty", "", "inf", "nan", "1e999", True, [60]])
+def test_int_fields_reject_anything_else(client, sent):
+    action(client, type="set_players", players=["Ann", "Bob"])
+    action(client, type="start_game", game="501")
+    r = action(client, type="501_add", score=sent)
+    assert r.status_code == 400
+    assert r.json["error"] == "Invalid score"
+
+def test_win_probabilities_are_the_same_in_every_process():
+    # a fresh interpreter has a different PYTHONHASHSEED, so anything seeded from hash() would differ
+    pytest.importorskip("numpy")
+    script = (
+        "import os, json\n"
+        "os.environ['PARTY_PERSIST'] = '0'\n"
+        "import darts_party as party\n"
+        "c = party.app.test_client()\n"
+        "for a in [{'type': 'set_players', 'players': ['Ann', 'Bob']}, {'type': 'start_game', 'game': '501'},\n"
+        "          {'type': '501_add', 'score': 100}, {'type': '501_add', 'score': 85}]:\n"
+        "    assert c.post('/action', json=a).status_code == 200, a\n"
+        "print(json.dumps(c.get('/winprob').json['probs'], sort_keys=True))\n")
+    runs = {subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(party.__file__),
+                           env={**os.environ, "PYTHONHASHSEED": str(seed)},
+                           capture_output=True, text=True, check=True).stdout for seed in (1, 2)}
+    assert len(runs) == 1
+
+def test_restored_room_keeps_its_version_and_still_refuses_stale_turns(client, tmp_path, monkeypatch):
+    log = party.SessionLog(str(tmp_path / "party.db"))
+    log.start()
+    monkeypatch.setattr(party, "SESSION_LOG", log)
+    post = lambda **payload: client.post("/r/restart/action", json=payload)
+    post(type="set_players", players=["Ann", "Bob"])
+    assert post(type="start_game", game="nope").status_code == 400
+    assert post(type="set_mode", mode="nope").status_code == 400
+    post(type="start_game", game="501")
+    seen = client.get("/r/restart/state").json["version"]
+    assert post(type="501_add", score=60, version=seen).status_code == 200
+    version = client.get("/r/restart/state").json["version"]
+    log.flush()
+
+    del party.ROOMS["restart"]      # as after a restart: the next request restores it from the log
+    assert client.get("/r/restart/state").json["version"] == version
+    r = post(type="501_add", score=60, version=seen)
+    assert r.status_code == 409
+    assert r.json["version"] == version
+
+def test_a_busy_room_does_not_hold_up_the_others(client):
+    inside, leave = threading.Event(), threading.Event()
+
+    def busy():
+        with party.in_room("busy"):
+            party.STATE.mode = "teams"
+            inside.set()
+            leave.wait(5)
+
+    t = threading.Thread(target=busy)
+    t.start()
+    inside.wait(5)
+    try:
+        t0 = time.perf_counter()
+        assert action(client, type="set_players", players=["Ann", "Bob"]).status_code == 200
+        assert client.get("/r/other/state").json["mode"] == "ffa"
+        assert time.perf_counter() - t0 < 1
+    finally:
+        leave.set()
+        t.join()
+    assert party.ROOMS["busy"].state.mode == "teams"
+    assert party.STATE.mode == "ffa"
+
+def test_state_fields(client):
+    action(client, type="set_players", players=["Ann", "Bob"])
+    action(client, type="start_game", game="501")
+    assert client.get("/state?fields=game,data.scores").json == {"game": "501", "data": {"scores": {"Ann": 501, "Bob": 501}}}
+    for fields in ("board.foo", "data.nope", "game.x", "data.scores.Ann.x", "data."):
+        r = client.get("/state", query_string={"fields": fields})
+        assert r.status_code == 400, fields
+        assert r.json["error"] == "Unknown field"
+
+def start_championship(client, players, boards=1, **bracket):
+    action(client, type="set_mode", mode="championship")
+    action(client, type="set_tournament_players", players=players)
+    action(client, type="set_bracket", **{"bracket": "single", **bracket})
+    action(client, type="set_boards", boards=boards)
+    action(client, type="set_match_start", start=101)
+    action(client, type="start_game", game="match")
+    return party.STATE.tournament
+
+def win(client, board=0):
+    # whoever is throwing checks out
+    return action(client, type="match_add", board=board, score=101)
+
+def test_dropped_matches_never_send_bye_through(client):
+    t = start_championship(client, ["Ann", "Bob", "Cid", "Dee"], boards=2)
+    # nobody is in the final yet to walk over a dropped semi-final
+    assert action(client, type="next_match", board=0).status_code == 400
+    assert win(client, board=1).status_code == 200
+    assert action(client, type="next_match", board=1).status_code == 200
+    assert action(client, type="next_match", board=0).status_code == 200
+    finalist = t.matches[1].winner
+    assert t.champion == finalist != party.BYE
+
+def test_the_final_cannot_be_dropped(client):
+    t = start_championship(client, ["Ann", "Bob"])
+    assert action(client, type="next_match", board=0).status_code == 400
+    assert t.boards[0] is not None and t.champion is None
+
+def test_bye_is_not_a_player_name(client):
+    for players in (["Ann", "BYE"], [" BYE "]):
+        r = action(client, type="set_tournament_players", players=players)
+        assert r.status_code == 400
+        assert r.json["error"] == "Invalid players"
+
+@pytest.mark.parametrize("cached", ['{"version": 1, "keep": 10}', '{"version": 1, "keep": 10, "straight": [], "double": {}}',
+                                    '[1, 2]', '{"version": 1', ''])
+def test_a_broken_checkout_cache_is_rebuilt(tmp_path, monkeypatch, cached):
+    path = tmp_path / "checkouts.json"
+    path.write_text(cached)
+    monkeypatch.setattr(party, "CHECKOUT_CACHE", str(path))
+    assert party.load_checkouts() == party.CHECKOUTS
+    with open(path) as f:
+        assert json.load(f) == party.CHECKOUTS
+    assert [p.name for p in tmp_path.iterdir()] == ["checkouts.json"]
+
+def play_out(client, t):
+    # win every match as it reaches a board until the championship is decided
+    for _ in range(200):
+        if t.champion is not None:
+            return
+        for b, board in enumerate(t.boards):
+            if board is not None:
+                win(client, b)
+                assert action(client, type="next_match", board=b).status_code == 200
+    raise AssertionError("championship never finished")
+
+def test_seed_order_keeps_the_top_seeds_apart():
+    assert party.seed_order(2) == [0, 1]
+    assert party.seed_order(8) == [0, 7, 3, 4, 1, 6, 2, 5]
+    order = party.seed_order(16)
+    assert sorted(order) == list(range(16))
+    assert all(a + b == 15 for a, b in zip(order[::2], order[1::2]))
+    assert order.index(1) >= 8 > order.index(0)
+
+def test_byes_go_to_the_top_seeds(client):
+    names = ["Ann", "Bob", "Cid", "Dee", "Eve"]
+    t = start_championship(client, names, boards=2, seeded=True)
+    ids = party.STATE.names.ids
+    first = [t.matches[i] for i in range(*t.stages[0][1:])]
+    assert [(m.p1, m.p2) for m in first] == [(ids["Ann"], party.BYE), (ids["Dee"], ids["Eve"]),
+                                             (ids["Bob"], party.BYE), (ids["Cid"], party.BYE)]
+    assert [m.winner for m in first] == [ids["Ann"], None, ids["Bob"], ids["Cid"]]
+    # Bob and Cid's semi-final is ready at once, beside the only first-round match
+    playing = {(t.matches[b.match].p1, t.matches[b.match].p2) for b in t.boards}
+    assert playing == {(ids["Dee"], ids["Eve"]), (ids["Bob"], ids["Cid"])}
+    play_out(client, t)
+    assert t.champion == ids["Ann"]
+
+def test_double_elimination_with_byes_plays_out(client):
+    t = start_championship(client, ["Ann", "Bob", "Cid", "Dee", "Eve"], boards=2, bracket="double", seeded=True)
+    play_out(client, t)
+    assert all(m.winner is not None for m in t.matches)
+    assert t.champion == party.STATE.names.ids["Ann"]
+
+def test_swiss_rounds_have_no_rematches(client):
+    names = ["Ann", "Bob", "Cid", "Dee", "Eve", "Fay", "Gus"]
+    t = start_championship(client, names, boards=3, bracket="swiss", rounds=4, seeded=True)
+    play_out(client, t)
+    assert len(t.stages) == 4
+    met, byes = set(), []
+    for _, lo, hi in t.stages:
+        seen = []
+        for m in t.matches[lo:hi]:
+            if m.p2 == party.BYE:
+                byes.append(m.p1)
+            else:
+                pair = frozenset((m.p1, m.p2))
+                assert pair not in met
+                met.add(pair)
+            seen += [m.p1, m.p2]
+        assert sorted(seen) == sorted([party.BYE, *t.table])
+    assert len(set(byes)) == 4
+    top = party.standings(t)[0]
+    assert t.champion == top.pid and top.points == max(r.points for r in t.table.values())
+
+def test_ranked_list_agrees_with_a_sorted_list():
+    ranked, keys, rng = party.RankedList(), [], random.Random(5)
+    for _ in range(2000):
+        if keys and rng.random() < 0.4:
+            key = keys.pop(rng.randrange(len(keys)))
+            ranked.remove(key)
+        else:
+            key = (rng.randrange(-50, 0), rng.random())
+            ranked.insert(key)
+            bisect.insort(keys, key)
+        assert len(ranked) == len(keys)
+    assert ranked.window(0, len(keys) + 1) == keys
+    for k in rng.sample(keys, 50):
+        assert ranked.rank(k) == keys.index(k)
+    assert ranked.window(100, 7) == keys[100:107]
+    assert ranked.window(len(keys), 5) == []
+    with pytest.raises(KeyError):
+        ranked.remove((1, 0.5))
+
+def test_leaderboard_pages_and_finds_a_player(client):
+    names = [f"P{i}" for i in range(30)]
+    action(client, type="set_players", players=names)
+    action(client, type="start_game", game="leaderboard")
+    for i in range(30):
+        assert action(client, type="lb_add", points=(i * 7) % 30).status_code == 200
+    expected = sorted(names, key=lambda n: (-(int(n[1:]) * 7 % 30), int(n[1:])))
+    lb = client.get("/leaderboard?offset=5&limit=10&player=P3").json
+    assert lb["total"] == 30
+    assert [r["player"] for r in lb["rows"]] == expected[5:15]
+    assert [r["rank"] for r in lb["rows"]] == list(range(6, 16))
+    assert lb["player"] == {"rank": expected.index("P3") + 1, "player": "P3", "points": 21}
+    assert client.get("/leaderboard?player=nobody").json["player"] is None
+
+def test_a_repeated_action_id_is_answered_not_applied(client):
+    action(client, type="set_players", players=["Ann", "Bob"])
+    action(client, type="start_game", game="501")
+    first = action(client, type="501_add", score=60, id="tap-1")
+    again = action(client, type="501_add", score=60, id="tap-1")
+    assert "X-Action-Replayed" not in first.headers
+    assert again.headers["X-Action-Replayed"] == "1"
+    assert again.get_data() == first.get_data()
+    assert party.STATE.data.scores == {party.STATE.names.ids["Ann"]: 441, party.STATE.names.ids["Bob"]: 501}
+    # a refusal is remembered too; another id is a new action
+    bad = action(client, type="501_add", score="lots", id="tap-2")
+    assert action(client, type="501_add", score=60, id="tap-2").status_code == bad.status_code == 400
+    assert action(client, type="501_add", score=60, id="tap-3").status_code == 200
+    assert client.get("/state?fields=data.scores").json["data"]["scores"] == {"Ann": 441, "Bob": 441}
+
+def test_state_views_are_projections_of_the_full_state(client):
+    start_championship(client, ["Ann", "Bob", "Cid"], boards=2)
+    full = client.get("/state").json
+    control = client.get("/state?view=control").json
+    assert set(control) == {"mode", "game", "started", "version", "turn_label", "tournament"}
+    assert control["tournament"] == {"champion": full["tournament"]["champion"], "boards": full["tournament"]["boards"]}
+    assert control["turn_label"] == full["turn_label"]
+    # a whole field beats a path inside it, whichever comes first
+    assert client.get("/state?fields=tournament.champion,tournament").json == {"tournament": full["tournament"]}
+    assert client.get("/state?view=nope").status_code == 400
+    win(client)
+    assert client.get("/state?view=control").json["version"] == control["version"] + 1